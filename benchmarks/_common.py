@@ -0,0 +1,57 @@
+"""Helpers shared by the benchmarks."""
+
+import os
+import sys
+import time
+import random
+import contextlib
+
+from monkeys.typing import Registry, params, rtype, constant
+from monkeys.trees import make_input
+
+
+XS = range(-5, 6)
+
+
+def make_registry(latency=0):
+    """
+    Return registry of integer arithmetic over the input bench_x, and a
+    scoring function for fitting x ** 3 + x ** 2 + x over XS, optionally
+    sleeping for up to the given latency in seconds before scoring.
+    """
+    registry = Registry()
+    with registry:
+        make_input('BenchInt', name='bench_x')
+        constant('BenchInt', 1)
+
+        @params('BenchInt', 'BenchInt')
+        @rtype('BenchInt')
+        def add(a, b):
+            return a + b
+
+        @params('BenchInt', 'BenchInt')
+        @rtype('BenchInt')
+        def mul(a, b):
+            return a * b
+
+        @params('BenchInt')
+        def score(tree):
+            if latency:
+                time.sleep(random.uniform(0, latency))
+            try:
+                return -sum(abs(tree(bench_x=x) - (x ** 3 + x ** 2 + x)) for x in XS)
+            except Exception:
+                return -sys.maxsize
+
+    return registry, score
+
+
+@contextlib.contextmanager
+def quiet():
+    """Discard anything printed within the block."""
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        yield
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
@@ -0,0 +1,127 @@
+"""
+Compare fitness evaluations needed by random search, optimize and 
+ant_optimize to reach a target score on a small symbolic regression
+problem.
+
+Run from the repository root with
+``PYTHONPATH=. python benchmarks/bench_ant_optimize.py``.
+"""
+
+from __future__ import print_function
+
+import sys
+import random
+
+from monkeys.typing import params, rtype
+from monkeys.trees import make_input, build_tree
+from monkeys.search import optimize, ant_optimize, minimize
+
+from _common import quiet
+
+
+SEEDS = range(5)
+TARGET_SCORE = 0
+POPULATION_SIZE = 100
+ITERATIONS = 50
+
+
+x = make_input('BenchInt', name='x')
+
+
+@params()
+@rtype('BenchInt')
+def one():
+    return 1
+
+
+@params('BenchInt', 'BenchInt')
+@rtype('BenchInt')
+def add(a, b):
+    return a + b
+
+
+@params('BenchInt', 'BenchInt')
+@rtype('BenchInt')
+def sub(a, b):
+    return a - b
+
+
+@params('BenchInt', 'BenchInt')
+@rtype('BenchInt')
+def mul(a, b):
+    return a * b
+
+
+@params('BenchInt')
+@minimize
+def score(tree):
+    try:
+        return sum(
+            abs(tree(x=value) - (value ** 5 - 2 * value ** 3 + value))
+            for value in
+            range(10)
+        )
+    except RuntimeError:
+        return sys.maxsize
+
+
+def evaluations_to_target(optimizer):
+    """
+    Return the evaluations taken to reach the target, or None, and the
+    error of the best tree found.
+    """
+    calls = []
+
+    def counted_score(tree):
+        calls.append(None)
+        return score(tree)
+    counted_score.__dict__.update(score.__dict__)
+
+    with quiet():
+        best = optimizer(
+            counted_score,
+            population_size=POPULATION_SIZE,
+            iterations=ITERATIONS,
+            show_scores=False,
+            target_score=TARGET_SCORE,
+        )
+    if score(best) < TARGET_SCORE:
+        return None, -score(best)
+    return len(calls), -score(best)
+
+
+def random_search(scoring_function, population_size, iterations, show_scores, target_score):
+    """Return best of randomly built trees, stopping at the target score."""
+    best_tree, best_score = None, None
+    for __ in range(population_size * iterations):
+        tree = build_tree('BenchInt')
+        tree_score = scoring_function(tree)
+        if best_tree is None or tree_score > best_score:
+            best_tree, best_score = tree, tree_score
+        if best_score >= target_score:
+            break
+    return best_tree
+
+
+def main():
+    for name, optimizer in (
+            ('random', random_search),
+            ('optimize', optimize), 
+            ('ant_optimize', ant_optimize),
+        ):
+        results = []
+        for seed in SEEDS:
+            random.seed(seed)
+            results.append(evaluations_to_target(optimizer))
+        reached = [calls for calls, __ in results if calls is not None]
+        print('{:<14}reached target {}/{}\tmean evaluations: {}\tmean error: {:.0f}'.format(
+            name,
+            len(reached),
+            len(results),
+            sum(reached) // len(reached) if reached else '-',
+            sum(error for __, error in results) / float(len(results)),
+        ))
+
+
+if __name__ == '__main__':
+    main()
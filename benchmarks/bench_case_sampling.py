@@ -0,0 +1,122 @@
+"""
+Compare the cases scored, time taken and final error over every case in
+fitting a polynomial to a large set of fitness cases, scoring each tree
+on every case or on samples of the cases.
+
+Run from the repository root with
+``PYTHONPATH=. python benchmarks/bench_case_sampling.py``.
+"""
+
+from __future__ import print_function
+
+import time
+import random
+
+from monkeys.typing import Registry, params, rtype, constant
+from monkeys.trees import make_input
+from monkeys.search import optimize
+from monkeys.evaluation import Sampling, evaluate_cases, sample_cases
+
+from _common import quiet
+
+
+SEEDS = range(3)
+NUM_CASES = 2000
+SAMPLE_SIZE = 50
+POPULATION_SIZE = 100
+ITERATIONS = 20
+
+
+def target(x):
+    return x ** 3 + x ** 2 + x
+
+
+def make_registry(make_score):
+    registry = Registry()
+    with registry:
+        make_input('BenchFloat', name='bench_x')
+        constant('BenchFloat', 1.0)
+
+        @params('BenchFloat', 'BenchFloat')
+        @rtype('BenchFloat')
+        def add(a, b):
+            return a + b
+
+        @params('BenchFloat', 'BenchFloat')
+        @rtype('BenchFloat')
+        def sub(a, b):
+            return a - b
+
+        @params('BenchFloat', 'BenchFloat')
+        @rtype('BenchFloat')
+        def mul(a, b):
+            return a * b
+
+        score = params('BenchFloat')(make_score())
+
+    return registry, score
+
+
+def full_evaluation(cases, rng):
+    @evaluate_cases(cases)
+    def score(outputs):
+        cases_scored[0] += len(outputs)
+        return -sum(
+            abs(output - case['y']) 
+            for output, case in 
+            zip(outputs, cases)
+        ) / len(outputs)
+    cases_scored = [0]
+    score.cases_scored = cases_scored
+    return score
+
+
+def sampled_evaluation(sampling):
+    def make(cases, rng):
+        @sample_cases(cases, SAMPLE_SIZE, sampling=sampling, rng=rng)
+        def score(output, case):
+            return -abs(output - case['y'])
+        return score
+    return make
+
+
+def main():
+    data_rng = random.Random(0)
+    cases = []
+    for __ in range(NUM_CASES):
+        x = data_rng.uniform(-2, 2)
+        cases.append({'bench_x': x, 'y': target(x)})
+
+    for name, make_score in (
+            ('every case', full_evaluation),
+            ('random', sampled_evaluation(Sampling.RANDOM)),
+            ('interleaved', sampled_evaluation(Sampling.INTERLEAVED)),
+            ('progressive', sampled_evaluation(Sampling.PROGRESSIVE)),
+        ):
+        cases_scored, elapsed, errors = [], [], []
+        for seed in SEEDS:
+            rng = random.Random(seed)
+            registry, score = make_registry(lambda: make_score(cases, rng))
+            with registry:
+                start = time.time()
+                with quiet():
+                    best = optimize(
+                        score, population_size=POPULATION_SIZE, iterations=ITERATIONS, 
+                        max_depth=8, rng=rng,
+                    )
+                elapsed.append(time.time() - start)
+                sampler = getattr(score, 'sampler', None)
+                cases_scored.append(
+                    score.cases_scored[0] if sampler is None else sampler.cases_scored
+                )
+                errors.append(sum(abs(best(bench_x=case['bench_x']) - case['y']) for case in cases) / len(cases))
+        print('{:<12} mean cases scored {:.0f}; mean time {:.1f}s; mean final error {:.3f}'.format(
+            name,
+            sum(cases_scored) / float(len(cases_scored)),
+            sum(elapsed) / len(elapsed),
+            sum(errors) / len(errors),
+        ))
+
+
+if __name__ == '__main__':
+    main()
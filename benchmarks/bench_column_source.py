@@ -0,0 +1,97 @@
+"""
+Compare the peak memory allocated and time taken in scoring trees over
+a large file of fitness cases, read into memory or streamed in chunks
+from a memory-mapped file, for varying numbers of cases.
+
+Run from the repository root with
+``PYTHONPATH=. python benchmarks/bench_column_source.py``.
+"""
+
+from __future__ import print_function
+
+import os
+import time
+import random
+import tempfile
+import tracemalloc
+
+import numpy
+
+from monkeys.typing import Registry, params, rtype, constant
+from monkeys.trees import make_input, build_tree
+from monkeys.evaluation import ColumnSource, stream_cases
+
+
+NUM_CASES = (10 ** 5, 10 ** 6, 4 * 10 ** 6)
+NUM_TREES = 20
+
+
+def make_registry():
+    registry = Registry()
+    with registry:
+        make_input('BenchArray', name='bench_x')
+        constant('BenchArray', 1.0)
+
+        @params('BenchArray', 'BenchArray')
+        @rtype('BenchArray')
+        def add(a, b):
+            return a + b
+
+        @params('BenchArray', 'BenchArray')
+        @rtype('BenchArray')
+        def mul(a, b):
+            return a * b
+
+    return registry
+
+
+def score_outputs(outputs, chunk):
+    return -numpy.abs(outputs - chunk[:, 1]).sum()
+
+
+def in_memory(path, trees):
+    data = numpy.load(path)
+    return [
+        score_outputs(numpy.broadcast_to(tree(bench_x=data[:, 0]), (len(data),)), data) 
+        for tree in trees
+    ]
+
+
+def streamed(path, trees):
+    score = stream_cases(ColumnSource(path, {'bench_x': 0}))(score_outputs)
+    return [score(tree) for tree in trees]
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.time()
+    result = fn(*args)
+    elapsed = time.time() - start
+    __, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    registry = make_registry()
+    rng = random.Random(0)
+    with registry:
+        trees = [build_tree('BenchArray', max_depth=6, rng=rng) for __ in range(NUM_TREES)]
+        directory = tempfile.mkdtemp()
+        for num_cases in NUM_CASES:
+            path = os.path.join(directory, 'cases.npy')
+            xs = numpy.random.default_rng(0).uniform(-1, 1, num_cases)
+            numpy.save(path, numpy.column_stack([xs, xs ** 3 + xs ** 2 + xs]))
+            results = {}
+            for name, fn in (('in memory', in_memory), ('streamed', streamed)):
+                results[name], elapsed, peak = measure(fn, path, trees)
+                print('{:>9} cases, {:<9} peak allocated {:7.1f} MB; {:.2f}s'.format(
+                    num_cases, name, peak / 2. ** 20, elapsed,
+                ))
+            assert numpy.allclose(results['in memory'], results['streamed'])
+            os.remove(path)
+        os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Compare generations needed by optimize to fit a polynomial with
+non-integer coefficients, using registered constants, ephemeral
+constants, and ephemeral constants with tuning of each generation's
+best tree.
+
+Run from the repository root with
+``PYTHONPATH=. python benchmarks/bench_constant_tuning.py``.
+"""
+
+from __future__ import print_function
+
+import sys
+import random
+
+import numpy
+
+from monkeys.typing import Registry, params, rtype, constant, ephemeral
+from monkeys.trees import make_input
+from monkeys.search import optimize, minimize
+
+from _common import quiet
+
+
+SEEDS = range(5)
+TARGET_ERROR = 0.05
+POPULATION_SIZE = 100
+ITERATIONS = 30
+TUNING_ITERATIONS = 25
+
+XS = numpy.linspace(-2, 2, 50)
+YS = 2.5 * XS ** 2 - 1.3 * XS + 0.7
+
+
+def make_registry(ephemeral_constants):
+    registry = Registry()
+    with registry:
+        make_input('BenchReal', name='bench_x')
+
+        @params('BenchReal', 'BenchReal')
+        @rtype('BenchReal')
+        def add(a, b):
+            return a + b
+
+        @params('BenchReal', 'BenchReal')
+        @rtype('BenchReal')
+        def mul(a, b):
+            return a * b
+
+        if ephemeral_constants:
+            ephemeral('BenchReal', lambda rng: rng.uniform(-1, 1))
+        else:
+            constant('BenchReal', 1.0)
+            constant('BenchReal', -1.0)
+
+        @params('BenchReal')
+        @minimize
+        def score(tree):
+            try:
+                return float(numpy.mean(numpy.abs(tree(bench_x=XS) - YS)))
+            except Exception:
+                return sys.maxsize
+
+    return registry, score
+
+
+def generations_to_target(ephemeral_constants, tuning_iterations):
+    generations = []
+    for seed in SEEDS:
+        random.seed(seed)
+        registry, score = make_registry(ephemeral_constants)
+        with registry:
+            iterations = []
+
+            def next_generation(*args, **kwargs):
+                iterations.append(None)
+                from monkeys.search import next_generation
+                return next_generation(*args, **kwargs)
+
+            with quiet():
+                best = optimize(
+                    score,
+                    population_size=POPULATION_SIZE,
+                    iterations=ITERATIONS,
+                    next_generation=next_generation,
+                    target_score=-TARGET_ERROR,
+                    tuning_iterations=tuning_iterations,
+                )
+        generations.append((len(iterations), -score(best)))
+    return generations
+
+
+def main():
+    for name, ephemeral_constants, tuning_iterations in (
+            ('registered constants', False, 0),
+            ('ephemeral constants', True, 0),
+            ('ephemeral constants, tuned', True, TUNING_ITERATIONS),
+        ):
+        results = generations_to_target(ephemeral_constants, tuning_iterations)
+        reached = [generations for generations, error in results if error <= TARGET_ERROR]
+        print('{:<28} reached target {}/{}; mean generations {}; mean final error {:.3f}'.format(
+            name,
+            len(reached), len(results),
+            '{:.1f}'.format(sum(reached) / float(len(reached))) if reached else '-',
+            sum(error for __, error in results) / len(results),
+        ))
+
+
+if __name__ == '__main__':
+    main()
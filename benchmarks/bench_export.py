@@ -0,0 +1,79 @@
+"""
+Compare the time taken to evaluate trees by calling them, by calling
+functions exported from them, and by exported batch functions over
+NumPy arrays, for trees of varying size.
+
+Run from the repository root with
+``PYTHONPATH=. python benchmarks/bench_export.py``.
+"""
+
+from __future__ import print_function
+
+import timeit
+import random
+
+import numpy
+
+from monkeys.typing import Registry, params, rtype, ephemeral, ignore
+from monkeys.trees import make_input, build_tree, get_tree_info
+from monkeys.tools.export import export_tree
+
+
+MAX_DEPTHS = (4, 6, 8)
+NUM_INPUTS = 10000
+
+
+def make_registry():
+    registry = Registry()
+    with registry:
+        make_input('BenchFloat', name='bench_x')
+        ephemeral('BenchFloat', lambda rng: rng.uniform(-1, 1))
+
+        @params('BenchFloat', 'BenchFloat')
+        @rtype('BenchFloat')
+        def add(a, b):
+            return a + b
+
+        @params('BenchFloat', 'BenchFloat')
+        @rtype('BenchFloat')
+        def mul(a, b):
+            return a * b
+
+        @params('BenchFloat', 'BenchFloat')
+        @rtype('BenchFloat')
+        @ignore(1.0, ZeroDivisionError)
+        def div(a, b):
+            return a / b
+
+    return registry
+
+
+def main():
+    registry = make_registry()
+    rng = random.Random(0)
+    xs = numpy.random.default_rng(0).uniform(-1, 1, NUM_INPUTS)
+    values = xs.tolist()
+    with registry:
+        for max_depth in MAX_DEPTHS:
+            tree = max(
+                (build_tree('BenchFloat', max_depth=max_depth, rng=rng) for __ in range(20)),
+                key=lambda t: get_tree_info(t).num_nodes,
+            )
+            namespace = {}
+            exec(compile(export_tree(tree, vectorize=True), '<export>', 'exec'), namespace)
+            evaluate, evaluate_batch = namespace['evaluate'], namespace['evaluate_batch']
+            timings = [
+                min(timeit.repeat(fn, number=1, repeat=3)) / NUM_INPUTS * 1e6
+                for fn in (
+                    lambda: [tree(bench_x=x) for x in values],
+                    lambda: [evaluate(x) for x in values],
+                    lambda: evaluate_batch(xs),
+                )
+            ]
+            print('{:>3} nodes: called {:.2f}us; exported {:.2f}us; exported batch {:.3f}us per input'.format(
+                get_tree_info(tree).num_nodes, *timings
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Measure the time taken to import monkeys modules, and report which heavy
+optional dependencies each import pulls in.
+
+Run from the repository root with
+``PYTHONPATH=. python benchmarks/bench_import_time.py``.
+"""
+
+from __future__ import print_function
+
+import re
+import sys
+import subprocess
+
+
+MODULES = 'monkeys', 'monkeys.search', 'monkeys.tools.display'
+HEAVY_DEPENDENCIES = 'numpy', 'astpath', 'lxml', 'graphviz', 'astor', 'multiprocessing'
+REPEATS = 5
+IMPORT_TIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def import_times(module):
+    """Return cumulative import time (us) of each top-level module."""
+    output = subprocess.check_output(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+    )
+    times = {}
+    for line in output.splitlines():
+        match = IMPORT_TIME.match(line)
+        if match:
+            __, cumulative, __, name = match.groups()
+            times[name] = int(cumulative)
+    return times
+
+
+def main():
+    for module in MODULES:
+        runs = [import_times(module) for __ in range(REPEATS)]
+        best = min(
+            max(times.get(name, 0) for name in (module, module.split('.')[0]))
+            for times in runs
+        )
+        loaded = [
+            dependency
+            for dependency in HEAVY_DEPENDENCIES
+            if dependency in runs[0]
+        ]
+        print('{:<24} {:>8.1f} ms  heavy dependencies: {}'.format(
+            module, best / 1000., ', '.join(loaded) or 'none'
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Time vectorized non-dominated sorting against a pure-Python version, and
+show the front of accuracy against size found by multi-objective search
+for a polynomial.
+
+Run from the repository root with
+``PYTHONPATH=. python benchmarks/bench_nsga2.py``.
+"""
+
+from __future__ import print_function
+
+import time
+import random
+
+import numpy
+
+from monkeys.search import optimize, pareto_objectives, non_dominated_fronts
+
+from _common import make_registry, quiet
+
+
+SORT_SIZES = 100, 500
+NUM_OBJECTIVES = 3
+POPULATION_SIZE = 100
+ITERATIONS = 30
+
+
+def python_fronts(objectives):
+    """Fast non-dominated sorting, as in Deb et al. 2002."""
+    dominated_by = [[] for __ in objectives]
+    counts = [0] * len(objectives)
+    for i, first in enumerate(objectives):
+        for j, second in enumerate(objectives):
+            if all(a >= b for a, b in zip(first, second)) and first != second:
+                dominated_by[i].append(j)
+            elif all(b >= a for a, b in zip(first, second)) and first != second:
+                counts[i] += 1
+    fronts = [[i for i, count in enumerate(counts) if not count]]
+    while fronts[-1]:
+        front = []
+        for i in fronts[-1]:
+            for j in dominated_by[i]:
+                counts[j] -= 1
+                if not counts[j]:
+                    front.append(j)
+        fronts.append(front)
+    return fronts[:-1]
+
+
+def main():
+    rng = numpy.random.default_rng(0)
+    for size in SORT_SIZES:
+        objectives = rng.integers(0, 20, size=(size, NUM_OBJECTIVES))
+        rows = [tuple(row) for row in objectives.tolist()]
+        start = time.time()
+        expected = python_fronts(rows)
+        python_seconds = time.time() - start
+        start = time.time()
+        fronts = non_dominated_fronts(objectives)
+        numpy_seconds = time.time() - start
+        assert [sorted(front) for front in fronts] == [sorted(front) for front in expected]
+        print('sorting {} x {}: python {:.1f}ms, numpy {:.1f}ms'.format(
+            size, NUM_OBJECTIVES, python_seconds * 1000, numpy_seconds * 1000,
+        ))
+
+    registry, score = make_registry()
+    score = pareto_objectives(score)
+    with registry:
+        with quiet():
+            front = optimize(
+                score, population_size=POPULATION_SIZE, iterations=ITERATIONS,
+                max_depth=8, multi_objective=True, rng=random.Random(0),
+            )
+        print('front of error against size ({} distinct trees):'.format(len(front)))
+        shown = set()
+        for tree in front:
+            error, size = score(tree)
+            if (error, size) not in shown:
+                shown.add((error, size))
+                print('  error {:>6} size {:>3}  {}'.format(-error, -size, tree))
+
+
+if __name__ == '__main__':
+    main()
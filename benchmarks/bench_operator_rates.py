@@ -0,0 +1,52 @@
+"""
+Compare the time taken by optimize to fit a polynomial using fixed
+operator rates and adaptive operator rates, and show how the adaptive
+rates evolve.
+
+Run from the repository root with
+``PYTHONPATH=. python benchmarks/bench_operator_rates.py``.
+"""
+
+from __future__ import print_function
+
+import time
+import random
+
+from monkeys.search import optimize, AdaptiveOperatorRates
+
+from _common import make_registry, quiet
+
+
+SEEDS = range(10)
+POPULATION_SIZE = 100
+ITERATIONS = 40
+
+
+def main():
+    for adaptive in (False, True):
+        reached, elapsed, histories = 0, 0.0, []
+        for seed in SEEDS:
+            registry, score = make_registry()
+            operator_rates = AdaptiveOperatorRates() if adaptive else None
+            with registry:
+                start = time.time()
+                with quiet():
+                    best = optimize(
+                        score, population_size=POPULATION_SIZE, iterations=ITERATIONS,
+                        target_score=0, max_depth=8, rng=random.Random(seed),
+                        operator_rates=operator_rates,
+                    )
+                elapsed += time.time() - start
+                reached += score(best) == 0
+            if adaptive:
+                histories.append(operator_rates.history)
+        print('{:<8} operator rates: reached target {}/{}; mean seconds {:.2f}'.format(
+            'adaptive' if adaptive else 'fixed', reached, len(SEEDS), elapsed / len(SEEDS),
+        ))
+    print('adaptive mutation rate by generation (first seed):', ' '.join(
+        '{:.2f}'.format(rates['mutation']) for rates in histories[0]
+    ))
+
+
+if __name__ == '__main__':
+    main()
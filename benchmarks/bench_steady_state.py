@@ -0,0 +1,78 @@
+"""
+Compare the scoring function calls needed by generational and steady-state
+search to fit a polynomial, and the throughput of steady-state search
+scoring in-process and across worker processes, given a scoring function
+of varying latency.
+
+Run from the repository root with
+``PYTHONPATH=. python benchmarks/bench_steady_state.py``.
+"""
+
+from __future__ import print_function
+
+import time
+import random
+
+from monkeys.search import optimize, steady_state, count_calls
+
+from _common import make_registry, quiet
+
+
+SEEDS = range(5)
+POPULATION_SIZE = 100
+EVALUATIONS = 5000
+LATENCY = 0.004  # maximum seconds taken to score a tree
+LATENCY_EVALUATIONS = 400
+PROCESSES = 4
+
+
+def calls_to_target(search):
+    results = []
+    for seed in SEEDS:
+        registry, score = make_registry()
+        with registry:
+            counted = count_calls(score)
+            with quiet():
+                best = search(counted, random.Random(seed))
+            results.append((counted.calls, score(best) == 0))
+    return results
+
+
+def main():
+    for name, search in (
+            ('generational', lambda score, rng: optimize(
+                score, population_size=POPULATION_SIZE,
+                iterations=EVALUATIONS // POPULATION_SIZE,
+                target_score=0, max_depth=8, rng=rng,
+            )),
+            ('steady-state', lambda score, rng: steady_state(
+                score, population_size=POPULATION_SIZE, evaluations=EVALUATIONS,
+                target_score=0, max_depth=8, rng=rng,
+            )),
+        ):
+        results = calls_to_target(search)
+        print('{:<14} reached target {}/{}; mean scoring calls {:.0f}'.format(
+            name,
+            sum(reached for __, reached in results), len(results),
+            sum(calls for calls, __ in results) / float(len(results)),
+        ))
+
+    for processes in (None, PROCESSES):
+        registry, score = make_registry(LATENCY)
+        with registry:
+            start = time.time()
+            with quiet():
+                steady_state(
+                    score, population_size=POPULATION_SIZE,
+                    evaluations=LATENCY_EVALUATIONS, max_depth=8,
+                    processes=processes, rng=random.Random(0),
+                )
+            elapsed = time.time() - start
+        print('steady-state, {:<11} {:.0f} evaluations/s'.format(
+            '{} processes'.format(processes or 'no'),
+            LATENCY_EVALUATIONS / elapsed,
+        ))
+
+
+if __name__ == '__main__':
+    main()
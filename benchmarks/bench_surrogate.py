@@ -0,0 +1,96 @@
+"""
+Compare the scoring function calls needed to fit a polynomial with and
+without surrogate pre-screening, and the rank correlation of the 
+surrogate model's predictions with the scores of the trees it keeps.
+
+Run from the repository root with
+``PYTHONPATH=. python benchmarks/bench_surrogate.py``.
+"""
+
+from __future__ import print_function
+
+import sys
+import random
+
+from monkeys.typing import Registry, params, rtype, constant
+from monkeys.trees import make_input
+from monkeys.search import optimize, count_calls
+from monkeys.surrogate import SurrogateModel
+
+from _common import quiet
+
+
+SEEDS = range(5)
+POPULATION_SIZE = 200
+ITERATIONS = 40
+XS = range(-5, 6)
+
+
+def make_registry():
+    registry = Registry()
+    with registry:
+        make_input('BenchInt', name='bench_x')
+        constant('BenchInt', 1)
+
+        @params('BenchInt', 'BenchInt')
+        @rtype('BenchInt')
+        def add(a, b):
+            return a + b
+
+        @params('BenchInt', 'BenchInt')
+        @rtype('BenchInt')
+        def sub(a, b):
+            return a - b
+
+        @params('BenchInt', 'BenchInt')
+        @rtype('BenchInt')
+        def mul(a, b):
+            return a * b
+
+        @params('BenchInt')
+        def score(tree):
+            try:
+                return -sum(abs(tree(bench_x=x) - (x ** 6 - 2 * x ** 4 + x ** 2)) for x in XS)
+            except Exception:
+                return -sys.maxsize
+
+    return registry, score
+
+
+def main():
+    for name, make_surrogate in (
+            ('no surrogate', lambda: None),
+            ('surrogate', SurrogateModel),
+        ):
+        calls, reached, correlations = [], [], []
+        for seed in SEEDS:
+            registry, score = make_registry()
+            surrogate = make_surrogate()
+            with registry:
+                counted = count_calls(score)
+                with quiet():
+                    best = optimize(
+                        counted, population_size=POPULATION_SIZE,
+                        iterations=ITERATIONS, max_depth=8, target_score=0,
+                        rng=random.Random(seed), surrogate=surrogate,
+                    )
+                calls.append(counted.calls)
+                reached.append(score(best) == 0)
+            if surrogate is not None:
+                correlations.extend(
+                    correlation
+                    for correlation, __ in surrogate.history
+                    if correlation is not None
+                )
+        print('{:<13} reached target {}/{}; mean scoring calls {:.0f}{}'.format(
+            name,
+            sum(reached), len(reached),
+            sum(calls) / float(len(calls)),
+            '' if not correlations else '; mean rank correlation {:.2f}'.format(
+                sum(correlations) / len(correlations)
+            ),
+        ))
+
+
+if __name__ == '__main__':
+    main()
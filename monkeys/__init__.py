@@ -1,4 +1,4 @@
-from monkeys.typing import func, rtype, params, constant, free, lookup_rtype
+from monkeys.typing import func, rtype, params, constant, ephemeral, free, lookup_rtype
 from monkeys.trees import UnsatisfiableType, build_tree, make_input, mutate, crossover
-from monkeys.search import tournament_select, next_generation, optimize
+from monkeys.search import tournament_select, nsga2_select, next_generation, optimize, steady_state, ant_optimize
 from monkeys.asts import quoted, quoted_template
@@ -1,12 +1,13 @@
 from __future__ import division
 
-import random
+import bisect
 import itertools
 from contextlib import contextmanager
 from collections import defaultdict
 
 from six import iteritems
 
+from monkeys.rng import as_random
 from monkeys.trees import get_tree_info
 from monkeys.exceptions import UnsatisfiableConstraint
 
@@ -28,16 +29,24 @@ class PheromoneConcentrations(defaultdict):
 
 
 class AntColony(object):
-    """Implements ACO for node graph weighting."""
+    """
+    Implements ACO for node graph weighting, drawing selections from the
+    given random number generator. Child combinations are weighted by
+    the share of each edge's pheromone of the selected type or, if types
+    are not normalized, by its concentration alone.
+    """
 
     DEFAULT_EVAPORATION_RATE = 1 / 20
+    RENORMALIZATION_THRESHOLD = 1e-100
 
     def __init__(
         self, 
         rtypes, 
         evaporation_rate=DEFAULT_EVAPORATION_RATE, 
         initial_default_pheromone=1.0,
-        initial_other_pheromone=0.0
+        initial_other_pheromone=0.0,
+        rng=None,
+        normalize_types=True,
     ):
         registered_functions = frozenset(
             function
@@ -46,10 +55,19 @@ class AntColony(object):
         )
         
         self._evaporation_rate = evaporation_rate
+        self._rng = as_random(rng)
+        self._normalize_types = normalize_types
         self._iteration = 0
-        
-        default_pheromone = lambda init: lambda: init * (1 - evaporation_rate) ** self._iteration
-               
+
+        # Concentrations are stored scaled: the actual concentration is the
+        # stored value multiplied by the global decay, so that evaporation
+        # need not touch the table. Unseen concentrations are stored as their
+        # initial value multiplied by the unit weight.
+        self._decay = 1.0
+        self._unit_weight = 1.0
+
+        default_pheromone = lambda init: lambda: init * self._unit_weight
+
         self._pheromone = defaultdict(
             lambda: defaultdict(
                 lambda: PheromoneConcentrations(
@@ -65,58 +83,97 @@ class AntColony(object):
             for combination in itertools.product(*allowed_children):
                 self._pheromone[function][combination][DEFAULT_PHEROMONE_TYPE] = initial_default_pheromone
 
+        self._candidate_cache = {}  # {(parent, constraints): [(children)]}
+        self._weight_cache = defaultdict(dict)  # {parent: {(constraints, pheromone_type): [weight]}}
+
     @staticmethod
-    def _roulette_select_children(
-        pheromone_distribution, 
-        pheromone_type=DEFAULT_PHEROMONE_TYPE, 
-        child_constraints=None
-    ):
+    def _roulette_select_children(child_combinations, cumulative_weights, rng):
         """
         Using roulette wheel selection, return a combination of children
-        for the specified function.
+        from the given candidates, weighted by the cumulative weights.
+        """
+        target = rng.uniform(0, cumulative_weights[-1])
+        index = bisect.bisect_left(cumulative_weights, target)
+        return child_combinations[min(index, len(child_combinations) - 1)]
+
+    def _candidates(self, parent, child_constraints):
         """
-        pheromone = pheromone_distribution  # {(children): {pheromone_type: pheromone}}
-        if child_constraints is not None:
-            pheromone = {
-                k: v
-                for k, v in
-                iteritems(pheromone)
+        Return the child combinations of parent satisfying the given
+        constraints, alongside the key under which they are cached.
+        """
+        constraint_key = (
+            None
+            if child_constraints is None else
+            tuple(map(tuple, child_constraints))
+        )
+        key = parent, constraint_key
+        try:
+            return key, self._candidate_cache[key]
+        except KeyError:
+            pass
+
+        pheromone = self._pheromone[parent]  # {(children): {pheromone_type: pheromone}}
+        if child_constraints is None:
+            candidates = list(pheromone)
+        else:
+            allowed = [frozenset(children) for children in child_constraints]
+            candidates = [
+                child_combination
+                for child_combination in
+                pheromone
                 if all(
                     child in allowed_children
                     for child, allowed_children in
-                    zip(k, child_constraints)
-                )
-            }
-            if not pheromone:
-                raise UnsatisfiableConstraint(
-                    "Unable to satisfy child constraints."
+                    zip(child_combination, allowed)
                 )
-                
-        # TODO: we sum total child combo pheromone twice - could 
-        # simply do once.
-        
-        total = sum(
-            concentrations[pheromone_type] / sum(concentrations.values())
-            for concentrations in 
-            pheromone.values()
-        )
-
-        target = random.uniform(0, total)
-        for child_combination, concentrations in iteritems(pheromone):
-            target -= concentrations[pheromone_type] / sum(concentrations.values())
-            if target <= 0:
-                return child_combination
+            ]
+        self._candidate_cache[key] = candidates
+        return key, candidates
 
-        return child_combination
-    
-    def select(self, parent, pheromone_type=DEFAULT_PHEROMONE_TYPE, children=None):
+    def _cumulative_weights(self, parent, key, candidates, pheromone_type):
+        """
+        Return cumulative concentrations of the specified pheromone type,
+        normalized if types are, over the candidate child combinations.
+        """
+        weight_cache = self._weight_cache[parent]
+        try:
+            return weight_cache[key, pheromone_type]
+        except KeyError:
+            pass
+
+        pheromone = self._pheromone[parent]
+        cumulative_weights = []
+        total = 0
+        inserted = False
+        for child_combination in candidates:
+            concentrations = pheromone[child_combination]
+            inserted = inserted or pheromone_type not in concentrations
+            concentration = concentrations[pheromone_type]
+            if self._normalize_types:
+                concentration /= sum(concentrations.values())
+            total += concentration
+            cumulative_weights.append(total)
+        if inserted:
+            # Newly-initialized concentrations may alter other weightings.
+            weight_cache.clear()
+        weight_cache[key, pheromone_type] = cumulative_weights
+        return cumulative_weights
+
+    def select(self, parent, pheromone_type=DEFAULT_PHEROMONE_TYPE, children=None, rng=None):
         """
-        Choose children for parent from given child selections.
+        Choose children for parent from given child selections, drawing
+        from the given random number generator rather than the colony's,
+        if specified.
         """
+        key, candidates = self._candidates(parent, children)
+        if not candidates:
+            raise UnsatisfiableConstraint(
+                "Unable to satisfy child constraints."
+            )
         return self._roulette_select_children(
-            pheromone_distribution=self._pheromone[parent],
-            pheromone_type=pheromone_type,
-            child_constraints=children,
+            candidates,
+            self._cumulative_weights(parent, key, candidates, pheromone_type),
+            self._rng if rng is None else as_random(rng),
         )
 
     def deposit(self, fitnesses, pheromone_type=DEFAULT_PHEROMONE_TYPE):
@@ -125,25 +182,40 @@ class AntColony(object):
         from trees to fitnesses. Fitnesses are expected to be within the 
         interval [0, 1], with 0 being least fit and 1 being most.
         """
-        edge_distances = defaultdict(list)
         for tree, fitness in iteritems(fitnesses):
             tree_info = get_tree_info(tree)
+            if not tree_info.graph_edges:
+                continue
             distance = (2 - fitness) * tree_info.num_nodes  # max deposit of 1
-            for edge in tree_info.graph_edges:
-                edge_distances[edge].append(distance)
-
-        for parent, edges in iteritems(self._pheromone):
-            for child_combination, concentrations in iteritems(edges):
-                for distance in edge_distances[parent, child_combination]:
-                    concentrations[pheromone_type] += 1 / distance
+            scaled_deposit = 1 / (distance * self._decay)
+            for parent, child_combination in tree_info.graph_edges:
+                concentrations = self._pheromone.get(parent, {}).get(child_combination)
+                if concentrations is None:
+                    continue
+                concentrations[pheromone_type] += scaled_deposit
+                # Normalized concentrations only change for deposited-on parents:
+                self._weight_cache.pop(parent, None)
                     
     def evaporate(self):
-        """Perform ACO-like end-of-iteration evaporation of pheromone."""
+        """
+        Perform ACO-like end-of-iteration evaporation of pheromone.
+
+        As every concentration decays by the same factor, relative
+        concentrations (and so cached selection weights) are unaffected.
+        """
+        self._decay *= 1 - self._evaporation_rate
+        self._iteration += 1
+        if self._decay < self.RENORMALIZATION_THRESHOLD:
+            self._renormalize()
+
+    def _renormalize(self):
+        """Fold the global decay back into the stored concentrations."""
         for parent, edges in iteritems(self._pheromone):
             for child_combination, concentrations in iteritems(edges):
                 for pheromone_type in concentrations:
-                    concentrations[pheromone_type] *= 1 - self._evaporation_rate
-        self._iteration += 1
+                    concentrations[pheromone_type] *= self._decay
+        self._unit_weight *= self._decay
+        self._decay = 1.0
         
     @contextmanager
     def iteration(self):
@@ -157,4 +229,4 @@ class AntColony(object):
         for parent, edges in iteritems(self._pheromone):
             for child_combination, concentrations in iteritems(edges):
                 for pheromone_type, concentration in iteritems(concentrations):
-                    yield parent, child_combination, pheromone_type, concentration
+                    yield parent, child_combination, pheromone_type, concentration * self._decay
@@ -1,9 +1,14 @@
+import os
 import ast
+import sys
 import copy
 import inspect
+import marshal
+import hashlib
+import tempfile
+import textwrap
 import functools
-
-import astor
+import collections
 
 
 class NameReplacer(ast.NodeTransformer):
@@ -33,12 +38,140 @@ def quoted(fn):
     return ast.parse(src).body[0].body
 
 
-def quoted_template(fn):
+class _Splice(list):
+    """Statements to be spliced into the enclosing statement list."""
+
+
+def _as_expression(arg):
+    """Return node suitable for placement in an expression."""
+    if isinstance(arg, list):
+        if len(arg) != 1:
+            raise TypeError("Cannot use {} statements as an expression.".format(len(arg)))
+        arg, = arg
+    if isinstance(arg, ast.Expr):
+        return arg.value
+    if isinstance(arg, ast.stmt):
+        raise TypeError("Cannot use {} statement as an expression.".format(type(arg).__name__))
+    return arg
+
+
+def _as_statements(arg):
+    """Return list of nodes suitable for placement in a statement list."""
+    return _Splice(
+        ast.Expr(value=node) if isinstance(node, ast.expr) else node
+        for node in
+        (arg if isinstance(arg, list) else [arg])
+    )
+
+
+def _locate(node, slot):
+    """Give node, if unlocated, the location of the slot it fills."""
+    if isinstance(node, (ast.expr, ast.stmt)) and not hasattr(node, 'lineno'):
+        ast.copy_location(node, slot)
+        ast.fix_missing_locations(node)
+    return node
+
+
+def _compile_template(node, argnames):
+    """
+    Return function which, supplied with a list of arguments and a set
+    of the indices of those already used, builds a copy of the template
+    node with arguments substituted for their names.
+    """
+    if isinstance(node, list):
+        builders = [_compile_template(item, argnames) for item in node]
+        def build_list(args, used):
+            built = []
+            for builder in builders:
+                item = builder(args, used)
+                if isinstance(item, _Splice):
+                    built.extend(item)
+                else:
+                    built.append(item)
+            return built
+        return build_list
+
+    if not isinstance(node, ast.AST) or not node._fields and not node._attributes:
+        return lambda args, used: node  # literals, operators and contexts are shared
+    if not node._fields:
+        return lambda args, used: copy.copy(node)  # located, such as pass and break
+
+    if isinstance(node, ast.Expr) and isinstance(node.value, ast.Name) and node.value.id in argnames:
+        index = argnames.index(node.value.id)
+        def build_statements(args, used):
+            statements = _as_statements(_use(args, index, used))
+            for statement in statements:
+                _locate(statement, node)
+            return statements
+        return build_statements
+
+    if isinstance(node, ast.Name) and node.id in argnames:
+        index = argnames.index(node.id)
+        ctx = node.ctx
+        def build_expression(args, used):
+            expression = _as_expression(_use(args, index, used))
+            if not isinstance(ctx, ast.Load) and hasattr(expression, 'ctx'):
+                expression = copy.copy(expression)
+                expression.ctx = ctx
+            return _locate(expression, node)
+        return build_expression
+
+    node_type = type(node)
+    field_builders = [
+        (field, _compile_template(value, argnames))
+        for field, value in
+        ast.iter_fields(node)
+    ]
+    attributes = {
+        attribute: getattr(node, attribute)
+        for attribute in
+        node._attributes
+        if hasattr(node, attribute)
+    }
+    def build_node(args, used):
+        built = node_type(**{
+            field: builder(args, used)
+            for field, builder in
+            field_builders
+        })
+        built.__dict__.update(attributes)
+        return built
+    return build_node
+
+
+def _use(args, index, used):
+    """Return argument, copied if it has already been used."""
+    arg = args[index]
+    if index in used:
+        return copy.deepcopy(arg)
+    used.add(index)
+    return arg
+
+
+def _cache_key(arg):
+    """Return key identifying argument by structure."""
+    if isinstance(arg, list):
+        return tuple(map(_cache_key, arg))
+    if isinstance(arg, ast.AST):
+        return ast.dump(arg)
+    return arg
+
+
+def quoted_template(fn=None, cache_size=None):
     """
     Return a function which, supplied with AST nodes, will
     populate and return the specified template body.
+
+    Arguments standing alone as statements are replaced by the 
+    statements supplied, and arguments within expressions by the 
+    expression supplied. If a cache size is specified, results are
+    cached by the structure of the arguments supplied, and so are
+    shared between calls.
     """
-    fn_node = ast.parse(inspect.getsource(fn)).body[0]
+    if fn is None:
+        return functools.partial(quoted_template, cache_size=cache_size)
+
+    fn_node = ast.parse(textwrap.dedent(inspect.getsource(fn))).body[0]
     argnames = [
         name.id
         if hasattr(name, 'id')
@@ -46,18 +179,107 @@ def quoted_template(fn):
         for name in
         fn_node.args.args
     ]
-        
+    build_body = _compile_template(fn_node.body, argnames)
+    cache = collections.OrderedDict()  # {argument key: body}
+
     @functools.wraps(fn)
     def wrapper(*args):
-        argdict = dict(zip(argnames, args))
-        populated_template = NameReplacer(argdict).visit(copy.deepcopy(fn_node))
-        # round-robin AST -> source -> AST conversion to fix type mismatches
-        return ast.parse(
-            astor.to_source(
-                ast.Module(
-                    body=populated_template.body
-                )
-            )
-        ).body
+        if not cache_size:
+            return build_body(args, set())
+        key = tuple(map(_cache_key, args))
+        try:
+            body = cache.pop(key)
+        except KeyError:
+            body = build_body(args, set())
+            if len(cache) >= cache_size:
+                cache.popitem(last=False)
+        cache[key] = body
+        return body
     
-    return wrapper
\ No newline at end of file
+    return wrapper
+
+
+def as_module(body):
+    """
+    Return the given module, or a module of the given statements, in a
+    form which may be compiled on any Python version.
+    """
+    if isinstance(body, ast.Module):
+        return body
+    return ast.Module(body=list(body), type_ignores=[])
+
+
+class CodeCache(object):
+    """
+    Cache of code objects compiled from AST bodies, keyed by their
+    canonical dump, holding at most maxsize code objects in memory. If a
+    directory is given, compiled code objects are also stored there, and
+    so reused across runs.
+    """
+
+    VERSION_TAG = sys.version
+
+    def __init__(self, maxsize=1024, directory=None, filename='<monkeys>'):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.filename = filename
+        self._code = collections.OrderedDict()  # {dump: code}
+        self.hits = 0
+        self.misses = 0
+        if directory is not None and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def compile(self, body):
+        """Return code object of the given module or list of statements."""
+        module = as_module(body)
+        key = ast.dump(module)
+        try:
+            code = self._code.pop(key)
+        except KeyError:
+            code = self._load(key)
+            if code is None:
+                self.misses += 1
+                code = compile(ast.fix_missing_locations(module), self.filename, 'exec')
+                self._store(key, code)
+            else:
+                self.hits += 1
+            if len(self._code) >= self.maxsize:
+                self._code.popitem(last=False)
+        else:
+            self.hits += 1
+        self._code[key] = code
+        return code
+
+    def function(self, body, name, namespace=None):
+        """
+        Return the named function defined by the given body, executed in
+        a copy of the given namespace.
+        """
+        environment = dict(namespace or {})
+        exec(self.compile(body), environment)
+        return environment[name]
+
+    def _path(self, key):
+        """Return path at which code object for key is stored."""
+        digest = hashlib.sha1(
+            (self.VERSION_TAG + '\0' + self.filename + '\0' + key).encode('utf-8')
+        ).hexdigest()
+        return os.path.join(self.directory, digest + '.code')
+
+    def _load(self, key):
+        """Return stored code object for key, if any."""
+        if self.directory is None:
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                return marshal.load(f)
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            return None
+
+    def _store(self, key, code):
+        """Store code object for key, if a directory was given."""
+        if self.directory is None:
+            return
+        with tempfile.NamedTemporaryFile(dir=self.directory, delete=False) as f:
+            marshal.dump(code, f)
+        os.rename(f.name, self._path(key))
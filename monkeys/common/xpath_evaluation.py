@@ -0,0 +1,160 @@
+"""Batched evaluation of XPath expressions against example corpora."""
+
+import os
+import ast
+import sys
+import hashlib
+import tempfile
+import collections
+
+from monkeys.typing import params
+from monkeys.parallel import fork_context
+from monkeys.common.xpath import Expression
+
+
+_WORKER_EVALUATOR = []  # evaluator inherited by forked workers
+
+
+def parse_document(document, cache_directory=None):
+    """
+    Return XML AST of the given Python source or AST node, stored in
+    the cache directory, if given, by hash of its contents.
+    """
+    import astpath
+    from lxml import etree
+
+    is_node = isinstance(document, ast.AST)
+    contents = ast.dump(document) if is_node else document
+    path = None
+    if cache_directory is not None:
+        digest = hashlib.sha1(
+            (('node:' if is_node else 'source:') + contents).encode('utf-8')
+        ).hexdigest()
+        path = os.path.join(cache_directory, digest + '.xml')
+        try:
+            return etree.parse(path).getroot()
+        except (IOError, OSError, etree.XMLSyntaxError):
+            pass
+
+    if is_node:
+        xml_ast = astpath.convert_to_xml(document)
+    else:
+        xml_ast = astpath.file_contents_to_xml_ast(document)
+
+    if path is not None:
+        if not os.path.isdir(cache_directory):
+            os.makedirs(cache_directory)
+        with tempfile.NamedTemporaryFile(dir=cache_directory, delete=False) as f:
+            f.write(etree.tostring(xml_ast))
+        os.rename(f.name, path)
+    return xml_ast
+
+
+class XPathEvaluator(object):
+    """
+    Scores XPath expressions by the number of example documents they
+    classify correctly: positive examples should be matched, negative
+    examples should not. Documents may be Python source or AST nodes,
+    and are parsed once. Compiled expressions are held in an LRU cache
+    of at most max_compiled expressions.
+
+    If a number of processes is given, batches of expressions are
+    evaluated across a pool of forked worker processes.
+    """
+
+    def __init__(self, positive, negative, cache_directory=None, max_compiled=10000, processes=None):
+        self.positive = [parse_document(document, cache_directory) for document in positive]
+        self.negative = [parse_document(document, cache_directory) for document in negative]
+        self.max_compiled = max_compiled
+        self.processes = processes
+        self.max_score = len(self.positive) + len(self.negative)
+        self._compiled = collections.OrderedDict()  # {expression: XPath}
+        self._scores = {}  # {expression: score} of most recent batch
+        self._pool = None
+
+    def compile(self, expression):
+        """Return compiled XPath for expression, or None if invalid."""
+        from lxml import etree
+
+        try:
+            compiled = self._compiled.pop(expression)
+        except KeyError:
+            try:
+                compiled = etree.XPath(expression)
+            except etree.XPathSyntaxError:
+                compiled = None
+            if len(self._compiled) >= self.max_compiled:
+                self._compiled.popitem(last=False)
+        self._compiled[expression] = compiled
+        return compiled
+
+    def score(self, expression):
+        """Return number of documents the expression classifies correctly."""
+        from lxml import etree
+
+        compiled = self.compile(expression)
+        if compiled is None:
+            return -sys.maxsize
+        try:
+            return (
+                sum(bool(compiled(document)) for document in self.positive) +
+                sum(not compiled(document) for document in self.negative)
+            )
+        except etree.XPathError:
+            return -sys.maxsize
+
+    def scores(self, expressions):
+        """Score batch of expressions, scoring each distinct expression once."""
+        distinct = list(collections.OrderedDict.fromkeys(expressions))
+        if self.processes and len(distinct) > 1:
+            if self._pool is None:
+                _WORKER_EVALUATOR[:] = [self]
+                self._pool = fork_context().Pool(self.processes)
+            chunksize = -(-len(distinct) // self.processes)
+            distinct_scores = self._pool.map(_score_in_worker, distinct, chunksize)
+        else:
+            distinct_scores = [self.score(expression) for expression in distinct]
+        self._scores = dict(zip(distinct, distinct_scores))
+        return [self._scores[expression] for expression in expressions]
+
+    def scoring_function(self):
+        """
+        Return scoring function for trees of expressions, which may be
+        prepared with a population of trees to score them in one batch.
+        """
+        @params(Expression)
+        def score_tree(tree):
+            try:
+                expression = tree.evaluate()
+            except Exception:
+                return -sys.maxsize
+            try:
+                return self._scores[expression]
+            except KeyError:
+                return self.score(expression)
+
+        def prepare(trees):
+            expressions = []
+            for tree in trees:
+                try:
+                    expressions.append(tree.evaluate())
+                except Exception:
+                    pass
+            self.scores(expressions)
+
+        score_tree.prepare = prepare
+        setattr(score_tree, '__max_score', self.max_score)
+        return score_tree
+
+    def close(self):
+        """Shut down worker processes, if any."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+def _score_in_worker(expression):
+    """Score expression using the evaluator inherited from the parent."""
+    evaluator, = _WORKER_EVALUATOR
+    return evaluator.score(expression)
@@ -0,0 +1,317 @@
+"""Evaluation of trees over sets of fitness cases."""
+
+import sys
+import math
+import itertools
+import functools
+import collections
+
+from six import iteritems, string_types
+from past.builtins import xrange
+
+from monkeys.rng import as_random
+from monkeys.trees import Input, NO_VALUE
+
+
+class _Failure(object):
+    """Outputs of a subtree whose evaluation raised an exception."""
+
+    def __init__(self, exception):
+        self.exception = exception
+
+
+def _size(outputs):
+    """Return number of outputs stored for a subtree."""
+    return 1 if isinstance(outputs, _Failure) else len(outputs)
+
+
+class SemanticCache(object):
+    """
+    Evaluates trees over a fixed set of fitness cases, each a mapping of
+    input names to values, caching the outputs of every subtree by
+    structure.
+
+    Once a subtree has been evaluated, trees containing it - such as the
+    offspring of crossover and mutation - only require evaluation of the
+    nodes above it. Functions are assumed to be free of side effects.
+
+    The memory used is bounded by the total number of outputs stored,
+    one per case for each subtree, the least recently used subtrees 
+    being evicted first.
+    """
+
+    DEFAULT_MAX_OUTPUTS = 10000000
+
+    def __init__(self, cases, max_outputs=DEFAULT_MAX_OUTPUTS):
+        self.cases = list(cases)
+        self.max_outputs = max_outputs
+        self._entries = collections.OrderedDict()  # {(f, value, (child id)): (id, outputs)}
+        self._num_outputs = 0
+        self._ids = itertools.count()
+        self.hits = 0
+        self.misses = 0
+
+    def evaluate(self, tree):
+        """
+        Return list of the tree's outputs, one for each fitness case,
+        raising the exception of any failed evaluation.
+        """
+        __, outputs = self._evaluate(tree)
+        if isinstance(outputs, _Failure):
+            raise outputs.exception
+        return outputs
+
+    def clear(self):
+        """Remove all cached outputs."""
+        self._entries.clear()
+        self._num_outputs = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evaluate(self, node):
+        """Return (id, outputs) of the subtree rooted at node."""
+        children = [self._evaluate(child) for child in node.children]
+        key = node.f, node.value, tuple(child_id for child_id, __ in children)
+        try:
+            entry = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            if node.value is not NO_VALUE:
+                outputs = [node.value] * len(self.cases)
+            else:
+                outputs = self._compute(node.f, [outputs for __, outputs in children])
+            entry = next(self._ids), outputs
+            size = _size(outputs)
+            if size > self.max_outputs:
+                return entry
+            while self._num_outputs + size > self.max_outputs:
+                __, (__, evicted) = self._entries.popitem(last=False)
+                self._num_outputs -= _size(evicted)
+            self._num_outputs += size
+        else:
+            self.hits += 1
+        self._entries[key] = entry
+        return entry
+
+    def _compute(self, f, child_outputs):
+        """Apply function across the outputs of its children."""
+        for outputs in child_outputs:
+            if isinstance(outputs, _Failure):
+                return outputs
+        if isinstance(f, Input):
+            return [case[f.__name__] for case in self.cases]
+        try:
+            if not child_outputs:
+                return [f() for __ in self.cases]
+            return [f(*args) for args in zip(*child_outputs)]
+        except Exception as e:
+            return _Failure(e)
+
+
+def evaluate_cases(cases, max_outputs=SemanticCache.DEFAULT_MAX_OUTPUTS):
+    """
+    Evaluate trees over the given fitness cases before passing their
+    outputs to the scoring function, reusing the outputs of previously
+    evaluated subtrees. Trees failing evaluation are given the minimum
+    score.
+    """
+    cache = SemanticCache(cases, max_outputs)
+    def decorator(scoring_fn):
+        @functools.wraps(scoring_fn)
+        def wrapper(tree):
+            try:
+                outputs = cache.evaluate(tree)
+            except Exception:
+                return -sys.maxsize
+            return scoring_fn(outputs)
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+
+class Sampling(object):
+    RANDOM = object()  # new random subset each generation
+    INTERLEAVED = object()  # each generation, the next of disjoint strided subsets
+    PROGRESSIVE = object()  # random subset, extended to all cases for promising trees
+
+
+class CaseSampler(object):
+    """
+    Scores trees by the mean of their per-case scores over a sample of
+    the fitness cases, drawn anew by prepare, so that each generation
+    may be scored on a different subset of a large set of cases.
+
+    With progressive sampling, trees whose score on the sample reaches
+    the given quantile of recent sample scores are instead scored on
+    every case. The full score of a tree is always over every case.
+
+    The budget of cached outputs is shared between the sample and every
+    case. Only progressive sampling, which scores many trees on every 
+    case, caches their outputs; otherwise full scores, needed only for 
+    the best tree of each generation, are computed afresh.
+    """
+
+    MIN_HISTORY = 10  # sample scores recorded before any tree is not extended
+
+    def __init__(self, score_case, cases, sample_size, sampling=Sampling.RANDOM, extend_quantile=0.75, history=1000, max_outputs=SemanticCache.DEFAULT_MAX_OUTPUTS, rng=None):
+        self.score_case = score_case
+        self.cases = list(cases)
+        self.sample_size = min(sample_size, len(self.cases))
+        self.sampling = sampling
+        self.extend_quantile = extend_quantile
+        self.max_outputs = max_outputs
+        self.rng = as_random(rng)
+        self.generation = -1
+        self.cases_scored = 0
+        self.extended = 0
+        self._sample_scores = collections.deque(maxlen=history)
+        full_outputs = max_outputs // 2 if sampling is Sampling.PROGRESSIVE else 0
+        self._full_cache = SemanticCache(self.cases, full_outputs)
+        self._sample_outputs = max_outputs - full_outputs
+        self.prepare()
+
+    def prepare(self, trees=None):
+        """Draw the sample of cases for the next generation."""
+        self.generation += 1
+        if self.sampling is Sampling.INTERLEAVED:
+            num_subsets = int(math.ceil(len(self.cases) / float(self.sample_size)))
+            self.sample = self.cases[self.generation % num_subsets::num_subsets]
+        else:
+            self.sample = self.rng.sample(self.cases, self.sample_size)
+        self._cache = SemanticCache(self.sample, self._sample_outputs)
+
+    def score(self, tree):
+        """Return score of tree over the current sample, or extended from it."""
+        score = self._mean_score(self._cache, tree)
+        if self.sampling is not Sampling.PROGRESSIVE or score == -sys.maxsize:
+            return score
+        ranked_scores = sorted(self._sample_scores)
+        self._sample_scores.append(score)
+        if (
+                len(ranked_scores) >= self.MIN_HISTORY and 
+                score < ranked_scores[int(self.extend_quantile * (len(ranked_scores) - 1))]
+            ):
+            return score
+        self.extended += 1
+        return self.full_score(tree)
+
+    def full_score(self, tree):
+        """Return score of tree over every case."""
+        return self._mean_score(self._full_cache, tree)
+
+    def _mean_score(self, cache, tree):
+        try:
+            outputs = cache.evaluate(tree)
+        except Exception:
+            return -sys.maxsize
+        self.cases_scored += len(outputs)
+        return sum(
+            self.score_case(output, case) 
+            for output, case in 
+            zip(outputs, cache.cases)
+        ) / float(len(outputs))
+
+
+def sample_cases(cases, sample_size, sampling=Sampling.RANDOM, extend_quantile=0.75, max_outputs=SemanticCache.DEFAULT_MAX_OUTPUTS, rng=None):
+    """
+    Score trees by the mean of the decorated function, given the output
+    of the tree for each case and the case itself, over a sample of the
+    fitness cases drawn anew each generation. Trees failing evaluation
+    are given the minimum score. The score of a tree over every case is
+    given by the full_score attribute, by which search verifies the
+    best trees found.
+    """
+    def decorator(score_case):
+        sampler = CaseSampler(
+            score_case, cases, sample_size, sampling=sampling, 
+            extend_quantile=extend_quantile, max_outputs=max_outputs, rng=rng,
+        )
+        @functools.wraps(score_case)
+        def wrapper(tree):
+            return sampler.score(tree)
+        wrapper.prepare = sampler.prepare
+        wrapper.full_score = sampler.full_score
+        wrapper.sampler = sampler
+        return wrapper
+    return decorator
+
+
+class ColumnSource(object):
+    """
+    Fitness cases stored as the rows of a two-dimensional array, such as
+    a .npy or raw binary file, which is memory-mapped rather than read.
+    Inputs are bound by name to columns of the array. Trees are evaluated
+    over a fixed number of rows at a time, each column of which is passed
+    as a view of the mapped file, so that the memory used is bounded by
+    the chunk size rather than by the size of the data. The functions of
+    trees must accept and return NumPy arrays. Raw binary files carry no
+    shape, so the number of columns in each of their rows must be given.
+    """
+
+    DEFAULT_CHUNK_SIZE = 65536
+
+    def __init__(self, data, columns, chunk_size=DEFAULT_CHUNK_SIZE, dtype='float64', num_columns=None):
+        import numpy
+
+        self.columns = {  # {input name: column index}
+            getattr(input_, '__name__', input_): column
+            for input_, column in
+            iteritems(columns)
+        }
+        if isinstance(data, string_types) and data.endswith('.npy'):
+            data = numpy.load(data, mmap_mode='r')
+        elif isinstance(data, string_types):
+            if num_columns is None:
+                raise ValueError("Number of columns must be given for raw binary files.")
+            data = numpy.memmap(data, dtype=dtype, mode='r').reshape(-1, num_columns)
+        if data.ndim != 2:
+            raise ValueError("Fitness cases must be rows of a two-dimensional array.")
+        self.data = data
+        self.chunk_size = chunk_size
+
+    def __len__(self):
+        return len(self.data)
+
+    def chunks(self):
+        """Yield successive chunks of rows, as views of the data."""
+        for start in xrange(0, len(self.data), self.chunk_size):
+            yield self.data[start:start + self.chunk_size]
+
+    def evaluate(self, tree, chunk):
+        """
+        Return array of the tree's outputs for each row of the chunk,
+        raising FloatingPointError on division by zero or invalid values.
+        """
+        import numpy
+
+        with numpy.errstate(divide='raise', invalid='raise'):
+            outputs = tree(**{
+                name: chunk[:, column]
+                for name, column in
+                iteritems(self.columns)
+            })
+        return numpy.broadcast_to(outputs, (len(chunk),))
+
+
+def stream_cases(source):
+    """
+    Evaluate trees over each chunk of the given ColumnSource in turn,
+    passing their outputs and the chunk to the scoring function, and 
+    summing its scores over chunks. Trees failing evaluation are given
+    the minimum score.
+    """
+    def decorator(scoring_fn):
+        @functools.wraps(scoring_fn)
+        def wrapper(tree):
+            total = 0
+            for chunk in source.chunks():
+                try:
+                    outputs = source.evaluate(tree, chunk)
+                except Exception:
+                    return -sys.maxsize
+                total += scoring_fn(outputs, chunk)
+            return total
+        wrapper.source = source
+        return wrapper
+    return decorator
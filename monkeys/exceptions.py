@@ -13,3 +13,8 @@ class UnsatisfiableType(UnsatisfiableConstraint):
 class TreeConstructionError(Exception):
     """Raised when a tree cannot be successfully constructed."""
     pass
+
+
+class ExportError(Exception):
+    """Raised when a tree cannot be exported as source code."""
+    pass
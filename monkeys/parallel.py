@@ -0,0 +1,83 @@
+"""Tooling for distributing work across worker processes."""
+
+import pickle
+import traceback
+
+from monkeys.typing import current_registry
+from monkeys.trees import Node, NO_VALUE
+
+
+def fork_context():
+    """
+    Return a multiprocessing context whose workers are forked, and so
+    share the registered functions of the current process.
+    """
+    import multiprocessing
+
+    try:
+        return multiprocessing.get_context('fork')
+    except AttributeError:  # Python 2 always forks on POSIX
+        return multiprocessing
+
+
+def picklable_exception(exception):
+    """
+    Return exception if it can be sent back to the parent process, or
+    otherwise a RuntimeError describing the exception being handled.
+    """
+    try:
+        pickle.dumps(exception)
+    except Exception:
+        return RuntimeError(traceback.format_exc())
+    return exception
+
+
+class FunctionTable(object):
+    """
+    Encodes trees as nested tuples of function indices, so that they
+    may be exchanged between forked processes.
+    """
+
+    def __init__(self, functions):
+        self.functions = list(functions)
+        self.indices = {
+            function: index
+            for index, function in
+            enumerate(self.functions)
+        }
+
+    @classmethod
+    def from_registry(cls):
+        """
+        Create table of all functions in the active registry, first 
+        registering the lifted versions of functions which would 
+        otherwise only be registered once trees use them.
+        """
+        registry = current_registry()
+        for f in registry.functions():
+            first_class_type = getattr(f, 'first_class_type', None)
+            if first_class_type is not None:
+                registry.lookup(first_class_type)
+        return cls(registry.functions())
+
+    def encode(self, tree):
+        """
+        Encode tree as (function index, (encoded children)), followed by 
+        the value of ephemeral constants.
+        """
+        encoded = (
+            self.indices[tree.f],
+            tuple(self.encode(child) for child in tree.children),
+        )
+        if tree.value is not NO_VALUE:
+            encoded += (tree.value,)
+        return encoded
+
+    def decode(self, encoded):
+        """Reconstruct tree from its encoding."""
+        index, children = encoded[:2]
+        return Node.from_children(
+            self.functions[index],
+            [self.decode(child) for child in children],
+            *encoded[2:]
+        )
@@ -0,0 +1,80 @@
+"""Random number generators for reproducible, independent runs."""
+
+import random
+
+from past.builtins import xrange
+
+
+class NumpyRandom(object):
+    """
+    Adapts a NumPy Generator to the subset of the random module's
+    interface used in constructing, varying and selecting trees.
+    """
+
+    def __init__(self, generator):
+        self.generator = generator
+
+    def random(self):
+        return float(self.generator.random())
+
+    def uniform(self, a, b):
+        return float(self.generator.uniform(a, b))
+
+    def gauss(self, mu, sigma):
+        return float(self.generator.normal(mu, sigma))
+
+    def randint(self, a, b):
+        return int(self.generator.integers(a, b, endpoint=True))
+
+    def getrandbits(self, k):
+        bits = 0
+        for __ in xrange(0, k, 32):
+            bits = bits << 32 | int(self.generator.integers(1 << 32))
+        return bits >> (-k % 32)
+
+    def choice(self, seq):
+        if not len(seq):
+            raise IndexError("Cannot choose from an empty sequence.")
+        return seq[int(self.generator.integers(len(seq)))]
+
+    def sample(self, population, k):
+        population = list(population)
+        if not 0 <= k <= len(population):
+            raise ValueError("Sample larger than population.")
+        indices = self.generator.choice(len(population), size=k, replace=False)
+        return [population[index] for index in indices]
+
+    def shuffle(self, x):
+        x[:] = [x[i] for i in self.generator.permutation(len(x))]
+
+
+def as_random(rng=None):
+    """
+    Return the given random.Random instance or adapted NumPy Generator,
+    or the random module itself if none is given.
+    """
+    if rng is None:
+        return random
+    if hasattr(rng, 'bit_generator'):
+        return NumpyRandom(rng)
+    return rng
+
+
+def spawn(rng, n):
+    """
+    Return n independent generators, seeded deterministically from the
+    given one, of the same kind. Each worker of a pool may be given its
+    own stream, so that parallel runs are reproducible and do not share
+    generator state.
+    """
+    generator = getattr(rng, 'generator', rng)
+    if hasattr(generator, 'bit_generator'):
+        import numpy
+        seed_sequence = numpy.random.SeedSequence(int(generator.integers(1 << 63)))
+        return [
+            type(generator)(type(generator.bit_generator)(child))
+            for child in
+            seed_sequence.spawn(n)
+        ]
+    rng = as_random(rng)
+    return [random.Random(rng.getrandbits(128)) for __ in xrange(n)]
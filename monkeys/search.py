@@ -6,18 +6,25 @@ import re
 import ast
 import sys
 import copy
-import random
+import math
+import time
 import inspect
 import functools
+import itertools
 import contextlib
 import collections
 
-import numpy
-import astpath
 from six import iteritems, itervalues
 from past.builtins import xrange
 
-from monkeys.trees import get_tree_info, build_tree, crossover, mutate
+from monkeys.aco import AntColony
+from monkeys.parallel import picklable_exception
+from monkeys.rng import as_random
+from monkeys.asts import NameReplacer
+from monkeys.typing import registered_types, lookup_rtype
+from monkeys.trees import (
+    get_tree_info, get_tree_dimensions, build_tree, crossover, mutate, structural_key,
+)
 from monkeys.exceptions import UnsatisfiableType
 
 
@@ -31,14 +38,31 @@ DEFAULT_OPTIMIZATIONS = {
     Optimizations.PSEUDO_PARETO,
 }
 
+_WORKER_SCORING = []  # (function table, scoring function) inherited by forked workers
 
-def tournament_select(trees, scoring_fn, selection_size, requires_population=False, optimizations=DEFAULT_OPTIMIZATIONS, random_parsimony_prob=0.33, score_callback=None):
+
+def tournament_select(trees, scoring_fn, selection_size, requires_population=False, optimizations=DEFAULT_OPTIMIZATIONS, random_parsimony_prob=0.33, score_callback=None, build_tree=None, abandon_below=None, rng=None, surrogate=None):
     """
     Perform tournament selection on population of trees, using the specified
     objective function for comparison, and conducting tournaments of the
-    specified selection size.
+    specified selection size. If a bound is specified, scoring functions
+    supporting it may stop scoring trees which cannot reach it. Scoring 
+    functions with a prepare method are first given the whole population,
+    so that it may be scored in one batch. Tournaments are drawn from the
+    given random number generator, or the random module by default.
+
+    If a SurrogateModel is given, only the trees it predicts to be 
+    promising are scored, and it is then trained on their scores; the
+    remainder lose every tournament. The first tree, being the best of
+    the previous generation, is always scored.
     """
+    build_kwargs = {} if rng is None else {'rng': rng}
+    rng = as_random(rng)
     _scoring_fn = scoring_fn(trees) if requires_population else scoring_fn
+    prepare = getattr(_scoring_fn, 'prepare', None)
+    if callable(prepare):
+        prepare(trees)
+    build_tree = build_tree or build_tree_to_requirements
 
     avg_size = 0
     sizes = {}
@@ -51,17 +75,23 @@ def tournament_select(trees, scoring_fn, selection_size, requires_population=Fal
         sizes = {tree: get_tree_info(tree).num_nodes for tree in trees}
         avg_size = sum(itervalues(sizes)) / float(len(sizes))
     
-    if using_random_parsimony:
-        scores = collections.defaultdict(lambda: -sys.maxsize)
-        scores.update({
-            tree: _scoring_fn(tree)
-            for tree in trees
-            if sizes[tree] <= avg_size or random_parsimony_prob < random.random() 
-        })
-    else:
-        scores = {tree: _scoring_fn(tree) for tree in trees}
+    candidates = trees if surrogate is None else surrogate.screen(trees, rng, keep=trees[:1])
+    with abandonment_bound(_scoring_fn, abandon_below):
+        if using_random_parsimony or surrogate is not None:
+            scores = collections.defaultdict(lambda: -sys.maxsize)
+            scores.update({
+                tree: _scoring_fn(tree)
+                for tree in candidates
+                if not using_random_parsimony or sizes[tree] <= avg_size or random_parsimony_prob < rng.random() 
+            })
+        else:
+            scores = {tree: _scoring_fn(tree) for tree in trees}
+
+    if surrogate is not None:
+        surrogate.update(scores)
 
     if using_covariant_parsimony:
+        import numpy
         covariance_matrix = numpy.cov(numpy.array([(sizes[tree], scores[tree]) for tree in trees]).T)
         size_variance = numpy.var([sizes[tree] for tree in trees])
         c = -(covariance_matrix / size_variance)[0, 1]  # 0, 1 should be correlation... is this the wrong way around?
@@ -83,12 +113,12 @@ def tournament_select(trees, scoring_fn, selection_size, requires_population=Fal
 
     while True:
         tree = max(
-            random.sample(trees, selection_size),
+            rng.sample(trees, selection_size),
             key=lambda t: scores.get(t, -sys.maxsize)
         )
         if scores.get(tree, -sys.maxsize) == -sys.maxsize:
             try:
-                new_tree = build_tree_to_requirements(scoring_fn)
+                new_tree = build_tree(scoring_fn, **build_kwargs)
             except UnsatisfiableType:
                 continue
         else:
@@ -97,7 +127,7 @@ def tournament_select(trees, scoring_fn, selection_size, requires_population=Fal
                     new_tree = copy.deepcopy(tree)
             except RuntimeError:
                 try:
-                    new_tree = build_tree_to_requirements(scoring_fn)
+                    new_tree = build_tree(scoring_fn, **build_kwargs)
                 except UnsatisfiableType:
                     continue
         yield new_tree
@@ -106,6 +136,158 @@ def tournament_select(trees, scoring_fn, selection_size, requires_population=Fal
 DEFAULT_TOURNAMENT_SELECT = functools.partial(tournament_select, selection_size=25)
         
         
+def objective_matrix(scores):
+    """
+    Return matrix of objectives, one row per score; scalar scores (such
+    as those of failed trees) are repeated across every objective.
+    """
+    import numpy
+
+    rows = [tuple(score) if isinstance(score, (tuple, list)) else (score,) for score in scores]
+    width = max([len(row) for row in rows] or [1])
+    return numpy.array(
+        [row * width if len(row) == 1 else row for row in rows],
+        dtype=float,
+    ).reshape(len(rows), width)
+
+
+def non_dominated_fronts(objectives):
+    """
+    Return indices of the rows of the objective matrix in each 
+    successive non-dominated front, all objectives being maximized.
+    """
+    import numpy
+
+    objectives = numpy.asarray(objectives, dtype=float)
+    no_worse = (objectives[:, None, :] >= objectives[None, :, :]).all(axis=2)
+    better = (objectives[:, None, :] > objectives[None, :, :]).any(axis=2)
+    dominates = no_worse & better  # [i, j]: row i dominates row j
+    domination_counts = dominates.sum(axis=0)
+    remaining = numpy.ones(len(objectives), dtype=bool)
+    fronts = []
+    while remaining.any():
+        front = numpy.flatnonzero(remaining & (domination_counts == 0))
+        fronts.append(front)
+        remaining[front] = False
+        domination_counts -= dominates[front].sum(axis=0)
+    return fronts
+
+
+def crowding_distances(objectives):
+    """
+    Return crowding distance of each row of the objective matrix: the
+    sum over objectives of the normalized distance between the rows on
+    either side of it. Rows at the extremes have infinite distance.
+    """
+    import numpy
+
+    objectives = numpy.asarray(objectives, dtype=float)
+    num_rows, num_objectives = objectives.shape
+    if num_rows <= 2:
+        return numpy.full(num_rows, numpy.inf)
+    order = numpy.argsort(objectives, axis=0, kind='mergesort')
+    columns = numpy.arange(num_objectives)
+    sorted_objectives = objectives[order, columns]
+    ranges = sorted_objectives[-1] - sorted_objectives[0]
+    ranges[ranges == 0] = 1
+    gaps = numpy.empty((num_rows, num_objectives))
+    gaps[1:-1] = (sorted_objectives[2:] - sorted_objectives[:-2]) / ranges
+    gaps[[0, -1]] = numpy.inf
+    distances = numpy.empty((num_rows, num_objectives))
+    distances[order, columns] = gaps
+    return distances.sum(axis=1)
+
+
+def nsga2_rank(scores):
+    """
+    Return the front rank (0 being non-dominated) and crowding distance
+    within its front of each score.
+    """
+    import numpy
+
+    objectives = objective_matrix(scores)
+    ranks = numpy.empty(len(objectives), dtype=int)
+    crowding = numpy.empty(len(objectives))
+    for rank, front in enumerate(non_dominated_fronts(objectives)):
+        ranks[front] = rank
+        crowding[front] = crowding_distances(objectives[front])
+    return ranks, crowding
+
+
+def nsga2_select(trees, scoring_fn, selection_size=2, score_callback=None, rng=None, **kwargs):
+    """
+    Perform selection on population of trees as in NSGA-II, for scoring 
+    functions returning tuples of objectives, each maximized: trees are 
+    compared by the non-dominated front they belong to, then by crowding
+    distance, in tournaments of the specified selection size. Other
+    arguments to selection functions are accepted and ignored.
+    """
+    rng = as_random(rng)
+    scores = {tree: scoring_fn(tree) for tree in trees}
+    if callable(score_callback):
+        score_callback(scores)
+    ranked_trees = list(scores)
+    ranks, crowding = nsga2_rank([scores[tree] for tree in ranked_trees])
+    keys = {
+        tree: (-rank, distance)
+        for tree, rank, distance in 
+        zip(ranked_trees, ranks, crowding)
+    }
+
+    while True:
+        tree = max(rng.sample(trees, selection_size), key=keys.__getitem__)
+        try:
+            with recursion_limit(1500):
+                new_tree = copy.deepcopy(tree)
+        except RuntimeError:
+            continue
+        yield new_tree
+
+
+DEFAULT_NSGA2_SELECT = functools.partial(nsga2_select, selection_size=2)
+
+
+def nsga2_survivors(trees, scores, n):
+    """
+    Return the n trees ranked best by non-dominated front, then by 
+    crowding distance, given their scores. Structurally identical trees
+    are ranked after all distinct trees, so that duplicates do not 
+    crowd out the front.
+    """
+    import numpy
+
+    ranks, crowding = nsga2_rank(scores)
+    seen = set()
+    duplicates = numpy.zeros(len(trees), dtype=bool)
+    for i, tree in enumerate(trees):
+        key = structural_key(tree)
+        duplicates[i] = key in seen
+        seen.add(key)
+    return [trees[i] for i in numpy.lexsort((-crowding, ranks, duplicates))[:n]]
+
+
+def pareto_objectives(scoring_fn=None, size=True, cost=False):
+    """
+    Extend scores with objectives for smaller trees and, optionally, for
+    faster scoring, for use in multi-objective optimization.
+    """
+    if scoring_fn is None:
+        return functools.partial(pareto_objectives, size=size, cost=cost)
+
+    @functools.wraps(scoring_fn)
+    def wrapper(tree):
+        start = time.time()
+        score = scoring_fn(tree)
+        elapsed = time.time() - start
+        objectives = tuple(score) if isinstance(score, (tuple, list)) else (score,)
+        if size:
+            objectives += (-get_tree_dimensions(tree).sizes[tree],)
+        if cost:
+            objectives += (-elapsed,)
+        return objectives
+    return wrapper
+        
+        
 def pre_evaluate(scoring_fn):
     """
     Evaluate trees before passing to the scoring function.
@@ -121,50 +303,90 @@ def pre_evaluate(scoring_fn):
 
 
 def minimize(scoring_fn):
-    """Minimize score."""
+    """Minimize score, or each objective of a tuple of scores."""
     @functools.wraps(scoring_fn)
     def wrapper(tree):
-        return -scoring_fn(tree)
+        score = scoring_fn(tree)
+        if isinstance(score, tuple):
+            return tuple(-objective for objective in score)
+        return -score
     return wrapper
 
 
 class AssertionReplacer(ast.NodeTransformer):
     """Transformer used in assertions_as_score."""
     
-    def __init__(self, score_var_name):
+    def __init__(self, score_var_name, total_assertions=None, pass_vector=False):
         self.score_var_name = score_var_name
+        self.total_assertions = total_assertions
+        self.pass_vector = pass_vector
         self.max_score = 0
         
     def visit_Assert(self, node):
-        """Replace assertions with augmented assignments."""
+        """
+        Replace assertions with augmented assignments, followed, if the
+        total number of assertions is known, by a check for abandonment.
+        """
+        index = self.max_score
         self.max_score += 1
-        return ast.AugAssign(
-            op=ast.Add(),
-            target=ast.Name(
-                id=self.score_var_name,
-                ctx=ast.Store()
-            ),
-            value=ast.Call(
-                args=[node.test],
-                func=ast.Name(
-                    id='bool',
-                    ctx=ast.Load()
-                ),
-                keywords=[],
-                kwargs=None,
-                starargs=None
+        if self.pass_vector:
+            source = (
+                '__passed__ = bool(__test__)\n'
+                '{score} += __passed__\n'
+                '__passes__[{index}] = __passes__[{index}] is not False and __passed__\n'
             )
-        )
+        else:
+            source = '{score} += bool(__test__)\n'
+        if self.total_assertions is not None:
+            source += (
+                'if __abandon_below__[0] is not None and {score} + {remaining} < __abandon_below__[0]:\n'
+                '    return __result__({score}, __passes__)\n'
+            )
+        statements = ast.parse(source.format(
+            score=self.score_var_name,
+            index=index,
+            remaining=(self.total_assertions or 0) - index - 1,
+        )).body
+        replacer = NameReplacer({'__test__': node.test})
+        return [replacer.visit(statement) for statement in statements]
+
+
+@contextlib.contextmanager
+def abandonment_bound(scoring_fn, bound):
+    """
+    Within the context, allow the scoring function, if created by
+    assertions_as_score, to stop scoring once the score can no longer 
+    reach the bound.
+    """
+    cell = getattr(scoring_fn, '__abandon_below', None)
+    if cell is None:
+        yield
+        return
+    previous_bound = cell[0]
+    cell[0] = bound
+    try:
+        yield
+    finally:
+        cell[0] = previous_bound
 
 
-def assertions_as_score(scoring_fn):
+def assertions_as_score(scoring_fn=None, pass_vector=False):
     """
     Create a scoring function from a multi-assert test, allotting
-    one point per successful assertion.
+    one point per successful assertion. If pass_vector is specified, 
+    the scoring function instead returns a tuple recording whether each 
+    assertion passed.
+
+    Where the maximum score can be determined, the scoring function 
+    stops early within abandonment_bound once the bound can no longer 
+    be reached.
     
     Nota bene: if used in conjunction with other decorators, must
     be the first decorator applied to the function.
     """
+    if scoring_fn is None:
+        return functools.partial(assertions_as_score, pass_vector=pass_vector)
+
     score_var_name = '__score__'
     
     function_source = inspect.getsource(scoring_fn)
@@ -177,41 +399,8 @@ def assertions_as_score(scoring_fn):
             function_source.splitlines()
         )
         
-    fn_ast, = ast.parse(function_source).body
-    fn_ast.body.insert(
-        0,
-        ast.Assign(
-            targets=[ast.Name(
-                id=score_var_name,
-                ctx=ast.Store()
-            )],
-            value=ast.Num(n=0)
-        )
-    )
-    fn_ast.body.append(
-        ast.Return(
-            value=ast.Name(
-                id=score_var_name,
-                ctx=ast.Load()
-            )
-        )
-    )
-    fn_ast.decorator_list = []
-    assertion_replacer = AssertionReplacer(score_var_name)
-    fn_ast = assertion_replacer.visit(fn_ast)
-    
-    code = compile(
-        ast.fix_missing_locations(
-            ast.Module(body=[fn_ast])
-        ), 
-        '<string>', 
-        'exec'
-    )
-    context = {}
-    exec(code, scoring_fn.__globals__, context)
-    new_scoring_fn, = context.values()
-    
     # Assess whether max score can be determined:
+    import astpath
     xml_ast = astpath.file_contents_to_xml_ast(function_source)
     invalidating_ancestors = 'While', 'For'
     invalidating_expressions = (
@@ -225,21 +414,66 @@ def assertions_as_score(scoring_fn):
         invalidating_expressions
     )
     
+    fn_ast, = ast.parse(function_source).body
+    total_assertions = sum(isinstance(node, ast.Assert) for node in ast.walk(fn_ast))
+    assertion_replacer = AssertionReplacer(
+        score_var_name,
+        total_assertions=None if invalid else total_assertions,
+        pass_vector=pass_vector,
+    )
+    fn_ast = assertion_replacer.visit(fn_ast)
+    fn_ast.body[:0] = ast.parse('{} = 0\n__passes__ = [None] * {}'.format(
+        score_var_name, total_assertions
+    )).body
+    fn_ast.body.extend(ast.parse('return __result__({}, __passes__)'.format(
+        score_var_name
+    )).body)
+    fn_ast.decorator_list = []
+
+    # Define scoring function within factory, closing over bound and result:
+    factory_ast, = ast.parse(
+        'def __factory__(__abandon_below__, __result__):\n'
+        '    return {}'.format(fn_ast.name)
+    ).body
+    factory_ast.body.insert(0, fn_ast)
+    code = compile(
+        ast.fix_missing_locations(
+            ast.Module(body=[factory_ast])
+        ), 
+        '<string>', 
+        'exec'
+    )
+    context = {}
+    exec(code, scoring_fn.__globals__, context)
+    if pass_vector:
+        result = lambda score, passes: tuple(passed is True for passed in passes)
+    else:
+        result = lambda score, passes: score
+    abandon_below = [None]
+    new_scoring_fn = context['__factory__'](abandon_below, result)
+    
     if not invalid:
         new_scoring_fn.__max_score = assertion_replacer.max_score
+        new_scoring_fn.__abandon_below = abandon_below
     
     return functools.wraps(scoring_fn)(new_scoring_fn)
 
 
-def build_tree_to_requirements(scoring_function, build_tree=build_tree):
+def build_tree_to_requirements(scoring_function, build_tree=build_tree, rng=None, max_depth=None, max_nodes=None):
     params = getattr(scoring_function, '__params', ())
     if len(params) != 1:
         raise ValueError("Scoring function must accept a single parameter.")
     return_type, = params
+    build_kwargs = {
+        name: value
+        for name, value in
+        [('rng', rng), ('max_depth', max_depth), ('max_nodes', max_nodes)]
+        if value is not None
+    }
 
     for __ in xrange(9999):
         with recursion_limit(500):
-            tree = build_tree(return_type, convert=False)
+            tree = build_tree(return_type, convert=False, **build_kwargs)
         requirements = getattr(scoring_function, 'required_inputs', ())
         if not all(req in tree for req in requirements):
             continue
@@ -248,39 +482,334 @@ def build_tree_to_requirements(scoring_function, build_tree=build_tree):
     raise UnsatisfiableType("Could not meet input requirements.")
 
 
+def _with_rng(fn, rng):
+    """
+    Return fn drawing from the given random number generator, if one is
+    given or fn is among the library's own builders and operators, which
+    accept one; otherwise, return fn as it is.
+    """
+    if rng is None and fn not in (build_tree, build_tree_to_requirements, mutate, crossover):
+        return fn
+    return functools.partial(fn, rng=as_random(rng))
+
+
+def tune_constants(tree, scoring_fn, iterations=25, step_size=0.1, perturbation=0.01, rng=None):
+    """
+    Adjust the floating-point ephemeral constants of the tree, in place,
+    to improve its score, by simultaneous perturbation stochastic 
+    approximation: each iteration estimates the gradient with respect to
+    all constants at once from two evaluations, and steps along it (with
+    momentum) if doing so improves the score. The step size grows after 
+    improvements and shrinks otherwise.
+
+    Since scoring functions are opaque, constants are tuned through them
+    rather than through a vectorized objective over the fitness cases:
+    each iteration costs three full scoring calls - two to estimate the
+    gradient and one to try the step - and one more restores the best 
+    values, so tuning adds at most 3 * iterations + 2 calls per tree. Scoring 
+    functions evaluating cases with NumPy, such as those made by 
+    stream_cases, keep each call vectorized over the cases.
+    """
+    import numpy
+
+    rng = as_random(rng)
+    frontier = [tree]
+    constants = []
+    while frontier:
+        node = frontier.pop()
+        if isinstance(node.value, float):
+            constants.append(node)
+        frontier.extend(node.children)
+    if not constants:
+        return tree
+
+    def score(values):
+        for node, value in zip(constants, values):
+            node.value = float(value)
+        return scoring_fn(tree)
+
+    best_values = numpy.array([node.value for node in constants])
+    best_score = score(best_values)
+    momentum = numpy.zeros(len(constants))
+    for __ in xrange(iterations):
+        direction = numpy.array([rng.choice((-1., 1.)) for __ in constants])
+        scale = 1 + numpy.abs(best_values)
+        difference = (
+            score(best_values + perturbation * scale * direction) - 
+            score(best_values - perturbation * scale * direction)
+        )
+        momentum = 0.8 * momentum + difference / (2 * perturbation * scale * direction)
+        norm = numpy.linalg.norm(momentum)
+        if not numpy.isfinite(norm) or not norm:
+            momentum[:] = 0
+            continue
+        candidate = best_values + step_size * scale * momentum / norm
+        candidate_score = score(candidate)
+        if candidate_score > best_score:
+            best_values, best_score = candidate, candidate_score
+            step_size *= 1.2
+        else:
+            momentum[:] = 0
+            step_size *= 0.5
+    score(best_values)
+    return tree
+
+
+def count_unique(trees):
+    """Return number of structurally distinct trees."""
+    return len(frozenset(structural_key(tree) for tree in trees))
+
+
+def deduplicate(
+        trees, scoring_fn, uniqueness,
+        build_tree=build_tree_to_requirements, mutate=mutate,
+        attempts=10, rng=None,
+    ):
+    """
+    Replace structurally identical trees with mutants of them or with 
+    newly-built trees, until the specified proportion of trees are 
+    unique. The first occurrence of each tree is kept.
+    """
+    build_tree = _with_rng(build_tree, rng)
+    mutate = _with_rng(mutate, rng)
+    target = min(len(trees), int(math.ceil(uniqueness * len(trees))))
+    seen = set()
+    unique, duplicates = [], []
+    for tree in trees:
+        key = structural_key(tree)
+        if key in seen:
+            duplicates.append(tree)
+        else:
+            seen.add(key)
+            unique.append(tree)
+
+    for tree in duplicates:
+        for attempt in xrange(attempts if len(seen) < target else 0):
+            try:
+                if attempt % 2:
+                    candidate = build_tree(scoring_fn)
+                else:
+                    with recursion_limit(1500):
+                        candidate = mutate(copy.deepcopy(tree))
+            except (UnsatisfiableType, RuntimeError):
+                continue
+            key = structural_key(candidate)
+            if key not in seen:
+                seen.add(key)
+                tree = candidate
+                break
+        unique.append(tree)
+
+    return unique
+
+
+class AdaptiveOperatorRates(object):
+    """
+    Adapts the rates at which next_generation applies crossover and 
+    mutation to the improvement each makes over its parents' scores per 
+    second spent applying it, keeping the rate of reproduction fixed. 
+    Offspring are scored in the following generation, and matched to
+    their parents' scores by structure. Statistics decay each generation,
+    so that rates follow the course of the search. Failed applications
+    are retried at most max_retries times, then a new tree is built.
+    """
+
+    VARIATION_OPERATORS = 'crossover', 'mutation'
+
+    def __init__(self, crossover_rate=0.80, mutation_rate=0.01, minimum_share=0.05, decay=0.5, max_retries=10):
+        self.rates = {'crossover': crossover_rate, 'mutation': mutation_rate}
+        self.minimum_share = minimum_share
+        self.decay = decay
+        self.max_retries = max_retries
+        self.seconds = dict.fromkeys(self.VARIATION_OPERATORS, 0.0)
+        self.improvement = dict.fromkeys(self.VARIATION_OPERATORS, 0.0)
+        self.retries = dict.fromkeys(self.VARIATION_OPERATORS, 0)
+        self.history = []  # [{operator: rate}], one per generation
+        self._scores = {}  # {structural key: score} of current generation
+        self._offspring = []  # [(operator, structural key, parent score)]
+
+    def breed(self, selector, crossover, mutate, build_tree, rng=None):
+        """
+        Return offspring of trees drawn from the selector, by crossover,
+        mutation or reproduction, chosen according to the current rates.
+        """
+        rng = as_random(rng)
+        draw = rng.random()
+        if draw <= self.rates['crossover']:
+            operator, apply_operator, num_parents = 'crossover', crossover, 2
+        elif draw <= self.rates['crossover'] + self.rates['mutation']:
+            operator, apply_operator, num_parents = 'mutation', mutate, 1
+        else:
+            return next(selector)
+
+        for __ in xrange(self.max_retries + 1):
+            parents = [next(selector) for __ in xrange(num_parents)]
+            parent_score = max(
+                self._scores.get(structural_key(parent), -sys.maxsize)
+                for parent in parents
+            )
+            start = time.time()
+            try:
+                child = apply_operator(*parents)
+                break
+            except (UnsatisfiableType, RuntimeError):
+                self.retries[operator] += 1
+            finally:
+                self.seconds[operator] += time.time() - start
+        else:
+            child, parent_score = build_tree(), -sys.maxsize
+        self._offspring.append((operator, structural_key(child), parent_score))
+        return child
+
+    def observe(self, scores):
+        """
+        Credit operators with the improvement of offspring, given the
+        scores of the generation containing them, and adapt rates.
+        """
+        self._scores = {}
+        for tree, score in iteritems(scores):
+            key = structural_key(tree)
+            self._scores[key] = max(score, self._scores.get(key, -sys.maxsize))
+        for operator, key, parent_score in self._offspring:
+            score = self._scores.get(key, -sys.maxsize)
+            if -sys.maxsize not in (score, parent_score):
+                self.improvement[operator] += max(0, score - parent_score)
+        self._offspring = []
+
+        efficiencies = {
+            operator: self.improvement[operator] / self.seconds[operator] if self.seconds[operator] else 0
+            for operator in self.VARIATION_OPERATORS
+        }
+        total_efficiency = sum(itervalues(efficiencies))
+        if total_efficiency > 0:
+            variation_rate = sum(itervalues(self.rates))
+            variable_share = 1 - self.minimum_share * len(efficiencies)
+            self.rates = {
+                operator: variation_rate * (self.minimum_share + variable_share * efficiency / total_efficiency)
+                for operator, efficiency in iteritems(efficiencies)
+            }
+        self.history.append(dict(self.rates))
+        for operator in self.VARIATION_OPERATORS:
+            self.seconds[operator] *= self.decay
+            self.improvement[operator] *= self.decay
+
+
 def next_generation(
         trees, scoring_fn,
         select_fn=DEFAULT_TOURNAMENT_SELECT,
-        build_tree=build_tree_to_requirements, mutate=mutate,
+        build_tree=None, mutate=mutate,
         crossover_rate=0.80, mutation_rate=0.01,
         score_callback=None,
-        optimizations=DEFAULT_OPTIMIZATIONS
+        optimizations=DEFAULT_OPTIMIZATIONS,
+        uniqueness=None,
+        max_depth=None, max_nodes=None,
+        abandon_below=None,
+        tuning_iterations=0,
+        rng=None,
+        operator_rates=None,
+        surrogate=None,
     ):
     """
     Create next generation of trees from prior generation, maintaining current
-    size.
+    size. If AdaptiveOperatorRates are given, they choose the operator 
+    producing each offspring in place of the fixed rates. If a uniqueness ratio is specified, duplicate trees are replaced
+    until at least that proportion of the generation is unique. If a maximum
+    depth or number of nodes is specified, offspring, and trees built by
+    the default build_tree, are kept within it. If
+    tuning iterations are specified, the ephemeral constants of the best
+    tree are tuned before it is carried over. Selection and variation draw
+    from the given random number generator. If a SurrogateModel is given,
+    it is passed to the selection function to screen the generation, and 
+    the best tree carried over is chosen from those scored. For scoring
+    functions with a full_score method, such as those scoring samples of
+    fitness cases, the best tree is only carried over in place of the
+    first if it scores at least as well on the full score.
+
+    A build_tree function, abandonment bound or random number generator
+    is passed on to the selection function only if given, and the random
+    number generator is passed to the given build_tree and mutate only if
+    given.
     """
-    selector = select_fn(trees, scoring_fn, score_callback=score_callback, optimizations=optimizations)
+    if build_tree is None and (max_depth is not None or max_nodes is not None):
+        build_tree = functools.partial(build_tree_to_requirements, max_depth=max_depth, max_nodes=max_nodes)
+    select_kwargs = {
+        name: value
+        for name, value in
+        [('build_tree', build_tree), ('abandon_below', abandon_below), ('rng', rng), ('surrogate', surrogate)]
+        if value is not None
+    }
+    build_tree = _with_rng(build_tree or build_tree_to_requirements, rng)
+    mutate = _with_rng(mutate, rng)
+    rng = as_random(rng)
+    generation_scores = {}  # {tree: score}, by identity, for this generation
+
+    @functools.wraps(scoring_fn)
+    def score_once(tree):
+        try:
+            return generation_scores[tree]
+        except KeyError:
+            pass
+        except TypeError:  # population, for scoring functions requiring it
+            return scoring_fn(tree)
+        score = generation_scores[tree] = scoring_fn(tree)
+        return score
+
+    if 'build_tree' in select_kwargs:
+        select_kwargs['build_tree'] = build_tree
+    if operator_rates is not None:
+        def observe_scores(scores, score_callback=score_callback):
+            operator_rates.observe(scores)
+            if callable(score_callback):
+                score_callback(scores)
+        score_callback = observe_scores
+    selector = select_fn(
+        trees, score_once, 
+        score_callback=score_callback, 
+        optimizations=optimizations, 
+        **select_kwargs
+    )
+    _crossover = functools.partial(crossover, rng=rng)
+    if max_depth is not None or max_nodes is not None:
+        _crossover = functools.partial(_crossover, max_depth=max_depth, max_nodes=max_nodes)
+        mutate = functools.partial(mutate, max_depth=max_depth, max_nodes=max_nodes)
     pop_size = len(trees)
     
-    new_pop = [max(trees, key=scoring_fn)]
+    new_pop = []
     for __ in xrange(pop_size - 1):
-        if random.random() <= crossover_rate:
+        if operator_rates is not None:
+            new_pop.append(operator_rates.breed(
+                selector, _crossover, mutate,
+                functools.partial(build_tree, scoring_fn), rng,
+            ))
+
+        elif rng.random() <= crossover_rate:
             for __ in xrange(99999):
                 try:
-                    new_pop.append(crossover(next(selector), next(selector)))
+                    new_pop.append(_crossover(next(selector), next(selector)))
                     break
                 except (UnsatisfiableType, RuntimeError):
                     continue
             else:
                 new_pop.append(build_tree(scoring_fn))
 
-        elif random.random() <= mutation_rate / (1 - crossover_rate):
+        elif rng.random() <= mutation_rate / (1 - crossover_rate):
             new_pop.append(mutate(next(selector)))
 
         else:
             new_pop.append(next(selector))
 
+    scored = [tree for tree in trees if tree in generation_scores]
+    elite = max(scored if surrogate is not None and scored else trees, key=score_once)
+    full_score = getattr(scoring_fn, 'full_score', None)
+    if full_score is not None and elite is not trees[0]:
+        elite = max([elite, trees[0]], key=full_score)
+    if tuning_iterations:
+        tune_constants(elite, scoring_fn, iterations=tuning_iterations, rng=rng)
+    new_pop.insert(0, elite)
+
+    if uniqueness:
+        new_pop = deduplicate(new_pop, scoring_fn, uniqueness, build_tree=build_tree, mutate=mutate)
+
     return new_pop
 
 
@@ -306,6 +835,35 @@ def recursion_limit(limit):
         sys.setrecursionlimit(orig_limit)
     
 
+def memoize_objectives(scoring_fn):
+    """
+    Remember the objectives scored for each tree, by identity, in the
+    scores attribute; scalar scores are taken as a single objective.
+    """
+    @functools.wraps(scoring_fn)
+    def wrapper(tree):
+        try:
+            return wrapper.scores[tree]
+        except KeyError:
+            pass
+        score = scoring_fn(tree)
+        score = tuple(score) if isinstance(score, (tuple, list)) else (score,)
+        wrapper.scores[tree] = score
+        return score
+    wrapper.scores = {}
+    return wrapper
+
+
+def count_calls(fn):
+    """Keep a running count of calls made to the function."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        wrapper.calls += 1
+        return fn(*args, **kwargs)
+    wrapper.calls = 0
+    return wrapper
+
+
 def optimize(
         scoring_function,
         population_size=250,
@@ -313,11 +871,66 @@ def optimize(
         build_tree=build_tree,
         next_generation=next_generation,
         show_scores=True,
-        optimizations=DEFAULT_OPTIMIZATIONS
+        optimizations=DEFAULT_OPTIMIZATIONS,
+        target_score=None,
+        uniqueness=None,
+        max_depth=None,
+        max_nodes=None,
+        abandon_quantile=None,
+        tuning_iterations=0,
+        rng=None,
+        operator_rates=None,
+        multi_objective=False,
+        surrogate=None,
     ):
+    """
+    Optimize using genetic programming. If abandon_quantile is specified,
+    scoring functions supporting it stop scoring trees once they can no
+    longer reach that quantile of the previous generation's scores. If 
+    tuning iterations are specified, the ephemeral constants of each 
+    generation's best tree are tuned. Given a random.Random instance or
+    NumPy Generator, runs are reproducible and independent of others.
+    Given AdaptiveOperatorRates, their rates are shown each iteration.
+    For scoring functions with a full_score method, such as those made
+    by sample_cases, the target score must be reached on the full score,
+    by which the tree returned is also chosen.
+
+    If multi_objective is specified, scoring functions return tuples of
+    objectives, each maximized, and search proceeds as in NSGA-II: 
+    parents are chosen by nsga2_select, and each generation is chosen 
+    from the parents and offspring of the last by nsga2_survivors. The
+    final non-dominated front of distinct trees is returned, best first,
+    in place of a single tree, and no target score is used.
+
+    If a SurrogateModel is given, each generation is screened by it, so
+    that trees predicted to score poorly are not scored; the number so 
+    skipped, and the rank correlation of its predictions with the scores
+    of the trees it keeps, are shown each iteration.
+    """
+    if multi_objective and tuning_iterations:
+        raise ValueError("Constants cannot be tuned for multiple objectives.")
+    if multi_objective and surrogate is not None:
+        raise ValueError("Surrogate models predict only single objectives.")
     print("Creating initial population of {}.".format(population_size))
     sys.stdout.flush()
 
+    scoring_function = count_calls(scoring_function)
+    full_score = getattr(scoring_function, 'full_score', None)
+    if target_score is None:
+        target_score = getattr(scoring_function, '__max_score', None)
+    generation_kwargs = {}
+    if surrogate is not None:
+        generation_kwargs['surrogate'] = surrogate
+    if multi_objective:
+        scoring_function = memoize_objectives(scoring_function)
+        target_score = None
+        generation_kwargs['select_fn'] = DEFAULT_NSGA2_SELECT
+
+    build_tree = _with_rng(build_tree, rng)
+    _mutate = mutate
+    if max_depth is not None or max_nodes is not None:
+        build_tree = functools.partial(build_tree, max_depth=max_depth, max_nodes=max_nodes)
+        _mutate = functools.partial(mutate, max_depth=max_depth, max_nodes=max_nodes)
     build_to_requirements = functools.partial(
         build_tree_to_requirements,
         build_tree=build_tree,
@@ -334,10 +947,43 @@ def optimize(
                     len(population)
                 )
             )
-    best_tree = [random.choice(population)]
+    if uniqueness:
+        population = deduplicate(
+            population, scoring_function, uniqueness,
+            build_tree=build_to_requirements, mutate=_mutate, rng=rng,
+        )
+    best_tree = [as_random(rng).choice(population)]
     early_stop = []
+    abandon_below = [None]
     
     def score_callback(iteration, scores):
+        if multi_objective:
+            if show_scores:
+                print("Iteration {}:\tFront: {}\tUnique: {}".format(
+                    iteration + 1,
+                    len(non_dominated_fronts(objective_matrix(list(scores.values())))[0]),
+                    count_unique(scores),
+                ))
+                sys.stdout.flush()
+            return
+
+        best_score = max(scores.values())
+        best_tree.append(max(scores, key=scores.get))
+        
+        if target_score is not None and best_score >= target_score:
+            if full_score is None or full_score(best_tree[-1]) >= target_score:
+                early_stop.append(True)
+
+        if abandon_quantile is not None:
+            ranked_scores = sorted(
+                score 
+                for score in 
+                scores.values()
+                if score != -sys.maxsize
+            )
+            if ranked_scores:
+                abandon_below[0] = ranked_scores[int(abandon_quantile * (len(ranked_scores) - 1))]
+
         if not show_scores:
             return
         
@@ -351,34 +997,331 @@ def optimize(
             average_score = sum(non_failure_scores) / len(non_failure_scores)
         except ZeroDivisionError:
             average_score = -sys.maxsize
-        best_score = max(scores.values())
         
-        best_tree.append(max(scores, key=scores.get))
-        
-        print("Iteration {}:\tBest: {:.2f}\tAverage: {:.2f}".format(
+        print("Iteration {}:\tBest: {:.2f}\tAverage: {:.2f}\tUnique: {}{}{}".format(
             iteration + 1,
             best_score,
             average_score,
+            count_unique(scores),
+            '' if operator_rates is None else "\tCrossover: {crossover:.2f}\tMutation: {mutation:.2f}".format(
+                **operator_rates.rates
+            ),
+            '' if surrogate is None else "\tSkipped: {}\tRank correlation: {}".format(
+                surrogate.skipped,
+                '-' if surrogate.accuracy is None else '{:.2f}'.format(surrogate.accuracy),
+            ),
         ))
         sys.stdout.flush()
-        
-        if best_score == getattr(scoring_function, '__max_score', None):
-            early_stop.append(True)
     
     print("Optimizing...")
     with recursion_limit(600):
         for iteration in xrange(iterations):
             callback = functools.partial(score_callback, iteration)
-            population = next_generation(
+            offspring = next_generation(
                 population,
                 scoring_function,
                 build_tree=build_to_requirements,
                 mutate=mutate,
                 score_callback=callback,
                 optimizations=optimizations,
+                uniqueness=uniqueness,
+                max_depth=max_depth,
+                max_nodes=max_nodes,
+                abandon_below=abandon_below[0],
+                tuning_iterations=tuning_iterations,
+                rng=rng,
+                operator_rates=operator_rates,
+                **generation_kwargs
             )
+            if multi_objective:
+                combined = list(collections.OrderedDict.fromkeys(population + offspring))
+                population = nsga2_survivors(
+                    combined, 
+                    [scoring_function(tree) for tree in combined], 
+                    population_size,
+                )
+                scoring_function.scores = {tree: scoring_function(tree) for tree in population}
+            else:
+                population = offspring
             if early_stop:
+                print("Reached target score after {} evaluations.".format(
+                    scoring_function.calls
+                ))
                 break
         
-    best_tree = max(best_tree, key=scoring_function)
+    if multi_objective:
+        front = non_dominated_fronts(objective_matrix([scoring_function(tree) for tree in population]))[0]
+        front = collections.OrderedDict(
+            (structural_key(population[i]), population[i]) 
+            for i in front
+        )
+        return sorted(front.values(), key=scoring_function, reverse=True)
+    best_tree = max(best_tree, key=full_score or scoring_function)
+    return best_tree
+
+
+def _score_in_worker(token, encoded):
+    """
+    Score encoded tree using the scoring function inherited from the 
+    parent, returning the token it was sent with, whether scoring 
+    succeeded, and the score or exception raised.
+    """
+    table, scoring_function = _WORKER_SCORING
+    try:
+        return token, True, scoring_function(table.decode(encoded))
+    except Exception as e:
+        return token, False, picklable_exception(e)
+
+
+def steady_state(
+        scoring_function,
+        population_size=250,
+        evaluations=6250,
+        build_tree=build_tree,
+        selection_size=7,
+        replacement_size=None,
+        crossover_rate=0.90,
+        show_scores=True,
+        target_score=None,
+        max_depth=None,
+        max_nodes=None,
+        processes=None,
+        rng=None,
+    ):
+    """
+    Optimize using steady-state genetic programming: rather than 
+    replacing the whole population each generation, offspring are bred
+    one at a time from parents chosen by tournament, and only they are 
+    scored. Each offspring replaces the worst tree of the population, or
+    if a replacement size is given, the loser of a tournament of that 
+    size; the best tree is never replaced.
+
+    If a number of processes is given, offspring are scored across that
+    many forked worker processes, a new offspring being bred as soon as
+    any is scored, so that no worker waits on the others. Results then 
+    depend on the order in which scores arrive.
+    """
+    rng = as_random(rng)
+    if target_score is None:
+        target_score = getattr(scoring_function, '__max_score', None)
+
+    _crossover = functools.partial(crossover, rng=rng)
+    _mutate = functools.partial(mutate, rng=rng)
+    if max_depth is not None or max_nodes is not None:
+        build_tree = functools.partial(build_tree, max_depth=max_depth, max_nodes=max_nodes)
+        _crossover = functools.partial(_crossover, max_depth=max_depth, max_nodes=max_nodes)
+        _mutate = functools.partial(_mutate, max_depth=max_depth, max_nodes=max_nodes)
+    build_to_requirements = functools.partial(
+        build_tree_to_requirements,
+        build_tree=build_tree,
+        rng=rng,
+    )
+
+    population, scores = [], []
+    pending = {}  # {token: tree}
+    tokens = itertools.count()
+
+    def select():
+        contestants = rng.sample(xrange(len(population)), min(selection_size, len(population)))
+        return population[max(contestants, key=scores.__getitem__)]
+
+    def breed():
+        for __ in xrange(99):
+            try:
+                with recursion_limit(1500):
+                    if rng.random() <= crossover_rate:
+                        return _crossover(copy.deepcopy(select()), copy.deepcopy(select()))
+                    return _mutate(copy.deepcopy(select()))
+            except (UnsatisfiableType, RuntimeError):
+                continue
+        return build_to_requirements(scoring_function)
+
+    if processes:
+        from six.moves import queue
+        from monkeys.parallel import FunctionTable, fork_context
+
+        table = FunctionTable.from_registry()
+        _WORKER_SCORING[:] = [table, scoring_function]
+        pool = fork_context().Pool(processes)
+        results = queue.Queue()
+        max_pending = 2 * processes
+
+        def submit(tree):
+            token = next(tokens)
+            pending[token] = tree
+            pool.apply_async(_score_in_worker, (token, table.encode(tree)), callback=results.put)
+    else:
+        pool = None
+        results = collections.deque()
+        max_pending = 1
+
+        def submit(tree):
+            token = next(tokens)
+            pending[token] = tree
+            results.append((token, True, scoring_function(tree)))
+
+    def receive():
+        token, success, score = results.get() if processes else results.popleft()
+        if not success:
+            raise score
+        return pending.pop(token), score
+
+    print("Creating initial population of {}.".format(population_size))
+    sys.stdout.flush()
+    try:
+        with recursion_limit(600):
+            for __ in xrange(population_size):
+                submit(build_to_requirements(scoring_function))
+            while pending:
+                tree, score = receive()
+                population.append(tree)
+                scores.append(score)
+            best = max(xrange(population_size), key=scores.__getitem__)
+            evaluated = submitted = population_size
+
+            print("Optimizing...")
+            while evaluated < evaluations:
+                if target_score is not None and scores[best] >= target_score:
+                    print("Reached target score after {} evaluations.".format(evaluated))
+                    break
+                while len(pending) < max_pending and submitted < evaluations:
+                    submit(breed())
+                    submitted += 1
+                child, score = receive()
+                evaluated += 1
+
+                replaceable = [i for i in xrange(population_size) if i != best]
+                if replacement_size is not None:
+                    replaceable = rng.sample(replaceable, min(replacement_size, len(replaceable)))
+                if replaceable:
+                    loser = min(replaceable, key=scores.__getitem__)
+                    population[loser], scores[loser] = child, score
+                    if score > scores[best]:
+                        best = loser
+
+                if show_scores and not evaluated % population_size:
+                    non_failure_scores = [score for score in scores if score != -sys.maxsize]
+                    try:
+                        average_score = sum(non_failure_scores) / len(non_failure_scores)
+                    except ZeroDivisionError:
+                        average_score = -sys.maxsize
+                    print("Evaluations {}:\tBest: {:.2f}\tAverage: {:.2f}".format(
+                        evaluated,
+                        scores[best],
+                        average_score,
+                    ))
+                    sys.stdout.flush()
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+            _WORKER_SCORING[:] = []
+
+    return population[best]
+
+
+def ant_colony(evaporation_rate=AntColony.DEFAULT_EVAPORATION_RATE, rng=None):
+    """
+    Return ant colony over the registered functions, as used by 
+    ant_optimize, choosing children in proportion to the pheromone on
+    their edges.
+    """
+    return AntColony(
+        {
+            rtype: lookup_rtype(rtype, convert=False)
+            for rtype in
+            registered_types()
+        },
+        evaporation_rate=evaporation_rate,
+        rng=rng,
+        normalize_types=False,
+    )
+
+
+def ant_optimize(
+        scoring_function,
+        population_size=250,
+        iterations=25,
+        build_tree=build_tree,
+        evaporation_rate=AntColony.DEFAULT_EVAPORATION_RATE,
+        show_scores=True,
+        target_score=None,
+        rng=None,
+        deposit_fraction=0.1,
+    ):
+    """
+    Optimize using ant programming: rather than being varied through
+    crossover and mutation, each population is built afresh by an ant
+    colony, whose pheromone is reinforced along the parent-to-children
+    edges of the given fraction of each population scoring highest, in
+    proportion to their rank among them.
+    """
+    rng = as_random(rng)
+    scoring_function = count_calls(scoring_function)
+    if target_score is None:
+        target_score = getattr(scoring_function, '__max_score', None)
+
+    colony = ant_colony(evaporation_rate=evaporation_rate, rng=rng)
+    build_to_requirements = functools.partial(
+        build_tree_to_requirements,
+        build_tree=functools.partial(
+            build_tree,
+            selection_strategy=colony.select,
+        ),
+        rng=rng,
+    )
+
+    best_tree, best_score = None, -sys.maxsize
+
+    print("Optimizing...")
+    with recursion_limit(600):
+        for iteration in xrange(iterations):
+            population = [
+                build_to_requirements(scoring_function)
+                for __ in
+                xrange(population_size)
+            ]
+            scores = {tree: scoring_function(tree) for tree in population}
+
+            non_failure_scores = {
+                tree: score
+                for tree, score in
+                iteritems(scores)
+                if score != -sys.maxsize
+            }
+            if non_failure_scores:
+                ranked = sorted(non_failure_scores, key=non_failure_scores.get)
+                num_depositing = int(math.ceil(deposit_fraction * len(ranked)))
+                with colony.iteration():
+                    colony.deposit({
+                        tree: (i + 1) / float(num_depositing)
+                        for i, tree in
+                        enumerate(ranked[-num_depositing:])
+                    })
+            else:
+                colony.evaporate()
+
+            iteration_best = max(scores, key=scores.get)
+            if best_tree is None or scores[iteration_best] > best_score:
+                best_tree, best_score = iteration_best, scores[iteration_best]
+
+            if show_scores:
+                try:
+                    average_score = sum(itervalues(non_failure_scores)) / len(non_failure_scores)
+                except ZeroDivisionError:
+                    average_score = -sys.maxsize
+                print("Iteration {}:\tBest: {:.2f}\tAverage: {:.2f}\tEvaluations: {}".format(
+                    iteration + 1,
+                    best_score,
+                    average_score,
+                    scoring_function.calls,
+                ))
+                sys.stdout.flush()
+
+            if target_score is not None and best_score >= target_score:
+                print("Reached target score after {} evaluations.".format(
+                    scoring_function.calls
+                ))
+                break
+
     return best_tree
@@ -0,0 +1,166 @@
+"""Surrogate models predicting the scores of trees from their structure."""
+
+import math
+import zlib
+
+from monkeys.rng import as_random
+from monkeys.trees import get_tree_info
+
+
+def _hashed(name, dimensions):
+    """Return index and sign under which the named feature is counted."""
+    digest = zlib.crc32(name.encode('utf-8')) & 0xffffffff
+    return digest % dimensions, 1.0 if digest & 0x80000000 else -1.0
+
+
+def tree_features(tree, dimensions=256):
+    """
+    Return vector of features of the tree: a constant, its size and
+    depth, and counts of each function and parent-to-children edge,
+    hashed into the given number of dimensions.
+    """
+    import numpy
+
+    info = get_tree_info(tree)
+    features = numpy.zeros(3 + dimensions)
+    features[:3] = 1.0, math.log(2 + info.num_nodes), info.depth
+    functions = [tree.f] + [
+        categorized.node.f
+        for nodes in info.nodes_by_rtype.values()
+        for categorized in nodes
+    ]
+    for f in functions:
+        index, sign = _hashed('f:' + f.__name__, dimensions)
+        features[3 + index] += sign
+    for parent, children in info.graph_edges:
+        index, sign = _hashed('e:{}({})'.format(
+            parent.__name__,
+            ','.join(child.__name__ for child in children),
+        ), dimensions)
+        features[3 + index] += sign
+    return features
+
+
+def _ranks(values):
+    """Return ranks of the values from 0 to 1, ties sharing their mean rank."""
+    import numpy
+
+    values = numpy.asarray(values, dtype=float)
+    ranks = numpy.empty(len(values))
+    ranks[numpy.argsort(values, kind='mergesort')] = numpy.arange(len(values))
+    __, tied = numpy.unique(values, return_inverse=True)
+    ranks = (numpy.bincount(tied, ranks) / numpy.bincount(tied))[tied]
+    return ranks / max(len(values) - 1, 1)
+
+
+def _rank_correlation(first, second):
+    """Return Spearman rank correlation of two sequences, if defined."""
+    import numpy
+
+    if len(first) < 2:
+        return None
+    ranks = [_ranks(values) for values in (first, second)]
+    if not all(r.std() for r in ranks):
+        return None
+    return float(numpy.corrcoef(*ranks)[0, 1])
+
+
+class SurrogateModel(object):
+    """
+    Ridge regression from hashed features of trees to the ranks of their
+    scores within each population, trained online on the trees scored
+    during search. Only the given fraction of each population predicted
+    to rank highest is then scored, along with an exploration fraction
+    of the remainder, so that the model may learn from its mistakes.
+    Older observations decay in weight as the population changes.
+
+    The rank correlation of predicted and actual scores, and the number
+    of trees left unscored, are recorded in history for each population.
+    """
+
+    def __init__(self, fraction=0.5, exploration=0.1, dimensions=256, ridge=1.0, decay=0.8, min_samples=100):
+        self.fraction = fraction
+        self.exploration = exploration
+        self.dimensions = dimensions
+        self.ridge = ridge
+        self.decay = decay
+        self.min_samples = min_samples
+        self.samples = 0.0
+        self.skipped = 0
+        self.scored = 0
+        self.accuracy = None
+        self.history = []  # [(rank correlation, trees skipped)], one per population
+        self._gram = None
+        self._moments = None
+        self._weights = None
+        self._predictions = {}  # {tree: predicted rank}
+
+    def _features(self, trees):
+        import numpy
+
+        return numpy.array([tree_features(tree, self.dimensions) for tree in trees])
+
+    def predict(self, trees):
+        """Return array of predicted ranks of the trees, from 0 to 1."""
+        return self._features(trees).dot(self._weights)
+
+    def screen(self, trees, rng=None, keep=()):
+        """
+        Return the trees of the population which should be scored,
+        always including those given to keep.
+        """
+        import numpy
+
+        trees = list(trees)
+        self._predictions = {}
+        if self._weights is None or self.samples < self.min_samples:
+            return trees
+        rng = as_random(rng)
+        predictions = self.predict(trees)
+        order = numpy.argsort(-predictions, kind='mergesort')
+        num_promising = int(math.ceil(self.fraction * len(trees)))
+        chosen = set(order[:num_promising].tolist())
+        chosen.update(
+            i for i in order[num_promising:].tolist()
+            if rng.random() < self.exploration
+        )
+        keep = frozenset(keep)
+        chosen.update(i for i, tree in enumerate(trees) if tree in keep)
+        self._predictions = {trees[i]: predictions[i] for i in chosen}
+        self.skipped += len(trees) - len(chosen)
+        self.history.append((None, len(trees) - len(chosen)))
+        return [trees[i] for i in sorted(chosen)]
+
+    def update(self, scores):
+        """
+        Train on mapping of trees to their scores, recording the rank
+        correlation of those scores with any made predictions.
+        """
+        import numpy
+
+        trees = list(scores)
+        if not trees:
+            return
+        targets = _ranks([scores[tree] for tree in trees])
+
+        predicted = [i for i, tree in enumerate(trees) if tree in self._predictions]
+        if predicted:
+            self.accuracy = _rank_correlation(
+                [self._predictions[trees[i]] for i in predicted],
+                targets[predicted],
+            )
+            self.history[-1] = self.accuracy, self.history[-1][1]
+        self._predictions = {}
+
+        features = self._features(trees)
+        if self._gram is None:
+            self._gram = numpy.zeros((features.shape[1], features.shape[1]))
+            self._moments = numpy.zeros(features.shape[1])
+        self._gram = self.decay * self._gram + features.T.dot(features)
+        self._moments = self.decay * self._moments + features.T.dot(targets)
+        self.samples = self.decay * self.samples + len(trees)
+        self.scored += len(trees)
+        self._weights = numpy.linalg.solve(
+            self._gram + self.ridge * numpy.eye(len(self._moments)),
+            self._moments,
+        )
@@ -2,17 +2,24 @@
 
 from __future__ import print_function
 
-import functools
+import sys
+import heapq
+import random
 import operator
+import functools
+import itertools
+import traceback
 from collections import defaultdict, OrderedDict
 
-from six import iteritems
+from six import iteritems, itervalues
 from past.builtins import xrange
 
-from monkeys.typing import REGISTERED_TYPES, lookup_rtype
-from monkeys.trees import build_tree, get_tree_info
+from monkeys.rng import as_random, spawn
+from monkeys.typing import registered_types, lookup_rtype
+from monkeys.trees import Node, build_tree, get_tree_info
 from monkeys.exceptions import UnsatisfiableConstraint
 from monkeys.aco import AntColony, DEFAULT_PHEROMONE_TYPE
+from monkeys.parallel import FunctionTable, fork_context, picklable_exception
 
 
 class Diagnosis(object):
@@ -58,85 +65,585 @@ class Diagnosis(object):
                 print('    {:.2f} | {}'.format(weight, edge))
             
 
-def diagnose(target_type, test=None, sample_size=250, max_examples=10):
+def signature_by_repr(exception, tb):
+    """Distinguish exceptions by their representation, including values."""
+    return repr(exception)
+
+
+def signature_by_type(exception, tb):
+    """Distinguish exceptions by their type alone."""
+    return type(exception).__name__
+
+
+def signature_by_frame(exception, tb):
+    """Distinguish exceptions by their type and the frame raising them."""
+    filename, line_number, function_name, __ = traceback.extract_tb(tb)[-1]
+    return '{} at {}:{} in {}'.format(
+        type(exception).__name__,
+        filename,
+        line_number,
+        function_name,
+    )
+
+
+def _test_tree(tree, test, signature):
+    """Return signature of exception raised by tree under test, if any."""
+    try:
+        test(tree.evaluate())
+    except Exception as e:
+        return signature(e, sys.exc_info()[2])
+    return None
+
+
+class _Trials(object):
+    """
+    Builds and tests trees in-process, guided by an ant colony and
+    drawing from the given random number generator.
+    """
+
+    def __init__(self, colony, target_type, check, rng=None):
+        self.colony = colony
+        self.target_type = target_type
+        self.check = check
+        self.rng = as_random(rng)
+
+    def build(self, pheromone_type):
+        """Build tree, guided by pheromone of the given type if specified."""
+        if pheromone_type is None:
+            return build_tree(self.target_type, rng=self.rng)
+        return build_tree(
+            self.target_type,
+            selection_strategy=functools.partial(
+                self.colony.select,
+                pheromone_type=pheromone_type,
+                rng=self.rng,
+            ),
+            rng=self.rng,
+        )
+
+    def run(self, pheromone_types):
+        """
+        Build and test one tree per pheromone type (or an unguided tree, 
+        given None), yielding the pheromone type, tree, and exception 
+        encountered (if any) for each.
+        """
+        for pheromone_type in pheromone_types:
+            tree = self.build(pheromone_type)
+            yield pheromone_type, tree, self.check(tree)
+
+    def deposit(self, tree, pheromone_type):
+        self.colony.deposit({tree: 1.0}, pheromone_type=pheromone_type)
+
+    def evaporate(self):
+        self.colony.evaporate()
+
+    def close(self):
+        pass
+
+
+class _StructureInterner(object):
+    """
+    Assigns equal integers to structurally-identical trees. Nodes are
+    remembered by identity, so that trees sharing most of their nodes
+    are identified in time proportional only to their differences.
+    """
+
+    def __init__(self):
+        self._structures = {}  # {(function, value, (child ids)): id}
+        self._nodes = {}  # {id(node): (node, id)}
+
+    def __call__(self, node):
+        try:
+            return self._nodes[id(node)][1]
+        except KeyError:
+            pass
+        structure = node.f, node.value, tuple(self(child) for child in node.children)
+        structure_id = self._structures.setdefault(structure, len(self._structures))
+        self._nodes[id(node)] = node, structure_id
+        return structure_id
+
+
+def _subtrees(tree):
+    """
+    Return the path (as child indices), size, and node of every subtree 
+    of the given tree, in pre-order.
+    """
+    sizes = {}
+    def size(node):
+        sizes[id(node)] = 1 + sum(size(child) for child in node.children)
+        return sizes[id(node)]
+    size(tree)
+
+    subtrees = []
+    frontier = [((), tree)]
+    while frontier:
+        path, node = frontier.pop()
+        subtrees.append((path, sizes[id(node)], node))
+        frontier.extend(
+            (path + (i,), child)
+            for i, child in
+            reversed(list(enumerate(node.children)))
+        )
+    return subtrees
+
+
+def _replace_subtree(tree, path, replacement):
+    """Return copy of tree with the subtree at the given path replaced."""
+    if not path:
+        return replacement
+    index = path[0]
+    children = list(tree.children)
+    children[index] = _replace_subtree(children[index], path[1:], replacement)
+    return Node.from_children(tree.f, children, tree.value)
+
+
+def _shrink_candidates(tree, intern, terminals):
+    """
+    Yield variants of tree, smallest first, in which a subtree has been 
+    replaced by a terminal, one of its own descendants, or some other 
+    smaller subtree of the same return type.
+    """
+    subtrees = _subtrees(tree)
+    tree_size = subtrees[0][1]
+
+    replacements_by_rtype = defaultdict(dict)  # {rtype: {structure: (size, node)}}
+    for __, size, node in subtrees:
+        replacements_by_rtype[node.rtype].setdefault(intern(node), (size, node))
+    for rtype, replacements in iteritems(replacements_by_rtype):
+        if rtype not in terminals:
+            terminals[rtype] = [
+                Node.from_children(function, [])
+                for function in
+                lookup_rtype(rtype, convert=False)
+                if not function.allowed_children()
+            ]
+        for terminal in terminals[rtype]:
+            replacements.setdefault(intern(terminal), (1, terminal))
+
+    candidates = sorted(
+        (tree_size - size + replacement_size, path, structure)
+        for path, size, node in subtrees
+        for structure, (replacement_size, __) in
+        iteritems(replacements_by_rtype[node.rtype])
+        if replacement_size < size
+    )
+    replacements = {
+        structure: replacement
+        for replacements in
+        itervalues(replacements_by_rtype)
+        for structure, (__, replacement) in
+        iteritems(replacements)
+    }
+    for __, path, structure in candidates:
+        yield _replace_subtree(tree, path, replacements[structure])
+
+
+def shrink(tree, reproduces, max_evaluations=100):
+    """
+    Greedily shrink a tree for which reproduces(tree) holds, in the 
+    manner of delta debugging: subtrees are repeatedly replaced by 
+    terminals or smaller subtrees of matching type (including their 
+    own descendants), so long as the result still reproduces. Results 
+    are memoized by tree structure, and reproduces is called at most 
+    max_evaluations times.
+    """
+    intern = _StructureInterner()
+    terminals = {}
+    outcomes = {intern(tree): True}
+    evaluations = 0
+    improved = True
+    while improved:
+        improved = False
+        for candidate in _shrink_candidates(tree, intern, terminals):
+            structure = intern(candidate)
+            try:
+                reproduced = outcomes[structure]
+            except KeyError:
+                if evaluations >= max_evaluations:
+                    return tree
+                evaluations += 1
+                reproduced = outcomes[structure] = reproduces(candidate)
+            if reproduced:
+                tree = candidate
+                improved = True
+                break
+    return tree
+
+
+def _encode_pheromone_type(pheromone_type):
+    """Allow default pheromone type to survive pickling."""
+    return None if pheromone_type is DEFAULT_PHEROMONE_TYPE else pheromone_type
+
+
+def _decode_pheromone_type(pheromone_type):
+    return DEFAULT_PHEROMONE_TYPE if pheromone_type is None else pheromone_type
+
+
+def _trial_worker(tasks, results, trials, table):
+    """
+    Replay colony updates and run trials as instructed by the parent
+    process, until told to stop.
+    """
+    # Tests drawing from the random module should not share its state:
+    random.seed(trials.rng.getrandbits(64))
+    while True:
+        message = tasks.get()
+        if message is None:
+            return
+        updates, chunk_index, pheromone_types = message
+        try:
+            for update in updates:
+                if update is None:
+                    trials.evaporate()
+                    continue
+                encoded_tree, pheromone_type = update
+                trials.deposit(
+                    table.decode(encoded_tree),
+                    _decode_pheromone_type(pheromone_type),
+                )
+            outcomes = [
+                (table.encode(tree), exception)
+                for __, tree, exception in
+                trials.run(pheromone_types)
+            ]
+        except Exception as e:
+            results.put((chunk_index, False, picklable_exception(e)))
+        else:
+            results.put((chunk_index, True, outcomes))
+
+
+class _ParallelTrials(_Trials):
+    """
+    Builds and tests trees across forked worker processes, each holding
+    a replica of the ant colony and its own random number generator,
+    spawned from the parent's. Colony updates are applied in the 
+    parent and replayed by every worker at the start of the next batch 
+    of trials.
+    """
+
+    def __init__(self, colony, target_type, check, workers, rng=None):
+        super(_ParallelTrials, self).__init__(colony, target_type, check, rng)
+        self._table = FunctionTable.from_registry()
+        self._updates = []  # None for evaporation, else (tree, pheromone type)
+        context = fork_context()
+        self._results = context.Queue()
+        self._tasks = [context.Queue() for __ in xrange(workers)]
+        self._workers = [
+            context.Process(
+                target=_trial_worker,
+                args=(
+                    tasks,
+                    self._results,
+                    _Trials(colony, target_type, check, worker_rng),
+                    self._table,
+                ),
+            )
+            for tasks, worker_rng in
+            zip(self._tasks, spawn(self.rng, workers))
+        ]
+        for worker in self._workers:
+            worker.daemon = True
+            worker.start()
+
+    def run(self, pheromone_types):
+        pheromone_types = list(pheromone_types)
+        chunk_size = -(-len(pheromone_types) // len(self._tasks)) or 1
+        for i, tasks in enumerate(self._tasks):
+            # Every worker is messaged, so that all replay colony updates:
+            chunk = pheromone_types[i * chunk_size:(i + 1) * chunk_size]
+            tasks.put((self._updates, i, chunk))
+        self._updates = []
+
+        outcomes_by_chunk = {}
+        failures = []
+        for __ in self._tasks:
+            i, success, outcomes = self._results.get()
+            if success:
+                outcomes_by_chunk[i] = outcomes
+            else:
+                failures.append(outcomes)
+        if failures:
+            raise failures[0]
+        outcomes = (
+            outcome
+            for i in
+            sorted(outcomes_by_chunk)
+            for outcome in
+            outcomes_by_chunk[i]
+        )
+        for pheromone_type, (encoded_tree, exception) in zip(pheromone_types, outcomes):
+            yield pheromone_type, self._table.decode(encoded_tree), exception
+
+    def deposit(self, tree, pheromone_type):
+        super(_ParallelTrials, self).deposit(tree, pheromone_type)
+        self._updates.append((
+            self._table.encode(tree),
+            _encode_pheromone_type(pheromone_type),
+        ))
+
+    def evaporate(self):
+        super(_ParallelTrials, self).evaporate()
+        self._updates.append(None)
+
+    def close(self):
+        for tasks in self._tasks:
+            tasks.put(None)
+        for worker in self._workers:
+            worker.join()
+
+
+class _SmallestTrees(object):
+    """Bounded collection of the smallest trees added, by number of nodes."""
+
+    def __init__(self, max_trees):
+        self.max_trees = max_trees
+        self._heap = []  # [(-size, -insertion, tree)]
+        self._insertions = itertools.count()
+
+    def add(self, tree, size=None):
+        if size is None:
+            size = get_tree_info(tree).num_nodes
+        entry = -size, -next(self._insertions), tree
+        if len(self._heap) < self.max_trees:
+            heapq.heappush(self._heap, entry)
+        elif entry > self._heap[0]:
+            heapq.heapreplace(self._heap, entry)
+
+    def trees(self):
+        """Return trees held, smallest (then earliest) first."""
+        return [tree for __, __, tree in sorted(self._heap, reverse=True)]
+
+    def __iter__(self):
+        return iter(self.trees())
+
+
+def _top_edges(colony, exceptions, top):
+    """
+    Return the top-weighted edges (as parent and children) for each of 
+    the specified exceptions.
+    """
+    weighted_edges = defaultdict(list)
+    for parent, child_combination, exception, concentration in colony:
+        if concentration > 0 and exception in exceptions:
+            weighted_edges[exception].append(
+                (concentration, parent, child_combination)
+            )
+    return {
+        exception: [
+            (parent, child_combination)
+            for __, parent, child_combination in
+            heapq.nlargest(top, edges, key=operator.itemgetter(0))
+        ]
+        for exception, edges in
+        iteritems(weighted_edges)
+    }
+
+
+def diagnose(
+        target_type, 
+        test=None, 
+        sample_size=250, 
+        max_examples=10, 
+        workers=None, 
+        shrink_evaluations=100,
+        signature=signature_by_repr,
+        max_signatures=None,
+        patience=None,
+        top=3,
+        rng=None,
+    ):
     """
     Identify and localize exceptions encountered when evaluating
     trees of the specified target type. If a test is supplied, this
     will also be applied to evaluated trees.
+
+    If a number of workers is specified, trees are built and tested
+    across that many forked processes, with pheromone deposits merged
+    after each colony iteration.
+
+    The smallest reproduction of each exception is then shrunk, using
+    at most the specified number of shrink evaluations per exception.
+
+    Exceptions are told apart by the given signature function, called
+    with each exception and its traceback: signature_by_repr, 
+    signature_by_type, signature_by_frame, or a custom function. If a
+    maximum number of signatures is given, exceptions with signatures
+    beyond this are not tracked.
+
+    If patience is specified, reproduction stops early once the ranking
+    of the top edges for each exception has been unchanged for that 
+    many iterations.
+
+    Trees are built from the given random.Random instance or NumPy
+    Generator, from which each worker is given an independent stream.
+    """
+    for diagnosis in iter_diagnose(
+            target_type,
+            test=test,
+            sample_size=sample_size,
+            max_examples=max_examples,
+            workers=workers,
+            shrink_evaluations=shrink_evaluations,
+            signature=signature,
+            max_signatures=max_signatures,
+            patience=patience,
+            top=top,
+            rng=rng,
+        ):
+        pass
+    print("Done.")
+    return diagnosis
+
+
+def iter_diagnose(
+        target_type, 
+        test=None, 
+        sample_size=250, 
+        max_examples=10, 
+        workers=None, 
+        shrink_evaluations=100,
+        signature=signature_by_repr,
+        max_signatures=None,
+        patience=None,
+        top=3,
+        snapshot_interval=None,
+        rng=None,
+    ):
+    """
+    Perform diagnosis as with diagnose, yielding an interim Diagnosis
+    every snapshot_interval reproduction iterations (if specified), and
+    the final Diagnosis last.
     """
     colony = AntColony({
         rtype: lookup_rtype(rtype, convert=False)
         for rtype in 
-        REGISTERED_TYPES
-    })
+        registered_types()
+    }, rng=rng)
     
     if test is None:
         test = lambda x: None
-    
-    encountered_exceptions = defaultdict(list)
+    check = functools.partial(_test_tree, test=test, signature=signature)
+
+    if workers is not None and workers > 1:
+        trials = _ParallelTrials(colony, target_type, check, workers, rng)
+    else:
+        trials = _Trials(colony, target_type, check, rng)
+        workers = 1
+
+    try:
+        encountered_exceptions = _collect_exceptions(
+            trials, 
+            sample_size, 
+            max_examples, 
+            max_signatures,
+        )
+        
+        print("Reproducing exceptions...")
+        # Have every worker busy in each batch, even given few exceptions:
+        iterations_per_batch = -(-workers // len(encountered_exceptions))
+        remaining_iterations = sample_size
+        since_snapshot = 0
+        stable_iterations = 0
+        top_edges = None
+        while remaining_iterations > 0:
+            iterations = min(iterations_per_batch, remaining_iterations)
+            remaining_iterations -= iterations
+            _reproduce_exceptions(trials, encountered_exceptions, iterations)
+
+            if patience is not None:
+                previous_top_edges = top_edges
+                top_edges = _top_edges(colony, encountered_exceptions, top)
+                if top_edges == previous_top_edges:
+                    stable_iterations += iterations
+                else:
+                    stable_iterations = 0
+                if stable_iterations >= patience:
+                    print("Converged with {} iterations remaining.".format(
+                        remaining_iterations
+                    ))
+                    break
+
+            since_snapshot += iterations
+            if snapshot_interval and since_snapshot >= snapshot_interval:
+                since_snapshot = 0
+                yield Diagnosis(
+                    exceptions={
+                        exception: trees.trees()
+                        for exception, trees in
+                        iteritems(encountered_exceptions)
+                    },
+                    ant_colony=colony,
+                )
+    finally:
+        trials.close()
+
+    if shrink_evaluations:
+        print("Shrinking reproductions...")
+        for exception, trees in iteritems(encountered_exceptions):
+            smallest = trees.trees()[0]
+            shrunk = shrink(
+                smallest,
+                lambda t: check(t) == exception,
+                max_evaluations=shrink_evaluations,
+            )
+            if shrunk is not smallest:
+                trees.add(shrunk)
+
+    yield Diagnosis(
+        exceptions={
+            exception: trees.trees()
+            for exception, trees in
+            iteritems(encountered_exceptions)
+        },
+        ant_colony=colony,
+    )
+
+
+def _collect_exceptions(trials, sample_size, max_examples, max_signatures):
+    """
+    Sample trees without guidance, returning the smallest examples of 
+    each exception encountered.
+    """
+    encountered_exceptions = {}
     print("Collecting exception sample...")
-    with colony.iteration():
-        for __ in range(sample_size):
-            tree = build_tree(target_type)
-            try:
-                test(tree.evaluate())
-            except Exception as e:
-                exception = repr(e)
-                encountered_exceptions[exception].append(tree)
-            else:
-                exception = DEFAULT_PHEROMONE_TYPE
-            colony.deposit({tree: 1.0}, pheromone_type=exception)
+    for __, tree, exception in trials.run([None] * sample_size):
+        untracked = (
+            max_signatures is not None
+            and exception not in encountered_exceptions
+            and len(encountered_exceptions) >= max_signatures
+        )
+        if exception is None or untracked:
+            exception = DEFAULT_PHEROMONE_TYPE
+        else:
+            if exception not in encountered_exceptions:
+                encountered_exceptions[exception] = _SmallestTrees(max_examples)
+            encountered_exceptions[exception].add(tree)
+        trials.deposit(tree, exception)
+    trials.evaporate()
         
     if not encountered_exceptions:
         error_message = "Could not find any exceptions after {} trials."
         raise UnsatisfiableConstraint(error_message.format(sample_size))
         
     print("Discovered {} distinct exceptions.".format(len(encountered_exceptions)))
-    
-    print("Reproducing exceptions...")
-    size_cache = {}
-    def cached_size(tree):
-        tree_id = id(tree)
-        try:
-            return size_cache[tree_id]
-        except KeyError:
-            size = get_tree_info(tree).num_nodes
-            size_cache[tree_id] = size
-            return size
-        
-    for __ in xrange(sample_size):
-        with colony.iteration():
-            for exception in encountered_exceptions:
-                colony_select = functools.partial(
-                    colony.select,
-                    pheromone_type=exception
-                )
-                tree = build_tree(
-                    target_type,
-                    selection_strategy=colony_select
-                )
-                try:
-                    test(tree.evaluate())
-                except Exception as e:
-                    exception = repr(e)
-                else:
-                    exception = None
-                if exception not in encountered_exceptions:
-                    colony.deposit(
-                        {tree: 1.0}, 
-                        pheromone_type=DEFAULT_PHEROMONE_TYPE
-                    )
-                    continue
-                encountered_exceptions[exception].append(tree)
-                encountered_exceptions[exception] = sorted(
-                    encountered_exceptions[exception],
-                    key=cached_size
-                )[:max_examples]
-                colony.deposit({tree: 1.0}, pheromone_type=exception)
-                    
-    diagnosis = Diagnosis(
-        exceptions=encountered_exceptions,
-        ant_colony=colony
-    )
-    print("Done.")
-    return diagnosis
+    return encountered_exceptions
+
+
+def _reproduce_exceptions(trials, encountered_exceptions, iterations):
+    """
+    For the given number of colony iterations, build a tree guided by
+    each encountered exception's pheromone, recording reproductions.
+    """
+    pheromone_types = [
+        exception
+        for __ in xrange(iterations)
+        for exception in encountered_exceptions
+    ]
+    for __, tree, exception in trials.run(pheromone_types):
+        if exception not in encountered_exceptions:
+            trials.deposit(tree, DEFAULT_PHEROMONE_TYPE)
+            continue
+        encountered_exceptions[exception].add(tree)
+        trials.deposit(tree, exception)
+    for __ in xrange(iterations):
+        trials.evaporate()
@@ -3,15 +3,15 @@
 import itertools
 from collections import defaultdict
 
-import graphviz
-
-from monkeys.typing import REGISTERED_TYPES, lookup_rtype, prettify_converted_type
+from monkeys.typing import registered_types, lookup_rtype, prettify_converted_type
+from monkeys.trees import NO_VALUE
 
 
 def type_graph(simplify=False):
     """
     Render graph of current type system.
     """
+    import graphviz
     graph = graphviz.Digraph(format='svg')
     graph.node(
         u'\u03b5', 
@@ -27,7 +27,7 @@ def type_graph(simplify=False):
         edge_pairs.add(pair)
         
     simplified_graph = defaultdict(set)
-    for t in REGISTERED_TYPES:
+    for t in registered_types():
         targeting_functions = lookup_rtype(t, convert=False)
         pretty_t = prettify_converted_type(t)
         for targeting_function in targeting_functions:
@@ -71,7 +71,7 @@ def type_graph(simplify=False):
     end_states = {
         t
         for t in
-        map(prettify_converted_type, REGISTERED_TYPES)
+        map(prettify_converted_type, registered_types())
         if not simplified_graph[t]
         or simplified_graph[t] == {t}
     }
@@ -84,16 +84,24 @@ def type_graph(simplify=False):
     return graph
 
 
+def _node_label(node):
+    """Return label of node, showing the value of ephemeral constants."""
+    if node.value is not NO_VALUE:
+        return repr(node.value)
+    return str(node.f.__name__)
+
+
 def node_graph(node):
     """Create a graph representing a node."""
+    import graphviz
     graph = graphviz.Graph()
     counter = itertools.count(1)
-    graph.node('0', label=str(node.f.__name__))
+    graph.node('0', label=_node_label(node))
     frontier = [('0', child) for child in node.children]
     while frontier:
         parent, node = frontier.pop()
         node_num = str(next(counter))
-        graph.node(node_num, label=str(node.f.__name__))
+        graph.node(node_num, label=_node_label(node))
         graph.edge(parent, node_num)
         frontier.extend((node_num, child) for child in node.children)
     return graph
@@ -0,0 +1,303 @@
+"""Tools for exporting trees as standalone Python modules."""
+
+import re
+import math
+import inspect
+import textwrap
+import collections
+
+from six import iteritems, integer_types, text_type
+from six.moves import builtins
+
+from monkeys.trees import Input, NO_VALUE, get_tree_info
+from monkeys.exceptions import ExportError
+
+
+_DEF = re.compile(r'def\s+(\w+)\s*\(')
+
+_BATCH_TEMPLATE = '''
+def {name}_batch({args}):
+    """
+    Evaluate over NumPy arrays of inputs, broadcast together. Batches
+    raising any exception, including on division by zero or invalid
+    values, are evaluated again one element at a time.
+    """
+    arrays = numpy.broadcast_arrays({args})
+    try:
+        with numpy.errstate(divide='raise', invalid='raise'):
+            outputs = {name}({args})
+        return numpy.broadcast_to(outputs, arrays[0].shape)
+    except Exception:
+        outputs = [{name}(*row) for row in zip(*[a.ravel().tolist() for a in arrays])]
+        return numpy.array(outputs).reshape(arrays[0].shape)
+'''
+
+_CONSTANT_BATCH_TEMPLATE = '''
+def {name}_batch():
+    """Evaluate as a NumPy array."""
+    return numpy.asarray({name}())
+'''
+
+
+def _identifier(name):
+    """Return name with characters invalid in identifiers replaced."""
+    name = re.sub(r'\W', '_', name)
+    return '_' + name if not name or name[0].isdigit() else name
+
+
+def literal(value):
+    """Return source of a literal evaluating to the value."""
+    if type(value).__module__ == 'numpy' and getattr(value, 'ndim', None) == 0:
+        value = value.item()  # NumPy scalars, written as their builtin equivalents
+    if value is None or isinstance(value, integer_types + (bool, complex, bytes, text_type)):
+        return repr(value)
+    if isinstance(value, float):
+        if math.isinf(value) or math.isnan(value):
+            return "float('{!r}')".format(value)
+        return repr(value)
+    if isinstance(value, tuple):
+        return '({}{})'.format(', '.join(map(literal, value)), ',' if len(value) == 1 else '')
+    if isinstance(value, list):
+        return '[{}]'.format(', '.join(map(literal, value)))
+    if isinstance(value, dict):
+        return '{{{}}}'.format(', '.join(
+            '{}: {}'.format(literal(k), literal(v))
+            for k, v in
+            iteritems(value)
+        ))
+    if isinstance(value, (set, frozenset)) and value:
+        return '{}({{{}}})'.format(type(value).__name__, ', '.join(map(literal, value)))
+    if isinstance(value, (set, frozenset)):
+        return '{}()'.format(type(value).__name__)
+    raise ExportError("Cannot write {!r} as a literal.".format(value))
+
+
+def _referenced_names(code):
+    """Yield names of globals and free variables used by code and its nested code."""
+    for name in code.co_names + code.co_freevars:
+        yield name
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            for name in _referenced_names(const):
+                yield name
+
+
+class _ModuleWriter(object):
+    """Accumulates definitions of primitives, and the names they use."""
+
+    def __init__(self, reserved):
+        self.used = set(reserved)
+        self.names = {}  # {id(object): name}
+        self.objects = {}  # {name: object}, keeping objects alive for identity
+        self.imports = []
+        self.definitions = []
+
+    def unique(self, name):
+        """Return unused identifier resembling the name, reserving it."""
+        name = candidate = _identifier(name)
+        suffix = 1
+        while candidate in self.used:
+            suffix += 1
+            candidate = '{}_{}'.format(name, suffix)
+        self.used.add(candidate)
+        return candidate
+
+    def _claim(self, obj, name):
+        self.names[id(obj)] = name
+        self.objects[name] = obj
+        return name
+
+    def primitive(self, f, name=None):
+        """
+        Return name under which the function of a node is defined, by
+        default resembling its own.
+        """
+        try:
+            return self.names[id(f)]
+        except KeyError:
+            pass
+        if hasattr(f, 'ignored_exceptions'):
+            return self._ignoring(f, self.unique(name or f.__name__))
+        if inspect.isfunction(f):
+            return self._inline(f, self.unique(name or f.__name__))
+        return self.reference(f)
+
+    def _ignoring(self, f, name):
+        """Define function returning failure value on ignored exceptions."""
+        self._claim(f, name)
+        wrapped = self.primitive(f.wrapped, '_{}_wrapped'.format(name))
+        exceptions = [self.reference(exception) for exception in f.ignored_exceptions]
+        self.definitions.append(
+            'def {name}(*args):\n'
+            '    try:\n'
+            '        return {wrapped}(*args)\n'
+            '    except ({exceptions}):\n'
+            '        return {failure}\n'.format(
+                name=name,
+                wrapped=wrapped,
+                exceptions=', '.join(exceptions) + (',' if len(exceptions) == 1 else ''),
+                failure=literal(f.failure_value),
+            )
+        )
+        return name
+
+    def _inline(self, f, name):
+        """Define function from its source, without decorators, under the name."""
+        if hasattr(f, '__wrapped__'):
+            raise ExportError("{} is wrapped by a decorator other than ignore.".format(f.__name__))
+        try:
+            source = textwrap.dedent(inspect.getsource(f))
+        except (IOError, TypeError):
+            raise ExportError("Source of {} is unavailable.".format(f.__name__))
+        lines = source.splitlines(True)
+        start = next(
+            (i for i, line in enumerate(lines) if _DEF.match(line)),
+            None,
+        )
+        if start is None or _DEF.match(lines[start]).group(1) != f.__code__.co_name:
+            raise ExportError("Cannot find definition of {}.".format(f.__name__))
+        lines[start] = _DEF.sub('def {}('.format(name), lines[start], count=1)
+        self._claim(f, name)
+
+        closure = dict(zip(
+            f.__code__.co_freevars,
+            [cell.cell_contents for cell in f.__closure__ or ()],
+        ))
+        for referenced in collections.OrderedDict.fromkeys(_referenced_names(f.__code__)):
+            if referenced in closure:
+                self.bind(referenced, closure[referenced], f)
+            elif referenced in f.__globals__:
+                self.bind(referenced, f.__globals__[referenced], f)
+        self.definitions.append(''.join(lines[start:]))
+        return name
+
+    def bind(self, name, value, referrer):
+        """Define name used by the referring function to refer to the value."""
+        if self.objects.get(name, value) is not value:
+            raise ExportError("{} refers to different values in exported functions.".format(name))
+        if name in self.objects or getattr(builtins, name, None) is value:
+            return
+        if name in self.used:
+            raise ExportError("{} is used by more than one exported name.".format(name))
+        self.used.add(name)
+        if inspect.ismodule(value):
+            self._claim(value, name)
+            self.imports.append(
+                'import {}'.format(value.__name__) if name == value.__name__ else
+                'import {} as {}'.format(value.__name__, name)
+            )
+        elif hasattr(value, 'ignored_exceptions'):
+            self._ignoring(value, name)
+        elif inspect.isfunction(value) and value.__module__ == referrer.__module__:
+            self._inline(value, name)
+        else:
+            try:
+                self.definitions.append('{} = {}\n'.format(name, literal(value)))
+                self._claim(value, name)
+            except ExportError:
+                self._import(value, name)
+
+    def reference(self, obj):
+        """Return name of imported object, such as an exception class."""
+        try:
+            return self.names[id(obj)]
+        except KeyError:
+            pass
+        name = getattr(obj, '__name__', None)
+        if name is not None and getattr(builtins, name, None) is obj:
+            return self._claim(obj, name)
+        return self._import(obj, self.unique(name or 'imported'))
+
+    def _import(self, obj, name):
+        module = getattr(obj, '__module__', None)
+        path = getattr(obj, '__qualname__', getattr(obj, '__name__', None))
+        if module in (None, '__main__') or path is None or '.' in path or '<' in path:
+            raise ExportError("Cannot import {!r} by name.".format(obj))
+        self._claim(obj, name)
+        self.imports.append(
+            'from {} import {}'.format(module, path) if name == path else
+            'from {} import {} as {}'.format(module, path, name)
+        )
+        return name
+
+
+def export_tree(tree, inputs=None, name='evaluate', vectorize=False):
+    """
+    Return source of a Python module defining a function evaluating the
+    tree, independent of monkeys and its registry. The function takes
+    the values of inputs as arguments, in the order given - by default,
+    sorted by name. Primitives are copied from their source, without
+    decorators, along with the modules, values and functions they refer
+    to by name; the wrappers of ignore are written out as try/except
+    blocks. Constants are written as literals, and each distinct subtree
+    is evaluated once, primitives being assumed free of side effects.
+
+    If vectorize is specified, a function of the same name suffixed with
+    _batch is also defined, evaluating over NumPy arrays of inputs, for
+    primitives supporting them.
+    """
+    if inputs is None:
+        inputs = sorted(input_.__name__ for input_ in get_tree_info(tree).inputs)
+    inputs = [getattr(input_, '__name__', input_) for input_ in inputs]
+    arguments = {input_: _identifier(input_) for input_ in inputs}
+    name = _identifier(name)
+    writer = _ModuleWriter(list(arguments.values()) + [name, name + '_batch'])
+
+    expressions = {}  # {id(node): source}
+    temporaries = {}  # {(function name, argument sources): temporary name}
+    body = []
+    stack = [(tree, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if not children_done and node.children:
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(node.children))
+            continue
+        expressions[id(node)] = _expression(node, writer, arguments, expressions, temporaries, body)
+    numpy = writer.objects.get('numpy')
+    if vectorize and numpy is not None and getattr(numpy, '__name__', None) != 'numpy':
+        raise ExportError("numpy refers to other than NumPy in exported functions.")
+
+    lines = ['"""Evaluation of exported tree."""\n']
+    imports = list(collections.OrderedDict.fromkeys(
+        writer.imports + (['import numpy'] if vectorize else [])
+    ))
+    if imports:
+        lines.append('\n')
+        lines.extend(line + '\n' for line in imports)
+    for definition in writer.definitions:
+        lines.extend(['\n', '\n', definition])
+    args = ', '.join(arguments[input_] for input_ in inputs)
+    lines.extend(['\n', '\n', 'def {}({}):\n'.format(name, args)])
+    lines.extend('    {}\n'.format(statement) for statement in body)
+    lines.append('    return {}\n'.format(expressions[id(tree)]))
+    if vectorize:
+        lines.extend(['\n', (_BATCH_TEMPLATE if inputs else _CONSTANT_BATCH_TEMPLATE).format(
+            name=name,
+            args=args,
+        )])
+    return ''.join(lines)
+
+
+def _expression(node, writer, arguments, expressions, temporaries, body):
+    """
+    Return source of expression for the node's value, given those of its
+    children, appending any statement needed to compute it to the body.
+    """
+    if node.value is not NO_VALUE:
+        return literal(node.value)
+    f = node.f
+    if isinstance(f, Input):
+        try:
+            return arguments[f.__name__]
+        except KeyError:
+            raise ExportError("Input {} is not among those given.".format(f.__name__))
+    if hasattr(f, 'constant_value'):
+        return literal(f.constant_value)
+    if hasattr(f, 'lifted_function'):
+        return writer.primitive(f.lifted_function)
+    call = writer.primitive(f), tuple(expressions[id(child)] for child in node.children)
+    if call not in temporaries:
+        temporaries[call] = writer.unique('_t{}'.format(len(temporaries)))
+        body.append('{} = {}({})'.format(temporaries[call], call[0], ', '.join(call[1])))
+    return temporaries[call]
@@ -1,20 +1,93 @@
-import random
-import collections
 import copy
+import weakref
+import collections
 
 from past.builtins import xrange
 
-from monkeys.typing import lookup_rtype, rtype, params, prettify_converted_type
+from monkeys.rng import as_random
+from monkeys.typing import (
+    lookup_rtype, rtype, params, prettify_converted_type, current_registry,
+)
 from monkeys.exceptions import UnsatisfiableType, TreeConstructionError
 
 
 _REGISTERED_INPUTS = {}
+NO_VALUE = object()  # value of nodes other than ephemeral constants
+_MINIMUM_DIMENSIONS = weakref.WeakKeyDictionary()  # {registry: {allowed_functions: (version, dimensions)}}
+INFINITY = float('inf')
+
+
+MinimumDimensions = collections.namedtuple('MinimumDimensions', 'sizes depths')
+
+def minimum_dimensions(allowed_functions=None):
+    """
+    Return the minimum size and depth of trees rooted at each function
+    of the active registry, using only the allowed functions.
+    """
+    registry = current_registry()
+    cached = _MINIMUM_DIMENSIONS.setdefault(registry, {})
+    try:
+        version, dimensions = cached[allowed_functions]
+        if version == registry.version:
+            return dimensions
+    except KeyError:
+        pass
+
+    children = collections.OrderedDict()  # {function: [[child]]}
+    frontier = registry.functions()
+    while frontier:
+        new_frontier = []
+        for f in frontier:
+            if f in children:
+                continue
+            children[f] = [
+                [
+                    child for child in child_list 
+                    if allowed_functions is None or child in allowed_functions
+                ]
+                for child_list in
+                f.allowed_children()
+            ]
+            new_frontier.extend(
+                child 
+                for child_list in children[f] 
+                for child in child_list
+            )
+        frontier = new_frontier
+
+    sizes = dict.fromkeys(children, INFINITY)
+    depths = dict.fromkeys(children, INFINITY)
+    changed = True
+    while changed:
+        changed = False
+        for f, child_lists in children.items():
+            size = 1 + sum(
+                min([sizes[child] for child in child_list] or [INFINITY])
+                for child_list in child_lists
+            )
+            depth = 1 + max([
+                min([depths[child] for child in child_list] or [INFINITY])
+                for child_list in child_lists
+            ] or [0])
+            if size < sizes[f] or depth < depths[f]:
+                sizes[f], depths[f] = min(size, sizes[f]), min(depth, depths[f])
+                changed = True
+
+    dimensions = MinimumDimensions(sizes=sizes, depths=depths)
+    cached[allowed_functions] = registry.version, dimensions
+    return dimensions
 
 
 class Node(object):
-    def __init__(self, f, allowed_functions=None, selection_strategy=None):
+    value = NO_VALUE
+
+    def __init__(self, f, allowed_functions=None, selection_strategy=None, max_depth=None, max_nodes=None, rng=None):
+        rng = as_random(rng)
         self.f = f
         self.rtype = f.rtype
+        sample = getattr(f, 'sample', None)
+        if sample is not None:
+            self.value = sample(rng)
         
         allowed_children = self.f.allowed_children()
         if allowed_functions is not None:
@@ -23,6 +96,14 @@ class Node(object):
                 for child_list in 
                 allowed_children
             ]
+        if max_depth is not None or max_nodes is not None:
+            self._build_limited_children(
+                allowed_children, allowed_functions, selection_strategy, 
+                INFINITY if max_depth is None else max_depth,
+                INFINITY if max_nodes is None else max_nodes,
+                rng,
+            )
+            return
         if not all(allowed_children):
             raise UnsatisfiableType(
                 "{} has a parameter that cannot be satisfied.".format(self.f.__name__)
@@ -34,7 +115,7 @@ class Node(object):
             )
         else:
             child_choices = (
-                random.choice(child_list) 
+                rng.choice(child_list) 
                 for child_list in 
                 allowed_children
             )
@@ -43,16 +124,102 @@ class Node(object):
                 choice,
                 allowed_functions=allowed_functions,
                 selection_strategy=selection_strategy,
+                rng=rng,
             ) 
             for choice in 
             child_choices
         ]
         self.num_children = len(self.children)
 
+    def _build_limited_children(self, allowed_children, allowed_functions, selection_strategy, max_depth, max_nodes, rng):
+        """
+        Build children such that the node's subtree has at most the
+        given depth and number of nodes.
+        """
+        minimum = minimum_dimensions(allowed_functions)
+        allowed_children = [
+            [child for child in child_list if minimum.depths[child] < max_depth]
+            for child_list in 
+            allowed_children
+        ]
+        smallest = [
+            min([minimum.sizes[child] for child in child_list] or [INFINITY])
+            for child_list in 
+            allowed_children
+        ]
+        budget = max_nodes - 1
+        if not all(allowed_children) or sum(smallest) > budget:
+            raise UnsatisfiableType(
+                "{} has a parameter that cannot be satisfied.".format(self.f.__name__)
+            )
+
+        child_choices = None
+        if selection_strategy is not None:
+            child_choices = selection_strategy(
+                parent=self.f,
+                children=[
+                    [
+                        child for child in child_list 
+                        if minimum.sizes[child] <= budget - sum(smallest) + min_size
+                    ]
+                    for child_list, min_size in
+                    zip(allowed_children, smallest)
+                ],
+            )
+            if sum(minimum.sizes[choice] for choice in child_choices) > budget:
+                child_choices = None
+        if child_choices is None:
+            # Choose sequentially, leaving room for the smallest later children:
+            child_choices = []
+            remaining = budget
+            for i, child_list in enumerate(allowed_children):
+                choice = rng.choice([
+                    child for child in child_list
+                    if minimum.sizes[child] <= remaining - sum(smallest[i + 1:])
+                ])
+                child_choices.append(choice)
+                remaining -= minimum.sizes[choice]
+
+        self.children = []
+        remaining = budget
+        for i, choice in enumerate(child_choices):
+            child = Node(
+                choice,
+                allowed_functions=allowed_functions,
+                selection_strategy=selection_strategy,
+                max_depth=max_depth - 1,
+                max_nodes=remaining - sum(minimum.sizes[later] for later in child_choices[i + 1:]),
+                rng=rng,
+            )
+            self.children.append(child)
+            remaining -= get_tree_dimensions(child).sizes[child]
+        self.num_children = len(self.children)
+
+    @classmethod
+    def from_children(cls, f, children, value=NO_VALUE, rng=None):
+        """
+        Create node from given function and children, without selection.
+        Ephemeral constants are given the value specified, or else a 
+        newly-sampled value.
+        """
+        node = cls.__new__(cls)
+        node.f = f
+        node.rtype = f.rtype
+        node.children = list(children)
+        node.num_children = len(node.children)
+        sample = getattr(f, 'sample', None)
+        if sample is not None:
+            node.value = sample(as_random(rng)) if value is NO_VALUE else value
+        return node
+
     def evaluate(self):
+        if self.value is not NO_VALUE:
+            return self.value
         return self.f(*[child.evaluate() for child in self.children])
 
     def __str__(self):
+        if self.value is not NO_VALUE:
+            return repr(self.value)
         try:
             return self.f.to_string(self.children)
         except AttributeError:
@@ -88,6 +255,10 @@ class Input(object):
         
     def set_value(self, value):
         self.value = value
+
+    def __deepcopy__(self, memo):
+        """Share inputs between copied trees, so that they may be set by name."""
+        return self
         
     def __call__(self):
         return self.value
@@ -111,16 +282,31 @@ def find_functions(return_type, allowed_functions=None, convert=True):
     return list(allowable)
 
 
-def build_tree(return_type, allowed_functions=None, convert=True, selection_strategy=None):
+def build_tree(return_type, allowed_functions=None, convert=True, selection_strategy=None, max_depth=None, max_nodes=None, rng=None):
+    rng = as_random(rng)
     if allowed_functions is not None:
         allowed_functions = frozenset(allowed_functions)
     starting_functions = find_functions(return_type, allowed_functions, convert)
+    if max_depth is not None or max_nodes is not None:
+        minimum = minimum_dimensions(allowed_functions)
+        starting_functions = [
+            f for f in starting_functions
+            if minimum.depths[f] <= (INFINITY if max_depth is None else max_depth)
+            and minimum.sizes[f] <= (INFINITY if max_nodes is None else max_nodes)
+        ]
+        if not starting_functions:
+            raise UnsatisfiableType("No functions satisfying {} within size limits.".format(
+                (prettify_converted_type if not convert else str)(return_type)
+            ))
     for __ in xrange(99999):
         try:
             return Node(
-                random.choice(starting_functions), 
+                rng.choice(starting_functions), 
                 allowed_functions=allowed_functions,
                 selection_strategy=selection_strategy,
+                max_depth=max_depth,
+                max_nodes=max_nodes,
+                rng=rng,
             )
         except RuntimeError:
             pass
@@ -169,30 +355,167 @@ def get_tree_info(tree):
     )
 
 
-def mutate(tree, allowed_functions=None):
+TreeDimensions = collections.namedtuple('TreeDimensions', 'sizes depths levels')
+
+def get_tree_dimensions(tree):
+    """
+    Return the size and depth of the subtree rooted at each node of the
+    tree, and the level at which each node sits, the root being at 
+    level 1.
+    """
+    levels = {tree: 1}
+    order = [tree]
+    for node in order:
+        for child in node.children:
+            levels[child] = levels[node] + 1
+            order.append(child)
+    sizes, depths = {}, {}
+    for node in reversed(order):
+        sizes[node] = 1 + sum(sizes[child] for child in node.children)
+        depths[node] = 1 + max([depths[child] for child in node.children] or [0])
+    return TreeDimensions(sizes=sizes, depths=depths, levels=levels)
+
+
+def structural_key(tree):
+    """
+    Return hashable key identifying tree by structure, such that 
+    structurally identical trees have equal keys.
+
+    As each function takes a fixed number of children, the functions
+    of the tree's nodes in pre-order identify it; keys are kept flat so
+    that deep trees can be hashed and compared without recursion.
+    """
+    key = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        key.append(node.f if node.value is NO_VALUE else (node.f, node.value))
+        stack.extend(reversed(node.children))
+    return tuple(key)
+
+
+def mutate(tree, allowed_functions=None, max_depth=None, max_nodes=None, rng=None):
+    """
+    Replace a randomly chosen subtree with a newly built one, such that
+    the tree has at most the given depth and number of nodes.
+    """
+    rng = as_random(rng)
     treeinfo = get_tree_info(tree)
     if not treeinfo.num_nodes:
         return tree
     nodes_by_rtype = treeinfo.nodes_by_rtype
-    chosen_rtype = random.choice(list(nodes_by_rtype.keys()))
-    chosen_node = random.choice(nodes_by_rtype[chosen_rtype])
-    chosen_node.parent.children[chosen_node.index] = build_tree(chosen_rtype, allowed_functions, convert=False)
+    if max_depth is None and max_nodes is None:
+        chosen_rtype = rng.choice(list(nodes_by_rtype.keys()))
+        chosen_node = rng.choice(nodes_by_rtype[chosen_rtype])
+        chosen_node.parent.children[chosen_node.index] = build_tree(chosen_rtype, allowed_functions, convert=False, rng=rng)
+        return tree
+
+    if allowed_functions is not None:
+        allowed_functions = frozenset(allowed_functions)
+    max_depth = INFINITY if max_depth is None else max_depth
+    max_nodes = INFINITY if max_nodes is None else max_nodes
+    minimum = minimum_dimensions(allowed_functions)
+    dimensions = get_tree_dimensions(tree)
+    budgets = {}  # {rtype: [(categorized_node, depth_budget, size_budget)]}
+    for node_rtype, nodes in nodes_by_rtype.items():
+        functions = find_functions(node_rtype, allowed_functions, convert=False)
+        min_depth = min([minimum.depths[f] for f in functions] or [INFINITY])
+        min_size = min([minimum.sizes[f] for f in functions] or [INFINITY])
+        feasible = [
+            (
+                node, 
+                max_depth - dimensions.levels[node.node] + 1,
+                max_nodes - dimensions.sizes[tree] + dimensions.sizes[node.node],
+            )
+            for node in nodes
+        ]
+        feasible = [
+            budget for budget in feasible 
+            if min_depth <= budget[1] and min_size <= budget[2]
+        ]
+        if feasible:
+            budgets[node_rtype] = feasible
+    if not budgets:
+        return tree
+    chosen_rtype = rng.choice(list(budgets))
+    chosen_node, depth_budget, size_budget = rng.choice(budgets[chosen_rtype])
+    chosen_node.parent.children[chosen_node.index] = build_tree(
+        chosen_rtype, allowed_functions, convert=False, 
+        max_depth=depth_budget, max_nodes=size_budget, rng=rng,
+    )
     return tree
 
 
-def crossover(first_tree, second_tree=None):
+def crossover(first_tree, second_tree=None, max_depth=None, max_nodes=None, rng=None):
+    """
+    Replace a randomly chosen subtree of one tree with a copy of a 
+    subtree of the same type from the other, such that the resulting
+    tree has at most the given depth and number of nodes.
+    """
+    rng = as_random(rng)
     first_tree_info = get_tree_info(first_tree)
     if second_tree is None:
         sending_tree_info, receiving_tree_info = first_tree_info, first_tree_info
+        sending_tree, receiving_tree = first_tree, first_tree
     else:
-        sending_tree_info, receiving_tree_info = (first_tree_info, get_tree_info(second_tree))[::random.choice((-1, 1))]
+        (sending_tree_info, sending_tree), (receiving_tree_info, receiving_tree) = (
+            (first_tree_info, first_tree), 
+            (get_tree_info(second_tree), second_tree),
+        )[::rng.choice((-1, 1))]
     mutual_rtypes = list(frozenset(sending_tree_info.nodes_by_rtype) & frozenset(receiving_tree_info.nodes_by_rtype))
     if not mutual_rtypes:
         raise UnsatisfiableType("Trees are not compatible.")
-    chosen_rtype = random.choice(mutual_rtypes)
-    chosen_node = random.choice(receiving_tree_info.nodes_by_rtype[chosen_rtype])
-    chosen_replacement = random.choice(sending_tree_info.nodes_by_rtype[chosen_rtype])
+    if max_depth is None and max_nodes is None:
+        chosen_rtype = rng.choice(mutual_rtypes)
+        chosen_node = rng.choice(receiving_tree_info.nodes_by_rtype[chosen_rtype])
+        chosen_replacement = rng.choice(sending_tree_info.nodes_by_rtype[chosen_rtype])
+    else:
+        chosen_node, chosen_replacement = _choose_limited_crossover_points(
+            mutual_rtypes,
+            receiving_tree, receiving_tree_info, 
+            sending_tree, sending_tree_info,
+            INFINITY if max_depth is None else max_depth,
+            INFINITY if max_nodes is None else max_nodes,
+            rng,
+        )
     chosen_node.parent.children[chosen_node.index] = copy.deepcopy(chosen_replacement.node)
-    if second_tree is None:
-        return first_tree
-    return first_tree if first_tree_info is receiving_tree_info else second_tree
+    return receiving_tree
+
+
+def _choose_limited_crossover_points(
+        rtypes, 
+        receiving_tree, receiving_tree_info, 
+        sending_tree, sending_tree_info, 
+        max_depth, max_nodes, rng
+    ):
+    """
+    Choose node of the receiving tree and replacement from the sending
+    tree, such that the receiving tree respects the given limits once
+    the replacement is made.
+    """
+    receiving_dimensions = get_tree_dimensions(receiving_tree)
+    sending_dimensions = (
+        receiving_dimensions 
+        if sending_tree is receiving_tree else 
+        get_tree_dimensions(sending_tree)
+    )
+    receiving_size = receiving_dimensions.sizes[receiving_tree]
+    rtypes = list(rtypes)
+    rng.shuffle(rtypes)
+    for chosen_rtype in rtypes:
+        replacements = sending_tree_info.nodes_by_rtype[chosen_rtype]
+        feasible = []  # [(node, [replacement])]
+        for node in receiving_tree_info.nodes_by_rtype[chosen_rtype]:
+            depth_budget = max_depth - receiving_dimensions.levels[node.node] + 1
+            size_budget = max_nodes - receiving_size + receiving_dimensions.sizes[node.node]
+            feasible_replacements = [
+                replacement for replacement in replacements
+                if sending_dimensions.depths[replacement.node] <= depth_budget
+                and sending_dimensions.sizes[replacement.node] <= size_budget
+            ]
+            if feasible_replacements:
+                feasible.append((node, feasible_replacements))
+        if feasible:
+            chosen_node, feasible_replacements = rng.choice(feasible)
+            return chosen_node, rng.choice(feasible_replacements)
+    raise UnsatisfiableType("Trees cannot be crossed within size limits.")
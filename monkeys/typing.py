@@ -1,3 +1,4 @@
+import random
 import functools
 import collections
 
@@ -5,8 +6,123 @@ from past.builtins import basestring
 from six import iterkeys, itervalues
 
 
-REGISTERED_TYPES = set()
-_STRING_TYPE_MAPPINGS = {}
+class Registry(object):
+    """
+    Registry of types, and of functions and constants by return type.
+    
+    The active registry, in which functions are registered and looked 
+    up, may be scoped using ``with registry:``. Snapshots share function
+    listings with the registry they are taken from until either is 
+    modified.
+
+    Lifted versions of functions, for use with higher-order functions,
+    are only registered once their function type is first looked up.
+    """
+
+    def __init__(self):
+        self.types = set()
+        self.string_types = {}
+        self._functions = {}  # {rtype: OrderedDict({function: None})}
+        self._listings = {}  # {rtype: [function]}
+        self._shared = set()  # rtypes whose functions are shared with a snapshot
+        self._first_class_types = set()  # function types with lifted functions registered
+        self.version = 0  # incremented on modification
+
+    def snapshot(self):
+        """Return a copy-on-write copy of the registry."""
+        snapshot = Registry()
+        snapshot.types = set(self.types)
+        snapshot.string_types = dict(self.string_types)
+        snapshot._functions = dict(self._functions)
+        snapshot._listings = dict(self._listings)
+        self._shared.update(self._functions)
+        snapshot._shared = set(self._functions)
+        snapshot._first_class_types = set(self._first_class_types)
+        return snapshot
+
+    def _writable_functions(self, rtype):
+        """Return functions of the given rtype, unshared for modification."""
+        self.version += 1
+        self._listings.pop(rtype, None)
+        if rtype in self._shared:
+            self._shared.discard(rtype)
+            self._functions[rtype] = collections.OrderedDict(self._functions[rtype])
+        return self._functions.setdefault(rtype, collections.OrderedDict())
+
+    def register(self, rtype, f):
+        """Register function under the given (converted) return type."""
+        self._writable_functions(rtype)[f] = None
+
+    def register_first_class(self, f):
+        """
+        Register lifted version of function, if functions of its type 
+        have already been looked up.
+        """
+        if f.first_class_type in self._first_class_types:
+            self.register(f.first_class_type, first_class_function(f))
+
+    def deregister(self, f):
+        """Remove function, and its lifted version, from the registry."""
+        lifted = getattr(f, 'first_class_function', None)
+        if lifted is not None:
+            self.deregister(lifted)
+        rtype = getattr(f, 'rtype', None)
+        if f in self._functions.get(rtype, ()):
+            del self._writable_functions(rtype)[f]
+            return
+        for rtype, functions in list(self._functions.items()):
+            if f in functions:
+                del self._writable_functions(rtype)[f]
+
+    def lookup(self, rtype):
+        """Return list of functions registered under the given return type."""
+        try:
+            return self._listings[rtype]
+        except KeyError:
+            pass
+        if is_function_type(rtype) and rtype not in self._first_class_types:
+            self._first_class_types.add(rtype)
+            __, __, return_type = rtype
+            for f in self.lookup(return_type):
+                if getattr(f, 'first_class_type', None) == rtype:
+                    self.register(rtype, first_class_function(f))
+        listing = self._listings[rtype] = list(self._functions.get(rtype, ()))
+        return listing
+
+    def functions(self):
+        """Return all registered functions, grouped by return type."""
+        return list(collections.OrderedDict(
+            (f, None)
+            for functions in
+            itervalues(self._functions)
+            for f in
+            functions
+        ))
+
+    def __enter__(self):
+        _ACTIVE_REGISTRIES.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _ACTIVE_REGISTRIES.pop()
+
+
+DEFAULT_REGISTRY = Registry()
+_ACTIVE_REGISTRIES = [DEFAULT_REGISTRY]
+
+# Types and string type mappings of the default registry:
+REGISTERED_TYPES = DEFAULT_REGISTRY.types
+_STRING_TYPE_MAPPINGS = DEFAULT_REGISTRY.string_types
+
+
+def current_registry():
+    """Return the active registry."""
+    return _ACTIVE_REGISTRIES[-1]
+
+
+def registered_types():
+    """Return the types registered with the active registry."""
+    return current_registry().types
 
 
 _func = collections.namedtuple('Function', 'params rtype')
@@ -16,6 +132,11 @@ def func(*args):
     return _func(tuple(args[:-1]), args[-1])
 
 
+def is_function_type(t):
+    """Determine whether internal type is that of a first-class function."""
+    return isinstance(t, tuple) and len(t) == 3 and t[0] is _func
+
+
 def __id(x):
     """Identity function."""
     return x
@@ -38,16 +159,17 @@ def convert_type(t):
             convert_type(t.rtype)
         )
     elif isinstance(t, basestring):
+        string_types = current_registry().string_types
         try:
-            converted = _STRING_TYPE_MAPPINGS[t]
+            converted = string_types[t]
         except KeyError:
             converted = type(t, (object,), {})
-            _STRING_TYPE_MAPPINGS[t] = converted
+            string_types[t] = converted
     elif isinstance(t, collections.Iterable):
         converted = (collections.Iterable, convert_type(t[0]))
     else:
         converted = t
-    REGISTERED_TYPES.add(converted)
+    current_registry().types.add(converted)
     return converted
 
 
@@ -76,27 +198,36 @@ def prettify_converted_type(t):
 
 def __type_annotations_factory():
     """Create rtype, params, constant, and lookup_rtype functions."""
-    RTYPES = collections.defaultdict(list)
+    def annotate_rtype(f, return_type):
+        """Record (converted) return type on function."""
+        f.readable_rtype = prettify_converted_type(return_type)
+        f.rtype = return_type
 
-    def register_first_class_function(f):
+    def first_class_function(f):
         """
-        Register lifted version of function for use with higher-order 
-        functions.
+        Return lifted version of function for use with higher-order 
+        functions, creating it if necessary.
         """
-        @params(convert=False, first_class=False)
-        @rtype((_func, f.__params, f.rtype), convert=False, first_class=False)
-        def const_f():
-            return f
-        const_f.__name__ = '_FC_{}'.format(f.__name__)
+        lifted = getattr(f, 'first_class_function', None)
+        if lifted is None:
+            @params(convert=False, first_class=False)
+            def const_f():
+                return f
+            annotate_rtype(const_f, f.first_class_type)
+            const_f.__name__ = '_FC_{}'.format(f.__name__)
+            const_f.lifted_function = f
+            lifted = f.first_class_function = const_f
+        return lifted
 
     def check_for_registration(f):
         """
         Determine if a function has had both return type and parameter 
-        types specified, registering it as a first-class function if 
-        so.
+        types specified, making it available as a first-class function 
+        if so.
         """
         if hasattr(f, 'rtype') and hasattr(f, '__params'):
-            register_first_class_function(f)
+            f.first_class_type = (_func, f.__params, f.rtype)
+            current_registry().register_first_class(f)
             return True
 
     def allowed_children_factory(param_types):
@@ -104,7 +235,11 @@ def __type_annotations_factory():
         Return a list of the appropriately-typed constants and functions 
         conforming to each of the specified parameter types.
         """
-        return lambda: [RTYPES[param_type] for param_type in param_types]
+        return lambda: [
+            current_registry().lookup(param_type)
+            for param_type in 
+            param_types
+        ]
 
     def rtype(return_type, convert=True, first_class=True):
         """Specify the return type of a function."""
@@ -112,9 +247,8 @@ def __type_annotations_factory():
         check = check_for_registration if first_class else __id
         def decorator(f):
             _return_type = _convert_type(return_type)
-            RTYPES[_return_type].append(f)
-            f.readable_rtype = prettify_converted_type(_return_type)
-            f.rtype = _return_type
+            current_registry().register(_return_type, f)
+            annotate_rtype(f, _return_type)
             check(f)
             return f
         return decorator
@@ -140,6 +274,7 @@ def __type_annotations_factory():
         def _const():
             return value
         _const.__name__ += '_' + str(value)
+        _const.constant_value = value
         return value
     
     def free(target_type, source_type):
@@ -156,23 +291,42 @@ def __type_annotations_factory():
 
     def lookup_rtype(return_type, convert=True):
         """Find functions and constants of the given return type."""
-        return RTYPES[(convert_type if convert else __id)(return_type)]
+        return current_registry().lookup(
+            (convert_type if convert else __id)(return_type)
+        )
     
     def deregister(fn):
         """Remove function from usage."""
-        for fn_list in RTYPES.values():
-            try:
-                fn_list.remove(fn)
-            except ValueError:
-                continue
+        current_registry().deregister(fn)
+
+    return rtype, params, constant, free, lookup_rtype, deregister, first_class_function
+
 
-    return rtype, params, constant, free, lookup_rtype, deregister
+(
+    rtype, params, constant, free, lookup_rtype, deregister, first_class_function
+) = __type_annotations_factory()
 
 
-rtype, params, constant, free, lookup_rtype, deregister = __type_annotations_factory()
+def ephemeral(return_type, sample):
+    """
+    Register an ephemeral constant under the given type, whose value is
+    drawn by calling sample with a random number generator as each node
+    is built, and stored on the node.
+    """
+    @params()
+    @rtype(return_type)
+    def _ephemeral():
+        return sample(random)
+    _ephemeral.__name__ += '_' + prettify_converted_type(_ephemeral.rtype)
+    _ephemeral.sample = sample
+    return _ephemeral
 
 
 def ignore(failure_value, *exceptions):
+    """
+    Return the failure value in place of raising any of the exceptions,
+    recording both, and the wrapped function, on the wrapper.
+    """
     def decorator(f):
         @functools.wraps(f)
         def wrapper(*args, **kwargs):
@@ -180,5 +334,8 @@ def ignore(failure_value, *exceptions):
                 return f(*args, **kwargs)
             except exceptions:
                 return failure_value
+        wrapper.wrapped = f
+        wrapper.failure_value = failure_value
+        wrapper.ignored_exceptions = exceptions
         return wrapper
     return decorator
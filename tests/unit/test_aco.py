@@ -0,0 +1,102 @@
+"""Tests for monkeys/aco.py"""
+
+import random
+
+import pytest
+
+from monkeys.typing import params, rtype, lookup_rtype
+from monkeys.trees import build_tree
+from monkeys.aco import AntColony, DEFAULT_PHEROMONE_TYPE
+from monkeys.exceptions import UnsatisfiableConstraint
+
+
+@params()
+@rtype('AcoLeaf')
+def aco_left():
+    return 'left'
+
+
+@params()
+@rtype('AcoLeaf')
+def aco_right():
+    return 'right'
+
+
+@params('AcoLeaf', 'AcoLeaf')
+@rtype('AcoRoot')
+def aco_pair(first, second):
+    return first, second
+
+
+def make_colony():
+    return AntColony({
+        rtype: lookup_rtype(rtype)
+        for rtype in
+        ('AcoLeaf', 'AcoRoot')
+    })
+
+
+def test_select_respects_child_constraints():
+    """
+    Ensure that only child combinations satisfying the supplied
+    constraints are selected.
+    """
+    colony = make_colony()
+    for __ in range(25):
+        first, second = colony.select(
+            aco_pair,
+            children=[[aco_left], [aco_left, aco_right]]
+        )
+        assert first is aco_left
+
+    with pytest.raises(UnsatisfiableConstraint):
+        colony.select(aco_pair, children=[[], [aco_left]])
+
+
+def test_select_follows_deposited_pheromone():
+    """
+    Ensure that cached selection weights are refreshed once pheromone
+    is deposited.
+    """
+    random.seed(0)
+    colony = make_colony()
+    pheromone_type = 'aco-test'
+    colony.select(aco_pair, pheromone_type=pheromone_type)  # warm cache
+
+    tree = build_tree('AcoRoot')
+    target = tuple(child.f for child in tree.children)
+    for __ in range(10):
+        colony.deposit({tree: 1.0}, pheromone_type=pheromone_type)
+        colony.evaporate()
+
+    selections = [
+        colony.select(aco_pair, pheromone_type=pheromone_type)
+        for __ in range(25)
+    ]
+    assert all(selection == target for selection in selections)
+
+
+def test_evaporation_decays_reported_concentrations():
+    """
+    Ensure that concentrations reported by the colony reflect deposits
+    and evaporation, including across renormalization.
+    """
+    colony = make_colony()
+    colony.RENORMALIZATION_THRESHOLD = 0.5
+    tree = build_tree('AcoRoot')
+    edge = tuple(child.f for child in tree.children)
+    pheromone_type = 'aco-decay-test'
+
+    colony.deposit({tree: 1.0}, pheromone_type=pheromone_type)
+    for __ in range(20):
+        colony.evaporate()
+
+    concentrations = {
+        (parent, children, p_type): concentration
+        for parent, children, p_type, concentration in
+        colony
+    }
+    decay = (1 - AntColony.DEFAULT_EVAPORATION_RATE) ** 20
+    assert concentrations[aco_pair, edge, pheromone_type] == pytest.approx(decay / 2)
+    assert concentrations[aco_pair, edge, DEFAULT_PHEROMONE_TYPE] == pytest.approx(decay)
+
@@ -0,0 +1,79 @@
+"""Tests for monkeys/asts.py"""
+
+import ast
+
+from monkeys.asts import quoted_template, as_module, CodeCache
+
+
+def dumps(nodes):
+    return [ast.dump(node) for node in nodes]
+
+
+def name(id_):
+    return ast.Name(id=id_, ctx=ast.Load())
+
+
+def test_quoted_template_fills_slots():
+    """
+    Ensure that templates are populated as if written out in source,
+    placing arguments as expressions or statements as appropriate.
+    """
+    @quoted_template
+    def template(target, value, statements):
+        target = -value
+        statements
+        if value:
+            statements
+
+    populated = template(
+        name('y'),
+        [ast.Expr(value=name('x'))],
+        [ast.Expr(value=ast.Num(n=1)), ast.Pass()],
+    )
+    expected = ast.parse('y = -x\n1\npass\nif x:\n    1\n    pass').body
+    assert dumps(populated) == dumps(expected)
+    compile(as_module(populated), '<string>', 'exec')
+
+
+def test_quoted_template_copies_repeated_arguments():
+    """
+    Ensure that arguments used more than once are not shared within the
+    populated template, and that results may be cached by structure.
+    """
+    @quoted_template(cache_size=2)
+    def square(x):
+        x * x
+
+    populated, = square(name('x'))
+    assert populated.value.left is not populated.value.right
+
+    @quoted_template
+    def guarded(condition):
+        if condition:
+            pass
+
+    first, = guarded(name('x'))
+    second, = guarded(name('x'))
+    assert first.body[0] is not second.body[0]
+    assert square(name('x')) is square(name('x'))
+    assert square(name('x')) is not square(name('y'))
+
+
+def test_code_cache(tmpdir):
+    """
+    Ensure that structurally identical bodies are compiled once, and
+    that compiled code is reused across caches sharing a directory.
+    """
+    def body():
+        return ast.parse('def double(x):\n    return 2 * x').body
+
+    cache = CodeCache(maxsize=1, directory=str(tmpdir))
+    double = cache.function(body(), 'double')
+    assert double(3) == 6
+    assert cache.compile(body()) is cache.compile(body())
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    cache.compile(ast.parse('pass').body)
+    persisted = CodeCache(directory=str(tmpdir))
+    assert persisted.function(body(), 'double')(4) == 8
+    assert (persisted.hits, persisted.misses) == (1, 0)
@@ -0,0 +1,127 @@
+"""Tests for monkeys/tools/diagnostics.py"""
+
+import random
+
+import pytest
+
+from monkeys.typing import params, rtype
+from monkeys.trees import Node
+from monkeys.tools.diagnostics import (
+    diagnose, iter_diagnose, shrink, signature_by_type, Diagnosis
+)
+
+
+@params()
+@rtype('DiagnosticsNum')
+def diagnostics_zero():
+    return 0
+
+
+@params()
+@rtype('DiagnosticsNum')
+def diagnostics_one():
+    return 1
+
+
+@params('DiagnosticsNum', 'DiagnosticsNum')
+@rtype('DiagnosticsNum')
+def diagnostics_div(x, y):
+    return x // y
+
+
+ZERO_DIVISION = repr(ZeroDivisionError('integer division or modulo by zero'))
+
+
+@pytest.mark.parametrize('workers', [None, 2])
+def test_diagnose_reproduces_exceptions(workers):
+    """
+    Ensure that diagnose discovers and reproduces exceptions, whether
+    run serially or across worker processes.
+    """
+    random.seed(0)
+    diagnosis = diagnose('DiagnosticsNum', sample_size=20, workers=workers)
+
+    assert diagnosis.exceptions == [ZERO_DIVISION]
+    reproduction = diagnosis.minimal_reproductions[ZERO_DIVISION]
+    with pytest.raises(ZeroDivisionError):
+        reproduction.evaluate()
+    assert diagnosis.edge_weightings[ZERO_DIVISION]
+
+
+def test_shrink_finds_smaller_reproduction():
+    """
+    Ensure that shrinking replaces subtrees while the exception still
+    reproduces, without exceeding its evaluation budget.
+    """
+    leaf = lambda f: Node.from_children(f, [])
+    div = lambda x, y: Node.from_children(diagnostics_div, [x, y])
+    tree = div(
+        div(leaf(diagnostics_one), leaf(diagnostics_one)),
+        div(leaf(diagnostics_one), div(leaf(diagnostics_zero), leaf(diagnostics_one))),
+    )
+
+    evaluations = []
+    def reproduces(candidate):
+        evaluations.append(candidate)
+        try:
+            candidate.evaluate()
+        except ZeroDivisionError:
+            return True
+        return False
+
+    shrunk = shrink(tree, reproduces, max_evaluations=50)
+    assert len(evaluations) <= 50
+    assert shrunk.f is diagnostics_div
+    assert [child.f for child in shrunk.children][1] is diagnostics_zero
+    assert not any(child.children for child in shrunk.children)
+
+
+@params('DiagnosticsNum')
+@rtype('DiagnosticsLookup')
+def diagnostics_lookup(x):
+    return {}[x]
+
+
+def test_diagnose_buckets_exceptions_by_signature():
+    """
+    Ensure that value-laden exceptions share a bucket when signatures
+    are taken by type, and that the number of buckets can be capped.
+    """
+    random.seed(0)
+    by_repr = diagnose('DiagnosticsLookup', sample_size=30, shrink_evaluations=0)
+    assert len(by_repr.exceptions) > 1
+
+    random.seed(0)
+    by_type = diagnose(
+        'DiagnosticsLookup',
+        sample_size=30,
+        signature=signature_by_type,
+    )
+    assert 'KeyError' in by_type.exceptions
+    assert set(by_type.exceptions) <= {'KeyError', 'ZeroDivisionError'}
+
+    random.seed(0)
+    capped = diagnose('DiagnosticsLookup', sample_size=30, max_signatures=1)
+    assert len(capped.exceptions) == 1
+
+
+def test_iter_diagnose_yields_snapshots_and_converges():
+    """
+    Ensure that interim diagnoses are yielded, holding at most the 
+    maximum number of examples, and that diagnosis stops early once
+    the top edges are stable.
+    """
+    random.seed(0)
+    diagnoses = list(iter_diagnose(
+        'DiagnosticsNum',
+        sample_size=50,
+        max_examples=3,
+        snapshot_interval=5,
+        patience=10,
+    ))
+    assert len(diagnoses) > 1
+    assert all(isinstance(diagnosis, Diagnosis) for diagnosis in diagnoses)
+    assert len(diagnoses) < 50 // 5 + 1
+    for diagnosis in diagnoses:
+        for examples in diagnosis.exception_examples.values():
+            assert 0 < len(examples) <= 3
@@ -0,0 +1,173 @@
+"""Tests for monkeys/evaluation.py"""
+
+import sys
+import copy
+import random
+
+import pytest
+
+from monkeys.typing import Registry, params, rtype
+from monkeys.trees import Node, build_tree, make_input
+from monkeys.evaluation import (
+    SemanticCache, Sampling, ColumnSource, evaluate_cases, sample_cases, stream_cases,
+)
+
+
+CASES = [{'evaluation_x': x} for x in range(-5, 5)]
+CALLS = []
+EVALUATION_REGISTRY = Registry()
+
+with EVALUATION_REGISTRY:
+    evaluation_x = make_input('EvaluationInt', name='evaluation_x')
+
+    @params()
+    @rtype('EvaluationInt')
+    def evaluation_two():
+        return 2
+
+    @params('EvaluationInt', 'EvaluationInt')
+    @rtype('EvaluationInt')
+    def evaluation_add(first, second):
+        CALLS.append(evaluation_add)
+        return first + second
+
+    @params('EvaluationInt', 'EvaluationInt')
+    @rtype('EvaluationInt')
+    def evaluation_div(first, second):
+        return first // second
+
+
+def expected_outputs(tree):
+    return [tree(**case) for case in CASES]
+
+
+def test_semantic_cache_matches_evaluation():
+    """
+    Ensure that cached evaluation produces the same outputs, and
+    failures, as evaluating trees directly.
+    """
+    random.seed(0)
+    cache = SemanticCache(CASES)
+    with EVALUATION_REGISTRY:
+        for __ in range(50):
+            tree = build_tree('EvaluationInt')
+            try:
+                expected = expected_outputs(tree)
+            except ZeroDivisionError:
+                with pytest.raises(ZeroDivisionError):
+                    cache.evaluate(tree)
+            else:
+                assert cache.evaluate(tree) == expected
+
+
+def test_semantic_cache_reevaluates_only_changed_path():
+    """
+    Ensure that evaluating the offspring of a cached tree only evaluates
+    nodes above the replaced subtree, and that the cache is bounded.
+    """
+    x, two = Node.from_children(evaluation_x, []), Node.from_children(evaluation_two, [])
+    tree = Node.from_children(evaluation_add, [
+        Node.from_children(evaluation_add, [x, two]),
+        Node.from_children(evaluation_add, [two, two]),
+    ])
+    offspring = copy.deepcopy(tree)
+    offspring.children[0].children[1] = copy.deepcopy(x)
+
+    cache = SemanticCache(CASES)
+    cache.evaluate(tree)
+    del CALLS[:]
+    outputs = cache.evaluate(offspring)
+    assert len(CALLS) == 2 * len(CASES)
+    assert outputs == expected_outputs(offspring)
+
+    bounded_cache = SemanticCache(CASES, max_outputs=3 * len(CASES))
+    assert bounded_cache.evaluate(tree) == expected_outputs(tree)
+    assert len(bounded_cache) == 3
+    unbuffered_cache = SemanticCache(CASES, max_outputs=len(CASES) - 1)
+    with pytest.raises(ZeroDivisionError):
+        unbuffered_cache.evaluate(Node.from_children(evaluation_div, [two, x]))
+    assert unbuffered_cache.evaluate(tree) == expected_outputs(tree)
+    assert len(unbuffered_cache) == 1
+
+
+def test_evaluate_cases():
+    """
+    Ensure that scoring functions receive outputs over all cases, and
+    that failures are given the minimum score.
+    """
+    @evaluate_cases(CASES)
+    def score(outputs):
+        return sum(outputs)
+
+    x, two = Node.from_children(evaluation_x, []), Node.from_children(evaluation_two, [])
+    tree = Node.from_children(evaluation_add, [x, two])
+    assert score(tree) == sum(expected_outputs(tree))
+    assert score(Node.from_children(evaluation_div, [two, x])) == -sys.maxsize
+
+
+def test_sample_cases():
+    """
+    Ensure that interleaved samples cover every case in turn, that only
+    promising trees are scored on every case in progressive sampling,
+    and that full scores are over every case.
+    """
+    def score_case(output, case):
+        return output - case['evaluation_x']
+
+    interleaved = sample_cases(CASES, 3, sampling=Sampling.INTERLEAVED)(score_case)
+    samples = []
+    for __ in range(5):
+        samples.extend(case['evaluation_x'] for case in interleaved.sampler.sample)
+        interleaved.prepare([])
+    assert sorted(samples[:10]) == list(range(-5, 5))
+    assert samples[10:] == samples[:len(samples) - 10]
+
+    x, two = Node.from_children(evaluation_x, []), Node.from_children(evaluation_two, [])
+    tree = Node.from_children(evaluation_add, [x, two])
+    assert interleaved.full_score(tree) == 2
+    assert interleaved.full_score(Node.from_children(evaluation_div, [two, x])) == -sys.maxsize
+
+    progressive = sample_cases(
+        CASES, 2, sampling=Sampling.PROGRESSIVE, extend_quantile=0.5, rng=random.Random(0),
+    )(lambda output, case: output)
+    for __ in range(progressive.sampler.MIN_HISTORY):
+        assert progressive(two) == 2
+    assert progressive(Node.from_children(evaluation_div, [two, two])) == 1
+    assert progressive(Node.from_children(evaluation_add, [two, two])) == 4
+    assert progressive.sampler.extended == progressive.sampler.MIN_HISTORY + 1
+    assert progressive.sampler.cases_scored == (
+        (progressive.sampler.MIN_HISTORY + 2) * 2 + 
+        (progressive.sampler.MIN_HISTORY + 1) * len(CASES)
+    )
+
+
+@pytest.mark.parametrize('extension', ['.npy', '.bin'])
+def test_stream_cases(tmp_path, extension):
+    """
+    Ensure that trees are scored over memory-mapped files in chunks of
+    views of the file, with inputs bound to columns, and that failures
+    are given the minimum score.
+    """
+    import numpy
+
+    data = numpy.arange(20, dtype='float64').reshape(10, 2)
+    path = str(tmp_path / ('cases' + extension))
+    if extension == '.npy':
+        numpy.save(path, data)
+    else:
+        data.tofile(path)
+        with pytest.raises(ValueError):
+            ColumnSource(path, {evaluation_x: 1})
+    source = ColumnSource(path, {evaluation_x: 1}, chunk_size=4, num_columns=2)
+    chunks = list(source.chunks())
+    assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+    assert all(isinstance(chunk, numpy.memmap) for chunk in chunks)
+
+    @stream_cases(source)
+    def score(outputs, chunk):
+        return -numpy.abs(outputs - chunk[:, 0]).sum()
+
+    x, two = Node.from_children(evaluation_x, []), Node.from_children(evaluation_two, [])
+    assert score(Node.from_children(evaluation_add, [x, two])) == -30
+    assert score(two) == -sum(abs(2 - data[:, 0]))
+    assert score(Node.from_children(evaluation_div, [two, Node.from_children(evaluation_div, [two, x])])) == -sys.maxsize
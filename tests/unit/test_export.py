@@ -0,0 +1,114 @@
+"""Tests for monkeys/tools/export.py"""
+
+import math
+import random
+
+import numpy
+import pytest
+
+from monkeys.typing import Registry, params, rtype, constant, ephemeral, free, ignore
+from monkeys.trees import Node, build_tree, make_input
+from monkeys.exceptions import ExportError
+from monkeys.tools.export import export_tree, literal
+
+
+EXPORT_SCALE = 3.0
+EXPORT_REGISTRY = Registry()
+
+with EXPORT_REGISTRY:
+    export_x = make_input('ExportFloat', name='export_x')
+    make_input('ExportInt', name='export_n')
+    constant('ExportFloat', 1.5)
+    ephemeral('ExportFloat', lambda rng: rng.uniform(-2, 2))
+    free('ExportFloat', 'ExportInt')
+
+    def export_scale(value):
+        return value * EXPORT_SCALE
+
+    @params('ExportFloat', 'ExportFloat')
+    @rtype('ExportFloat')
+    def export_add(first, second):
+        return first + second
+
+    @params('ExportFloat', 'ExportFloat')
+    @rtype('ExportFloat')
+    @ignore(0.0, ZeroDivisionError)
+    def export_div(first, second):
+        return first / second
+
+    @params('ExportFloat')
+    @rtype('ExportFloat')
+    def export_scaled(value):
+        return export_scale(value) - math.pi
+
+
+def load(source):
+    namespace = {}
+    exec(compile(source, '<export>', 'exec'), namespace)
+    return namespace
+
+
+def test_exported_module_matches_tree():
+    """
+    Ensure that exported modules evaluate as trees do, taking inputs as
+    arguments, without depending on monkeys.
+    """
+    rng = random.Random(0)
+    with EXPORT_REGISTRY:
+        for __ in range(50):
+            tree = build_tree('ExportFloat', max_depth=6, rng=rng)
+            source = export_tree(tree, inputs=['export_x', 'export_n'])
+            assert 'monkeys' not in source
+            evaluate = load(source)['evaluate']
+            for x, n in [(0.0, 0), (1.5, -2), (-3.0, 4)]:
+                assert evaluate(x, n) == tree(export_x=x, export_n=n)
+
+        x = Node.from_children(export_x, [])
+        shared = Node.from_children(export_div, [x, x])
+        tree = Node.from_children(export_add, [shared, shared])
+        source = export_tree(tree)
+        assert source.count('= export_div(') == 1
+        assert load(source)['evaluate'](0.0) == 0.0
+
+    with Registry():
+        with pytest.raises(ExportError):
+            export_tree(Node.from_children(params()(rtype('ExportFloat')(lambda: 1.0)), []))
+
+
+def test_numpy_constants_are_written_as_builtins():
+    """
+    Ensure that constants holding NumPy scalars are exported as literals
+    of the equivalent builtin types, evaluable without NumPy.
+    """
+    with Registry():
+        constant('ExportNumpy', numpy.float64(1.5))
+        constant('ExportNumpy', numpy.int64(3))
+
+        @params('ExportNumpy', 'ExportNumpy')
+        @rtype('ExportNumpy')
+        def export_numpy_add(first, second):
+            return first + second
+
+        tree = build_tree('ExportNumpy', max_depth=3, rng=random.Random(0))
+        source = export_tree(tree)
+    assert 'numpy' not in source
+    assert load(source)['evaluate']() == tree()
+    assert literal(numpy.float64(1.5)) == '1.5'
+    assert literal(numpy.int64(3)) == '3'
+    assert literal(numpy.bool_(True)) == 'True'
+
+
+def test_exported_batch_matches_elementwise():
+    """
+    Ensure that batch evaluation matches evaluation of each element,
+    including for batches in which ignored exceptions are raised.
+    """
+    rng = random.Random(0)
+    xs = numpy.array([0.0, 1.5, -3.0, 2.0])
+    ns = numpy.array([0, -2, 4, 1])
+    with EXPORT_REGISTRY:
+        for __ in range(20):
+            tree = build_tree('ExportFloat', max_depth=6, rng=rng)
+            exported = load(export_tree(tree, inputs=['export_x', 'export_n'], vectorize=True))
+            expected = [exported['evaluate'](x, n) for x, n in zip(xs.tolist(), ns.tolist())]
+            assert exported['evaluate_batch'](xs, ns).tolist() == pytest.approx(expected)
@@ -0,0 +1,39 @@
+"""Tests for monkeys/rng.py"""
+
+import random
+
+import numpy
+
+from monkeys.rng import as_random, spawn
+
+
+def test_numpy_generators_are_adapted():
+    """
+    Ensure that NumPy Generators may be used in place of the random
+    module, reproducibly.
+    """
+    draws = []
+    for __ in range(2):
+        rng = as_random(numpy.random.default_rng(0))
+        population = list(range(10))
+        rng.shuffle(population)
+        draws.append((
+            rng.random(), rng.choice('abc'), rng.sample(population, 3), 
+            population, rng.getrandbits(70), rng.randint(1, 2),
+        ))
+    assert draws[0] == draws[1]
+    assert sorted(draws[0][3]) == list(range(10))
+    assert 0 <= draws[0][4] < 2 ** 70
+    assert as_random(None) is random
+
+
+def test_spawn_is_deterministic_and_independent():
+    """
+    Ensure that spawned streams depend only on the parent's state, and
+    differ from one another.
+    """
+    for make_rng in (random.Random, numpy.random.default_rng):
+        first = [as_random(rng).random() for rng in spawn(make_rng(1), 3)]
+        second = [as_random(rng).random() for rng in spawn(make_rng(1), 3)]
+        assert first == second
+        assert len(set(first)) == 3
@@ -5,6 +5,32 @@ import pytest
 import monkeys.search as search
 
 
+ASSERTIONS_EVALUATED = []
+
+
+def sum_to_target(type_name, constants, target):
+    """
+    Register, in the active registry, the given integer constants and
+    their sum, returning a scoring function for trees summing to the
+    target.
+    """
+    from monkeys.typing import params, rtype, constant
+
+    for value in constants:
+        constant(type_name, value)
+
+    @params(type_name, type_name)
+    @rtype(type_name)
+    def add(first, second):
+        return first + second
+
+    @params(type_name)
+    def score(tree):
+        return -abs(tree.evaluate() - target)
+
+    return score
+
+
 def test_max_score_set_by_assertions_as_score():
     """
     Ensure that a max score attribute is set on scoring functions
@@ -49,3 +75,384 @@ def test_max_score_not_set_by_assertions_as_score_on_while():
             
     with pytest.raises(AttributeError):
         score.__max_score
+
+
+def test_ant_colony_selection_shifts_toward_rewarded_edges():
+    """
+    Ensure that the colony made by ant_colony, as used by ant_optimize,
+    comes to choose the children of rewarded trees more often than others.
+    """
+    import random
+    import collections
+    from monkeys.typing import Registry, params, rtype
+    from monkeys.trees import Node
+
+    with Registry():
+        @params()
+        @rtype('AntOptimizeBit')
+        def low():
+            return 0
+
+        @params()
+        @rtype('AntOptimizeBit')
+        def high():
+            return 1
+
+        @params('AntOptimizeBit', 'AntOptimizeBit')
+        @rtype('AntOptimizeBits')
+        def bits(first, second):
+            return first + second
+
+        colony = search.ant_colony(rng=random.Random(0))
+        rewarded = Node.from_children(bits, [Node(high), Node(low)])
+        for __ in range(50):
+            with colony.iteration():
+                colony.deposit({rewarded: 1.0})
+        selections = collections.Counter(colony.select(bits) for __ in range(4000))
+
+    assert selections[high, low] > 0.5 * sum(selections.values())
+
+
+def test_ant_optimize_reaches_target_score():
+    """
+    Ensure that ant programming finds a tree reaching the target score.
+    """
+    import random
+    from monkeys.typing import Registry
+
+    with Registry():
+        score = sum_to_target('AntInt', [1, 2], 9)
+        best = search.ant_optimize(
+            score, population_size=50, iterations=10, show_scores=False,
+            target_score=0, rng=random.Random(0),
+        )
+    assert score(best) == 0
+
+
+def test_deduplicate_replaces_duplicates():
+    """
+    Ensure that deduplication replaces structurally identical trees 
+    until the requested proportion of trees is unique, keeping the 
+    first occurrence in place.
+    """
+    import copy
+    import random
+    from monkeys.typing import Registry
+    from monkeys.trees import build_tree, structural_key
+
+    with Registry():
+        score = sum_to_target('DedupInt', [1], 10)
+        random.seed(0)
+        tree = build_tree('DedupInt')
+        population = [tree] + [copy.deepcopy(tree) for __ in range(9)]
+        assert search.count_unique(population) == 1
+
+        half_unique = search.deduplicate(population, score, uniqueness=0.5)
+        deduplicated = search.deduplicate(population, score, uniqueness=1.0)
+
+    assert search.count_unique(half_unique) == 5
+    assert search.count_unique(deduplicated) == 10
+    assert deduplicated[0] is tree
+    assert structural_key(population[1]) == structural_key(tree)
+
+
+def test_next_generation_accepts_select_fn_without_extensions():
+    """
+    Ensure that selection functions taking only the original keyword
+    arguments can be used when no extension needs passing to them.
+    """
+    import random
+    from monkeys.typing import Registry
+    from monkeys.trees import build_tree
+
+    def select_fn(trees, scoring_fn, score_callback=None, optimizations=None):
+        while True:
+            yield max(random.sample(trees, 2), key=scoring_fn)
+
+    with Registry():
+        score = sum_to_target('SelectInt', [1], 10)
+        random.seed(0)
+        population = [build_tree('SelectInt') for __ in range(10)]
+        offspring = search.next_generation(population, score, select_fn=select_fn)
+    assert len(offspring) == 10
+
+
+def test_next_generation_accepts_variation_without_rng():
+    """
+    Ensure that build_tree and mutate functions not accepting a random
+    number generator can be used when none is given.
+    """
+    import random
+    from monkeys.typing import Registry
+    from monkeys.trees import build_tree, mutate
+
+    with Registry():
+        score = sum_to_target('VariationInt', [1, 2], 7)
+
+        def build_variation_tree(scoring_fn):
+            return build_tree('VariationInt', max_depth=4)
+
+        def mutate_variation_tree(tree):
+            return mutate(tree)
+
+        random.seed(0)
+        population = [build_variation_tree(score) for __ in range(30)]
+        offspring = search.next_generation(
+            population, score, build_tree=build_variation_tree, 
+            mutate=mutate_variation_tree, mutation_rate=0.2, uniqueness=1.0,
+        )
+    assert len(offspring) == 30
+
+
+def test_next_generation_respects_limits():
+    """
+    Ensure that no tree of a generation exceeds the given limits, 
+    including those built afresh to replace duplicates.
+    """
+    import random
+    from monkeys.typing import Registry
+    from monkeys.trees import build_tree, get_tree_dimensions
+
+    with Registry():
+        score = sum_to_target('LimitInt', [1, 2], 30)
+        rng = random.Random(0)
+        population = [build_tree('LimitInt', max_depth=5, max_nodes=20, rng=rng) for __ in range(30)]
+        for __ in range(15):
+            population = search.next_generation(
+                population, score, max_depth=5, max_nodes=20, uniqueness=1.0, rng=rng,
+            )
+            for tree in population:
+                dimensions = get_tree_dimensions(tree)
+                assert dimensions.sizes[tree] <= 20
+                assert dimensions.depths[tree] <= 5
+
+
+def test_assertions_as_score_abandons_below_bound():
+    """
+    Ensure that scoring functions created with assertions_as_score stop
+    once the bound can no longer be reached, and may report which 
+    assertions passed.
+    """
+    def score(x):
+        assert x > 0
+        assert ASSERTIONS_EVALUATED.append(x) or x > 1
+        assert x > 2
+
+    scoring_fn = search.assertions_as_score(score)
+    with search.abandonment_bound(scoring_fn, 3):
+        assert scoring_fn(0) == 0
+        assert ASSERTIONS_EVALUATED == []
+        assert scoring_fn(3) == 3
+    assert scoring_fn(0) == 0
+    assert ASSERTIONS_EVALUATED == [3, 0]
+
+    pass_vector_fn = search.assertions_as_score(pass_vector=True)(score)
+    assert pass_vector_fn(1.5) == (True, True, False)
+    with search.abandonment_bound(pass_vector_fn, 2):
+        assert pass_vector_fn(0) == (False, False, False)
+
+
+def test_tune_constants():
+    """
+    Ensure that tuning adjusts ephemeral constants to improve the score
+    of a tree.
+    """
+    import random
+    from monkeys.typing import Registry, params, rtype, ephemeral
+    from monkeys.trees import Node
+
+    random.seed(0)
+    with Registry():
+        coefficient = ephemeral('TunedReal', lambda rng: rng.uniform(-1, 1))
+
+        @params('TunedReal', 'TunedReal')
+        @rtype('TunedReal')
+        def tuned_mul(first, second):
+            return first * second
+
+        @params('TunedReal')
+        def score(tree):
+            return -abs(tree.evaluate() - 6)
+
+        tree = Node.from_children(tuned_mul, [Node(coefficient), Node(coefficient)])
+        initial_score = score(tree)
+        search.tune_constants(tree, score, iterations=50)
+        assert score(tree) > initial_score
+        assert score(tree) > -0.01
+
+
+def test_optimize_is_reproducible_given_rng():
+    """
+    Ensure that runs given equally-seeded generators are identical, 
+    regardless of use of the random module in between.
+    """
+    import random
+    from monkeys.typing import Registry
+    from monkeys.trees import structural_key
+
+    with Registry():
+        score = sum_to_target('SeededInt', [1, 2], 11)
+        results = []
+        for seed in (0, 0, 1):
+            random.seed(seed)
+            results.append(structural_key(search.optimize(
+                score, population_size=30, iterations=3, show_scores=False,
+                rng=random.Random(0),
+            )))
+    assert results[0] == results[1] == results[2]
+
+
+@pytest.mark.parametrize('processes', [None, 2])
+def test_steady_state(processes):
+    """
+    Ensure that steady-state search improves on its initial population,
+    scoring offspring in-process or across worker processes.
+    """
+    import random
+    from monkeys.typing import Registry
+
+    with Registry():
+        score = sum_to_target('SteadyInt', [1], 13)
+        best = search.steady_state(
+            score, population_size=20, evaluations=2000, show_scores=False,
+            target_score=0, max_depth=6, processes=processes, rng=random.Random(0),
+        )
+    assert score(best) == 0
+
+
+def test_steady_state_across_processes_with_function_parameters():
+    """
+    Ensure that trees containing lifted functions, registered only as 
+    trees are built, can be scored across worker processes.
+    """
+    import random
+    from monkeys.typing import Registry, params, rtype, func
+
+    with Registry():
+        score = sum_to_target('LiftInt', [1], 12)
+
+        @params('LiftInt')
+        @rtype('LiftInt')
+        def triple(value):
+            return 3 * value
+
+        @params(func('LiftInt', 'LiftInt'), 'LiftInt')
+        @rtype('LiftInt')
+        def apply_twice(f, value):
+            return f(f(value))
+
+        best = search.steady_state(
+            score, population_size=20, evaluations=500, show_scores=False,
+            target_score=0, max_depth=5, processes=2, rng=random.Random(0),
+        )
+    assert score(best) == 0
+
+
+def test_steady_state_on_plateau():
+    """
+    Ensure that steady-state search keeps replacing trees when every
+    score is tied, rather than only ever protecting the first tree.
+    """
+    import random
+    from monkeys.typing import Registry, params, rtype, constant
+
+    with Registry():
+        constant('PlateauInt', 1)
+
+        @params('PlateauInt', 'PlateauInt')
+        @rtype('PlateauInt')
+        def plateau_add(first, second):
+            return first + second
+
+        @params('PlateauInt')
+        def score(tree):
+            return int(tree.evaluate() == 13)
+
+        best = search.steady_state(
+            score, population_size=10, evaluations=3000, show_scores=False,
+            target_score=1, max_depth=6, rng=random.Random(0),
+        )
+    assert score(best) == 1
+
+
+def test_adaptive_operator_rates():
+    """
+    Ensure that operator rates shift toward operators whose offspring
+    improve on their parents, and that failed operators are retried a
+    limited number of times.
+    """
+    import random
+    from monkeys.typing import Registry, params, rtype
+    from monkeys.trees import Node
+    from monkeys.exceptions import UnsatisfiableType
+
+    with Registry():
+        @params()
+        @rtype('AdaptiveInt')
+        def one():
+            return 1
+
+        @params('AdaptiveInt', 'AdaptiveInt')
+        @rtype('AdaptiveInt')
+        def adaptive_add(first, second):
+            return first + second
+
+        def selector():
+            while True:
+                yield Node(one)
+
+        def crossover(first, second):
+            raise UnsatisfiableType("Trees are not compatible.")
+
+        def mutate(tree):
+            return Node.from_children(adaptive_add, [tree, Node(one)])
+
+        rates = search.AdaptiveOperatorRates(crossover_rate=0.5, mutation_rate=0.5, max_retries=2)
+        rates.observe({Node(one): 1})
+        rng = random.Random(0)
+        offspring = [
+            rates.breed(selector(), crossover, mutate, lambda: Node(one), rng)
+            for __ in range(50)
+        ]
+        rates.observe({tree: tree.evaluate() for tree in offspring})
+
+    crossovers = sum(tree.f is one for tree in offspring)
+    assert rates.retries['crossover'] == 3 * crossovers
+    assert rates.rates['mutation'] > 0.9
+    assert rates.rates['crossover'] == pytest.approx(0.05)
+    assert rates.history == [{'crossover': 0.5, 'mutation': 0.5}, rates.rates]
+
+
+def test_non_dominated_sorting():
+    """
+    Ensure that objectives are sorted into successive non-dominated
+    fronts, with extremes of each front given infinite crowding distance.
+    """
+    objectives = [(3, 1), (1, 3), (2, 2), (1, 1), (0, 0), (2, 2.5)]
+    fronts = search.non_dominated_fronts(objectives)
+    assert [sorted(front) for front in fronts] == [[0, 1, 5], [2], [3], [4]]
+    distances = search.crowding_distances([objectives[i] for i in (0, 1, 5)])
+    assert distances[0] == distances[1] == float('inf')
+    assert distances[2] == pytest.approx(2.0)
+    assert search.objective_matrix([(1, 2), -5]).tolist() == [[1, 2], [-5, -5]]
+
+
+def test_optimize_returns_pareto_front():
+    """
+    Ensure that multi-objective optimization returns mutually 
+    non-dominated trees, best first.
+    """
+    import random
+    from monkeys.typing import Registry
+
+    with Registry():
+        score = search.pareto_objectives(sum_to_target('ParetoInt', [1, 3], 10))
+        front = search.optimize(
+            score, population_size=30, iterations=5, show_scores=False,
+            max_depth=6, multi_objective=True, rng=random.Random(0),
+        )
+
+    scores = [score(tree) for tree in front]
+    assert scores == sorted(scores, reverse=True)
+    assert len(search.non_dominated_fronts(scores)) == 1
+    assert scores[0][0] == 0
@@ -0,0 +1,60 @@
+"""Tests for monkeys/surrogate.py"""
+
+import random
+
+from monkeys.typing import Registry, params, rtype
+from monkeys.trees import build_tree
+from monkeys.search import tournament_select
+from monkeys.surrogate import SurrogateModel
+
+
+def test_surrogate_screens_out_trees_predicted_to_score_poorly():
+    """
+    Ensure that, once trained, a surrogate model ranks trees as their
+    scores do, and that only those it keeps, always including the first,
+    are scored in selection.
+    """
+    with Registry():
+        @params()
+        @rtype('SurrogateInt')
+        def one():
+            return 1
+
+        @params()
+        @rtype('SurrogateInt')
+        def two():
+            return 2
+
+        @params('SurrogateInt', 'SurrogateInt')
+        @rtype('SurrogateInt')
+        def surrogate_add(first, second):
+            return first + second
+
+        @params('SurrogateInt')
+        def score(tree):
+            return tree.evaluate()
+
+        rng = random.Random(0)
+        trees = [build_tree('SurrogateInt', max_depth=5, rng=rng) for __ in range(200)]
+        surrogate = SurrogateModel(fraction=0.3, exploration=0, min_samples=100)
+        assert surrogate.screen(trees[:100], rng) == trees[:100]
+        surrogate.update({tree: score(tree) for tree in trees[:100]})
+
+        scored = []
+
+        @params('SurrogateInt')
+        def recorded_score(tree):
+            scored.append(tree)
+            return score(tree)
+
+        selector = tournament_select(
+            trees[100:], recorded_score, selection_size=5, optimizations=(),
+            rng=rng, surrogate=surrogate,
+        )
+        next(selector)
+
+    assert trees[100] in scored
+    assert 30 <= len(scored) <= 31
+    assert surrogate.skipped == 100 - len(scored)
+    assert surrogate.accuracy > 0.8
+    assert surrogate.history == [(surrogate.accuracy, surrogate.skipped)]
@@ -0,0 +1,132 @@
+"""Tests for monkeys/trees.py"""
+
+import gc
+import copy
+import random
+import weakref
+
+import pytest
+
+from monkeys.typing import Registry, params, rtype, ephemeral
+from monkeys.trees import (
+    Node, build_tree, crossover, mutate, get_tree_dimensions, 
+    minimum_dimensions, structural_key,
+)
+from monkeys.parallel import FunctionTable
+from monkeys.exceptions import UnsatisfiableType
+
+
+LIMITED_REGISTRY = Registry()
+
+with LIMITED_REGISTRY:
+    @params()
+    @rtype('LimitedLeaf')
+    def limited_leaf():
+        return 1
+
+    @params('LimitedLeaf', 'LimitedLeaf')
+    @rtype('LimitedPair')
+    def limited_pair(first, second):
+        return first + second
+
+    @params('LimitedPair', 'LimitedInt')
+    @rtype('LimitedInt')
+    def limited_add(first, second):
+        return first + second
+
+    @params('LimitedPair')
+    @rtype('LimitedInt')
+    def limited_promote(pair):
+        return pair
+
+
+def dimensions(tree):
+    tree_dimensions = get_tree_dimensions(tree)
+    return tree_dimensions.sizes[tree], tree_dimensions.depths[tree]
+
+
+def test_minimum_dimensions():
+    """
+    Ensure that minimum tree sizes and depths are computed for each
+    function, including recursive ones.
+    """
+    with LIMITED_REGISTRY:
+        minimum = minimum_dimensions()
+    assert minimum.sizes[limited_leaf] == 1
+    assert minimum.depths[limited_pair] == 2
+    assert minimum.sizes[limited_promote] == 4
+    assert minimum.sizes[limited_add] == 8
+    assert minimum.depths[limited_add] == 4
+
+    scoped_registry = Registry()
+    with scoped_registry:
+        minimum_dimensions()
+    registry_reference = weakref.ref(scoped_registry)
+    del scoped_registry
+    gc.collect()
+    assert registry_reference() is None
+
+
+def test_build_tree_respects_limits():
+    """
+    Ensure that trees built with limits respect them, and that
+    unsatisfiable limits are reported.
+    """
+    random.seed(0)
+    with LIMITED_REGISTRY:
+        for __ in range(50):
+            size, depth = dimensions(build_tree('LimitedInt', max_depth=6, max_nodes=12))
+            assert size <= 12
+            assert depth <= 6
+
+        with pytest.raises(UnsatisfiableType):
+            build_tree('LimitedInt', max_nodes=3)
+
+
+def test_crossover_and_mutate_respect_limits():
+    """
+    Ensure that offspring of trees within limits are kept within them.
+    """
+    random.seed(0)
+    with LIMITED_REGISTRY:
+        trees = [
+            build_tree('LimitedInt', max_depth=8, max_nodes=20)
+            for __ in range(20)
+        ]
+        for __ in range(200):
+            first, second = random.sample(trees, 2)
+            child = crossover(first, second, max_depth=8, max_nodes=20)
+            child = mutate(child, max_depth=8, max_nodes=20)
+            size, depth = dimensions(child)
+            assert size <= 20
+            assert depth <= 8
+
+
+def test_ephemeral_constants_are_sampled_per_node():
+    """
+    Ensure that ephemeral constants are sampled as nodes are built, and
+    that their values are kept when copying, comparing and encoding
+    trees.
+    """
+    random.seed(0)
+    with Registry():
+        sampled = ephemeral('EphemeralReal', lambda rng: rng.uniform(0, 1))
+
+        @params('EphemeralReal', 'EphemeralReal')
+        @rtype('EphemeralReal')
+        def ephemeral_add(first, second):
+            return first + second
+
+        tree = Node.from_children(ephemeral_add, [Node(sampled), Node(sampled)])
+        first, second = (child.value for child in tree.children)
+        assert first != second
+        assert tree.evaluate() == first + second
+        assert str(tree) == 'ephemeral_add({!r}, {!r})'.format(first, second)
+
+        copied = copy.deepcopy(tree)
+        assert structural_key(copied) == structural_key(tree)
+        copied.children[0].value += 1
+        assert structural_key(copied) != structural_key(tree)
+
+        table = FunctionTable.from_registry()
+        assert structural_key(table.decode(table.encode(tree))) == structural_key(tree)
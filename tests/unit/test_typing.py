@@ -0,0 +1,94 @@
+"""Tests for monkeys/typing.py"""
+
+from monkeys.typing import (
+    Registry, params, rtype, func, lookup_rtype, deregister, 
+    current_registry, registered_types, DEFAULT_REGISTRY,
+)
+
+
+def register_terminal(return_type, name):
+    @params()
+    @rtype(return_type)
+    def terminal():
+        return name
+    terminal.__name__ = name
+    return terminal
+
+
+def test_registry_scoping():
+    """
+    Ensure that functions registered within a registry's scope are
+    neither visible outside of it nor registered with the default.
+    """
+    registry = Registry()
+    with registry:
+        assert current_registry() is registry
+        scoped = register_terminal('ScopedType', 'scoped')
+        assert lookup_rtype('ScopedType') == [scoped]
+        assert len(registered_types()) == 1
+
+    assert current_registry() is DEFAULT_REGISTRY
+    assert scoped not in lookup_rtype('ScopedType')
+    with registry:
+        assert lookup_rtype('ScopedType') == [scoped]
+
+
+def test_registry_snapshot_is_copy_on_write():
+    """
+    Ensure that registries and their snapshots may be modified without
+    affecting one another.
+    """
+    registry = Registry()
+    with registry:
+        first = register_terminal('SnapshotType', 'first')
+
+    snapshot = registry.snapshot()
+    with snapshot:
+        second = register_terminal('SnapshotType', 'second')
+        assert lookup_rtype('SnapshotType') == [first, second]
+    with registry:
+        assert lookup_rtype('SnapshotType') == [first]
+        deregister(first)
+        assert lookup_rtype('SnapshotType') == []
+    with snapshot:
+        assert lookup_rtype('SnapshotType') == [first, second]
+
+
+def test_deregister_preserves_order():
+    """
+    Ensure that deregistering a function leaves the remaining functions 
+    in their order of registration.
+    """
+    with Registry():
+        functions = [
+            register_terminal('OrderedType', 'terminal_{}'.format(i))
+            for i in range(5)
+        ]
+        deregister(functions[2])
+        assert lookup_rtype('OrderedType') == functions[:2] + functions[3:]
+
+
+def test_first_class_functions_are_registered_on_lookup():
+    """
+    Ensure that lifted functions are only registered once their function 
+    type is looked up, including functions registered afterwards.
+    """
+    with Registry():
+        @params('LiftedType')
+        @rtype('LiftedType')
+        def increment(x):
+            return x + 1
+
+        function_type = func('LiftedType', 'LiftedType')
+        assert not hasattr(increment, 'first_class_function')
+        lifted, = lookup_rtype(function_type)
+        assert lifted() is increment
+
+        @params('LiftedType')
+        @rtype('LiftedType')
+        def decrement(x):
+            return x - 1
+
+        assert [f() for f in lookup_rtype(function_type)] == [increment, decrement]
+        deregister(increment)
+        assert [f() for f in lookup_rtype(function_type)] == [decrement]
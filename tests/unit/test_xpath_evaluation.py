@@ -0,0 +1,50 @@
+"""Tests for monkeys/common/xpath_evaluation.py"""
+
+import sys
+
+import pytest
+
+from monkeys.trees import Node
+from monkeys.typing import lookup_rtype
+from monkeys.common.xpath import NodeName, global_node
+from monkeys.common.xpath_evaluation import XPathEvaluator
+
+
+POSITIVE = ['try:\n    f()\nexcept:\n    pass\n']
+NEGATIVE = ['try:\n    f()\nexcept Exception:\n    pass\n', 'f()\n']
+
+
+@pytest.mark.parametrize('processes', [None, 2])
+def test_xpath_evaluator_scores_batches(tmpdir, processes):
+    """
+    Ensure that batches of expressions are scored by the number of
+    correctly classified documents, and that parsed documents are 
+    reused from the cache directory.
+    """
+    evaluator = XPathEvaluator(POSITIVE, NEGATIVE, cache_directory=str(tmpdir), processes=processes)
+    try:
+        expressions = ['.//ExceptHandler[not(type)]', './/Call', './/[', './/Call']
+        assert evaluator.scores(expressions) == [3, 1, -sys.maxsize, 1]
+    finally:
+        evaluator.close()
+
+    assert len(tmpdir.listdir()) == 3
+    cached = XPathEvaluator(POSITIVE, NEGATIVE, cache_directory=str(tmpdir))
+    assert cached.score('.//ExceptHandler/type') == 1
+
+
+def test_xpath_scoring_function():
+    """
+    Ensure that scoring functions score trees from prepared batches, 
+    and are given the maximum score.
+    """
+    NodeName('ExceptHandler')
+    node_name, = [f for f in lookup_rtype(NodeName) if f() == 'ExceptHandler']
+    tree = Node.from_children(global_node, [Node.from_children(node_name, [])])
+
+    evaluator = XPathEvaluator(POSITIVE, NEGATIVE)
+    score = evaluator.scoring_function()
+    score.prepare([tree])
+    assert evaluator._scores == {'.//ExceptHandler': 2}
+    assert score(tree) == 2
+    assert getattr(score, '__max_score') == 3